@@ -0,0 +1,190 @@
+"""
+asyncio 入口：用 python-socketio 的 AsyncServer 在 ASGI 服务器上运行聊天服务
+
+与 app.py（Flask-SocketIO + eventlet）共用 chat_core 中的配置、服务、HTTP 路由和
+事件处理函数，不加载 eventlet 的 monkey patch。事件处理在事件循环中直接执行，
+发送按调用顺序排队执行（见 services.transport.AsyncServerTransport），
+异步命令和后台任务运行在系统线程中，页面等 HTTP 请求由 Flask 在线程池中处理。
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5004
+    python asgi_app.py              # 需要安装 uvicorn，端口取 CHAT_PORT
+
+与 eventlet 入口相比暂不支持：按客户端的有界发送队列（CHAT_OUTBOX_*）和广播只编码
+一次，这两者依赖同步的客户端管理器；CHAT_MESSAGE_QUEUE 只支持 redis://。
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import chat_core
+from chat_core import (app as flask_app, command_manager, PORT, MESSAGE_QUEUE, SERIALIZER, COMMAND_POOL_SIZE,
+                       COMMAND_MAX_PER_USER)
+from services.command_executor import ThreadCommandExecutor
+from services.transport import AsyncServerTransport
+from services.wire import UnicodeJSON
+
+logger = logging.getLogger('chat.asgi')
+
+# Flask 处理 HTTP 请求的线程数
+WSGI_THREADS = int(os.environ.get('CHAT_WSGI_THREADS', 8))
+
+
+class WSGIBridge:
+    """
+    在线程池中运行 WSGI 应用的 ASGI 适配
+
+    只用于 Socket.IO 以外的页面、静态资源、/config 和 /metrics 等请求，
+    读完请求体后交给线程池执行，响应体整体返回（这些响应都不大）。
+
+    Args:
+        wsgi_app: WSGI 应用
+        threads: 线程池大小
+    """
+
+    def __init__(self, wsgi_app, threads=8):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            if scope['type'] == 'websocket':
+                await send({'type': 'websocket.close', 'code': 1000})
+            return
+        body = []
+        while True:
+            message = await receive()
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        environ = self._environ(scope, b''.join(body))
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(self.executor, self._run, environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            # WSGI 要求路径为按 latin-1 解码的原始字节
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run(self, environ):
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]),
+                           [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response[0], response[1], content
+
+
+# 中文按 UTF-8 直接输出，不转义为 \uXXXX
+sio_options = dict(async_mode='asgi', cors_allowed_origins='*', serializer=SERIALIZER, json=UnicodeJSON)
+if MESSAGE_QUEUE and MESSAGE_QUEUE.startswith('redis'):
+    sio = socketio.AsyncServer(client_manager=socketio.AsyncRedisManager(MESSAGE_QUEUE), **sio_options)
+else:
+    if MESSAGE_QUEUE:
+        logger.warning("asyncio 入口不支持消息队列 %s，房间广播只发给本进程的连接", MESSAGE_QUEUE)
+    sio = socketio.AsyncServer(**sio_options)
+
+transport = AsyncServerTransport(sio)
+command_executor = ThreadCommandExecutor(command_manager, COMMAND_POOL_SIZE, COMMAND_MAX_PER_USER,
+                                         call_soon=transport.call_soon)
+chat_core.bind(transport, command_executor)
+
+chat_core.metrics.gauge('asgi_emit_queue', 'asyncio 入口尚未执行的发送数', transport.pending)
+
+# WebSocket事件处理：处理函数是同步的，AsyncServer 直接在事件循环中调用
+@sio.on('connect')
+def handle_connect(sid, environ, auth=None):
+    client = (environ.get('asgi.scope') or {}).get('client')
+    return chat_core.handle_connect(sid, client[0] if client else None, auth)
+
+@sio.on('disconnect')
+def handle_disconnect(sid):
+    try:
+        return chat_core.handle_disconnect(sid)
+    except Exception as e:
+        chat_core.record_event_error('disconnect', e)
+
+def register(event, handler):
+    def on_event(sid, *args):
+        try:
+            return handler(sid, *args)
+        except Exception as e:
+            chat_core.record_event_error(event, e)
+    sio.on(event, on_event)
+
+for event, handler in chat_core.HANDLERS.items():
+    register(event, handler)
+
+
+def on_startup():
+    transport.start()
+
+
+async def on_shutdown():
+    await transport.stop()
+    command_executor.shutdown()
+    chat_core.stop_services()
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=WSGIBridge(flask_app, WSGI_THREADS),
+                       on_startup=on_startup, on_shutdown=on_shutdown)
+
+
+def serve(host='0.0.0.0', port=PORT, log_level='info'):
+    """用 uvicorn 运行 ASGI 应用"""
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit('asyncio 入口需要 ASGI 服务器，请先安装 uvicorn: pip install uvicorn')
+    uvicorn.run(app, host=host, port=port, log_level=log_level, lifespan='on')
+
+
+if __name__ == '__main__':
+    chat_core.start_services(PORT)
+    serve(port=PORT, log_level='debug' if chat_core.DEBUG else 'info')
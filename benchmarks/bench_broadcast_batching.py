@@ -0,0 +1,80 @@
+"""
+房间消息合并广播吞吐基准
+
+在同一房间中放入 N 个测试客户端，连续广播 M 条消息，对比逐条发送 new_message
+与 BroadcastCoalescer 合并为 message_batch 两种方式的服务端耗时和发出的帧数。
+
+用法: python benchmarks/bench_broadcast_batching.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+
+from services.broadcast import BroadcastCoalescer
+from services.transport import SocketIOTransport
+
+CLIENTS = [100, 1000]
+MESSAGES = 200
+BATCH_MAX = 20
+
+
+def build_room(client_count):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading')
+
+    @socketio.on('join')
+    def handle_join():
+        join_room('chat_room')
+
+    clients = []
+    for _ in range(client_count):
+        client = socketio.test_client(app)
+        client.emit('join')
+        clients.append(client)
+    return socketio, clients
+
+
+def run(client_count, batched):
+    socketio, clients = build_room(client_count)
+    # 合并模式下把窗口设得足够长，批次只由单批上限和最后的 flush() 决定，结果可复现
+    coalescer = BroadcastCoalescer(SocketIOTransport(socketio), 3600 if batched else 0, BATCH_MAX)
+
+    start = time.perf_counter()
+    for index in range(MESSAGES):
+        coalescer.emit('chat_room', {
+            'nickname': f'user{index % 50}',
+            'message': f'第 {index} 条测试消息',
+            'timestamp': '12:00:00',
+            'is_command': False
+        })
+    coalescer.flush()
+    elapsed = time.perf_counter() - start
+
+    frames = 0
+    delivered = 0
+    for client in clients:
+        for packet in client.get_received():
+            frames += 1
+            if packet['name'] == 'message_batch':
+                delivered += len(packet['args'][0]['messages'])
+            else:
+                delivered += 1
+        client.disconnect()
+    assert delivered == MESSAGES * client_count
+    return elapsed, frames, delivered
+
+
+def main():
+    print(f"{'客户端':>6} {'模式':>8} {'耗时(ms)':>10} {'帧数':>8} {'送达消息/秒':>14}")
+    for client_count in CLIENTS:
+        for label, batched in (('逐条', False), ('合并', True)):
+            elapsed, frames, delivered = run(client_count, batched)
+            print(f"{client_count:>6} {label:>8} {elapsed * 1000:>10.1f} {frames:>8} {delivered / elapsed:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
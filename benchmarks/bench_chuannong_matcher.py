@@ -0,0 +1,70 @@
+"""
+川小农知识库匹配微基准
+
+对比原先"逐条 re.search"的循环与编译后的单一匹配器（含/不含问答缓存），
+知识库规模分别为 10、100、1000、10000 条规则。只比较正则规则，不经过 FAQ 检索。
+规则数少于 MATCHER_MIN_RULES 时编译匹配器直接逐条校验，与原循环相当。
+
+用法: python benchmarks/bench_chuannong_matcher.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commands.chuannong import ChuannongCommandHandler, DEFAULT_REPLY
+
+SIZES = [10, 100, 1000, 10000]
+ROUNDS = 200
+
+
+def build_knowledge_base(size):
+    """生成 size 条 .*X.*Y.* 形式的合成规则"""
+    return {rf'.*课程{i}号.*在哪.*': f'课程{i}号在第{i % 7}教学楼' for i in range(size)}
+
+
+def legacy_match(knowledge_base, question):
+    """原先的实现：遍历知识库逐条 re.search"""
+    for pattern, answer in knowledge_base.items():
+        if re.search(pattern, question, re.IGNORECASE):
+            return answer
+    return DEFAULT_REPLY
+
+
+def bench(func, questions, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            func(question)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(questions)) * 1e6
+
+
+def main():
+    print(f"{'规则数':>8} {'原循环(us)':>12} {'编译匹配(us)':>14} {'缓存命中(us)':>14} {'加速比':>8}")
+    for size in SIZES:
+        knowledge_base = build_knowledge_base(size)
+        handler = ChuannongCommandHandler()
+        handler.knowledge_base = knowledge_base
+        handler._faq = None
+        handler._compile_knowledge_base()
+
+        # 命中靠前、命中靠后、未命中三类问题
+        questions = [
+            '请问课程0号在哪里？',
+            f'请问课程{size - 1}号在哪里？',
+            '今天食堂有什么好吃的' * 10,
+        ]
+        for question in questions:
+            assert handler._lookup_answer(question) == legacy_match(knowledge_base, question)
+
+        rounds = max(1, ROUNDS * 10 // size)
+        legacy = bench(lambda q: legacy_match(knowledge_base, q), questions, rounds)
+        compiled = bench(handler._lookup_answer, questions, rounds)
+        cached = bench(handler._match_answer, questions, ROUNDS)
+        print(f"{size:>8} {legacy:>12.1f} {compiled:>14.1f} {cached:>14.2f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
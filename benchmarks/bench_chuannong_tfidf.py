@@ -0,0 +1,88 @@
+"""
+川小农 FAQ 检索基准
+
+生成 N 条合成的校园 FAQ（每条 3 种问法），测量 TF-IDF 索引的构建、保存和
+读取耗时，以及换一种说法提问、原问法提问、无关问题三类查询的延迟和命中率。
+打分在装有 NumPy 时向量化执行，否则使用纯 Python 倒排表累加。
+
+用法: python benchmarks/bench_chuannong_tfidf.py [问答条数，默认 10000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import tfidf
+from utils.tfidf import TfidfIndex
+
+PLACES = ['图书馆', '食堂', '教学楼', '实验室', '体育馆', '宿舍', '校医院', '快递点', '打印店', '辅导员办公室']
+TOPICS = ['开放时间', '怎么预约', '在哪里', '电话是多少', '需要带什么', '可以带外人吗', '周末开门吗', '怎么报修']
+TEMPLATES = ['{subject}{topic}', '请问{subject}{topic}', '想知道{subject}{topic}']
+PARAPHRASES = ['你好，{subject}{topic}呀', '{subject}那边{topic}', '有人知道{subject}{topic}吗']
+ROUNDS = 300
+
+
+def build_corpus(count, rng):
+    """每条问答有唯一的主题（地点加编号），以及若干套话组成的问法"""
+    entries = []
+    for i in range(count):
+        subject = f'{rng.choice(PLACES)}{i}号'
+        topic = rng.choice(TOPICS)
+        entries.append((subject, topic, [template.format(subject=subject, topic=topic) for template in TEMPLATES]))
+    return entries
+
+
+def timed(func, queries):
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(query))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return results, timings
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(42)
+    entries = build_corpus(count, rng)
+    questions = [question for _, _, variants in entries for question in variants]
+    doc_entry = [i for i, (_, _, variants) in enumerate(entries) for _ in variants]
+    print(f"打分后端: {'NumPy' if tfidf.np is not None else '纯 Python'}，{count} 条问答，{len(questions)} 种问法")
+
+    start = time.perf_counter()
+    index = TfidfIndex.build(questions)
+    print(f"构建索引: {time.perf_counter() - start:.2f} s，词项 {len(index.vocabulary):,}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'faq.tfidf')
+        start = time.perf_counter()
+        index.save(path, 'bench')
+        print(f"保存索引: {time.perf_counter() - start:.2f} s，{os.path.getsize(path) / 1048576:.1f} MB")
+        start = time.perf_counter()
+        index = TfidfIndex.load(path, 'bench')
+        print(f"读取索引: {time.perf_counter() - start:.2f} s")
+
+    picks = [rng.randrange(count) for _ in range(ROUNDS)]
+    cases = {
+        '换种说法': [(rng.choice(PARAPHRASES).format(subject=entries[i][0], topic=entries[i][1]), i) for i in picks],
+        '原问法': [(rng.choice(entries[i][2]), i) for i in picks],
+        '无关问题': [(f'明天会不会下雨{i}', None) for i in range(ROUNDS)],
+    }
+    print()
+    print(f"{'查询':<10}{'命中率':>8}{'平均得分':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, queries in cases.items():
+        results, timings = timed(index.best, [query for query, _ in queries])
+        hits = sum(1 for (doc, _), (_, expected) in zip(results, queries)
+                   if expected is not None and doc is not None and doc_entry[doc] == expected)
+        mean_score = sum(score for _, score in results) / len(results)
+        hit_rate = f'{hits / len(queries):.0%}' if queries[0][1] is not None else '-'
+        print(f"{label:<10}{hit_rate:>8}{mean_score:>10.3f}"
+              f"{timings[len(timings) // 2]:>10.3f}{timings[int(len(timings) * 0.99)]:>10.3f}{timings[-1]:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
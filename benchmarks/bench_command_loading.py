@@ -0,0 +1,99 @@
+"""
+命令加载启动耗时基准
+
+在临时目录中生成 100 个合成命令模块（每个模块导入时做少量初始化工作），
+对比原先"启动时导入全部模块"与按语法树建立索引、首次使用时才导入两种方式
+的启动耗时，并验证修改文件后的热加载。
+
+用法: python benchmarks/bench_command_loading.py
+"""
+import importlib.util
+import inspect
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commands.base import CommandHandler
+from commands.command_manager import CommandManager, NON_COMMAND_FILES
+
+MODULES = 100
+
+MODULE_TEMPLATE = '''from commands.base import CommandHandler
+
+# 模拟插件导入时的初始化工作
+TABLE = {{i: str(i) * 4 for i in range(20000)}}
+
+
+class Synthetic{index}CommandHandler(CommandHandler):
+    """合成命令 {index}"""
+
+    def get_command_name(self):
+        return '@cmd{index}'
+
+    def execute(self, data):
+        return {{'message': '{reply}', 'command_name': self.command_name}}
+'''
+
+
+def write_module(commands_dir, index, reply='v1'):
+    path = os.path.join(commands_dir, f'synthetic_{index}.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(MODULE_TEMPLATE.format(index=index, reply=reply))
+    return path
+
+
+def legacy_load(commands_dir):
+    """原先的实现：启动时导入全部模块并实例化处理器"""
+    handlers = {}
+    for filename in os.listdir(commands_dir):
+        if filename.endswith('.py') and filename not in NON_COMMAND_FILES:
+            module_name = filename[:-3]
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(commands_dir, filename))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            for name, obj in inspect.getmembers(module, inspect.isclass):
+                if issubclass(obj, CommandHandler) and obj is not CommandHandler and obj.__module__ == module_name:
+                    handler = obj()
+                    handlers[handler.command_name] = handler
+    return handlers
+
+
+def main():
+    with tempfile.TemporaryDirectory() as commands_dir:
+        for index in range(MODULES):
+            write_module(commands_dir, index)
+
+        start = time.perf_counter()
+        legacy = legacy_load(commands_dir)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        manager = CommandManager(commands_dir, reload_interval=None)
+        index_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        handler = manager.get_handler('@cmd42')
+        first_use = time.perf_counter() - start
+
+        assert len(legacy) == MODULES == len(manager.get_available_commands())
+        print(f"模块数: {MODULES}")
+        print(f"启动时全部导入: {legacy_time * 1000:8.1f} ms")
+        print(f"语法树索引启动: {index_time * 1000:8.1f} ms")
+        print(f"首次使用导入:   {first_use * 1000:8.1f} ms")
+
+        # 修改文件后热加载：确保修改时间变化
+        path = write_module(commands_dir, 42, reply='v2')
+        os.utime(path, (time.time() + 1, time.time() + 1))
+        start = time.perf_counter()
+        manager.check_reload(force=True)
+        handler = manager.get_handler('@cmd42')
+        reload_time = time.perf_counter() - start
+        assert handler.execute({})['message'] == 'v2'
+        print(f"热加载单个模块: {reload_time * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+@搜索 倒排索引基准
+
+向索引写入 N 条合成的中文聊天消息（夹杂电影链接和英文单词），测量写入吞吐、
+索引规模（估算内存和进程 RSS 增量），以及不同类型查询的延迟：
+罕见词、常见词、常见词组合、跨二元组的短语、英文链接片段、不存在的词。
+
+用法: python benchmarks/bench_search_index.py [消息条数，默认 1000000]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.search_index import SearchIndex
+
+ROOMS = ['chat_room', '数据结构', '电影交流', '期末复习']
+WORDS = ['今天', '作业', '第三题', '怎么做', '电影', '好看', '图书馆', '食堂', '晚上', '一起', '复习',
+         '考试', '老师', '同学', '宿舍', '明天', '上课', '实验', '报告', '提交', '周末', '篮球', '比赛',
+         '学校', '川小农', '请问', '谢谢', '哈哈', '可以', '不行', '已经', '还没', '开始', '结束']
+ENGLISH = ['ok', 'python', 'socket', 'homework', 'lol', 'linux', 'bug', 'github']
+QUERIES = {
+    '罕见词': '蒲公英',
+    '常见词': '作业',
+    '常见词组合': '电影 好看',
+    '短语': '图书馆复习',
+    '链接片段': 'movie42.mp4',
+    '不存在': '火星探测器',
+}
+ROUNDS = 200
+
+
+def make_message(rng, i):
+    words = rng.choices(WORDS, k=rng.randint(3, 10))
+    if rng.random() < 0.2:
+        words.append(rng.choice(ENGLISH))
+    if rng.random() < 0.0005:
+        words.append('蒲公英')
+    message = {'id': i + 1, 'ts': 1700000000000 + i * 1000, 'nickname': f'同学{i % 500}', 'message': ''.join(words)}
+    if rng.random() < 0.01:
+        message['movie_url'] = f'https://example.com/movies/movie{i % 1000}.mp4'
+    return message
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(42)
+    messages = [(ROOMS[i % len(ROOMS)], make_message(rng, i)) for i in range(count)]
+
+    index = SearchIndex(max_docs=count)
+    rss_before = rss_kb()
+    start = time.perf_counter()
+    for room, message in messages:
+        index.add(room, message)
+    elapsed = time.perf_counter() - start
+    rss_after = rss_kb()
+    stats = index.stats()
+    print(f"写入 {count} 条消息: {elapsed:.1f} s，{count / elapsed:,.0f} 条/s，每条 {elapsed / count * 1e6:.1f} µs")
+    print(f"词项 {stats['tokens']:,}，倒排项 {stats['postings']:,}，估算内存 {stats['bytes'] / 1048576:.0f} MB", end='')
+    if rss_before is not None:
+        print(f"，进程 RSS 增加 {(rss_after - rss_before) / 1024:.0f} MB")
+    else:
+        print()
+    del messages
+
+    print()
+    print(f"{'查询':<10}{'房间':<8}{'结果':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, query in QUERIES.items():
+        for room in (None, '数据结构'):
+            timings = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                found = index.search(query, room, limit=5)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            print(f"{label:<10}{room or '全部':<8}{len(found['results']):>6}"
+                  f"{timings[len(timings) // 2]:>10.3f}{timings[int(len(timings) * 0.99)]:>10.3f}{timings[-1]:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
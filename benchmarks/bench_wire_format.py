@@ -0,0 +1,110 @@
+"""
+消息格式与广播编码开销基准
+
+对比三类房间消息（普通聊天、川小农回复、电影分享）在以下格式下的单条字节数：
+原先的完整 JSON（中文转义为 \\uXXXX）、UTF-8 完整 JSON、UTF-8 紧凑数组 JSON，
+以及安装了 msgpack 时的 msgpack 编码。
+再对比向 N 个接收者广播一条消息的服务端 CPU 耗时：python-socketio 默认的
+管理器（5.9 之前逐个接收者编码），与 EncodeOnceManager 只编码一次。
+
+用法: python benchmarks/bench_wire_format.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import socketio
+from socketio import packet
+
+from services.wire import EncodeOnceManager, SocketIOManager, UnicodeJSON, compact_message, format_timestamp, now_ms
+
+try:
+    from socketio import msgpack_packet
+except ImportError:
+    msgpack_packet = None
+
+RECIPIENTS = [100, 1000]
+ROUNDS = 20
+
+
+def sample_messages():
+    ts = now_ms()
+    base = {'ts': ts, 'timestamp': format_timestamp(ts)}
+    return {
+        '普通聊天': dict(base, id=1024, nickname='同学甲', message='今天的作业第三题怎么做？', is_command=False),
+        '川小农': dict(base, id=1025, nickname='同学乙', message='同学乙 向川小农提问：你好', is_command=True,
+                    command_type='chuannong', user_question='你好', reply='你好！很高兴为你服务。'),
+        '电影': dict(base, id=1026, nickname='同学丙', message='同学丙 分享了一部电影', is_command=True,
+                   command_type='movie', movie_url='https://example.com/movies/demo.mp4',
+                   movie_meta={'reachable': True, 'status': 200, 'content_type': 'video/mp4',
+                               'size': 734003200, 'final_url': 'https://example.com/movies/demo.mp4'}),
+    }
+
+
+def encoded_size(packet_class, payload, json_module=UnicodeJSON):
+    packet.Packet.json = json_module
+    encoded = packet_class(packet.EVENT, data=['new_message', payload]).encode()
+    if isinstance(encoded, list):
+        return sum(len(part) for part in encoded)
+    return len(encoded.encode('utf-8') if isinstance(encoded, str) else encoded)
+
+
+def build_room(manager, recipients):
+    server = socketio.Server(client_manager=manager)
+    # 只编码不发送，测量的是服务端序列化的开销
+    server._send_packet = lambda eio_sid, pkt: pkt.encode()
+    server._send_eio_packet = lambda eio_sid, eio_pkt: None
+    for i in range(recipients):
+        sid = manager.connect(f'eio{i}', '/')
+        manager.enter_room(sid, '/', 'chat_room')
+    return server
+
+
+def broadcast_time(manager_class, recipients, payload):
+    manager = manager_class()
+    build_room(manager, recipients)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        manager.emit('new_message', payload, '/', room='chat_room')
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    messages = sample_messages()
+
+    print("单条消息编码后的字节数")
+    header = f"{'消息':<8}{'原格式':>10}{'完整JSON':>10}{'紧凑JSON':>10}"
+    if msgpack_packet:
+        header += f"{'完整msgpack':>12}{'紧凑msgpack':>12}"
+    print(header)
+    for label, data in messages.items():
+        compact = compact_message(data)
+        row = (f"{label:<8}{encoded_size(packet.Packet, data, json):>10}"
+               f"{encoded_size(packet.Packet, data):>10}{encoded_size(packet.Packet, compact):>10}")
+        if msgpack_packet:
+            row += (f"{encoded_size(msgpack_packet.MsgPackPacket, data):>12}"
+                    f"{encoded_size(msgpack_packet.MsgPackPacket, compact):>12}")
+        print(row)
+    if not msgpack_packet:
+        print("（未安装 msgpack，跳过 msgpack 编码）")
+
+    print()
+    packet.Packet.json = UnicodeJSON
+    print("向 N 个接收者广播一条普通聊天消息的服务端耗时（ms）")
+    print(f"{'接收者':>6}{'默认/完整':>16}{'默认/紧凑':>16}{'编码一次/完整':>16}{'编码一次/紧凑':>16}")
+    data = messages['普通聊天']
+    compact = compact_message(data)
+    for recipients in RECIPIENTS:
+        timings = [
+            broadcast_time(SocketIOManager, recipients, data),
+            broadcast_time(SocketIOManager, recipients, compact),
+            broadcast_time(EncodeOnceManager, recipients, data),
+            broadcast_time(EncodeOnceManager, recipients, compact),
+        ]
+        print(f"{recipients:>6}" + ''.join(f"{t * 1000:>16.2f}" for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+"""
+Socket.IO 服务端负载与延迟测试
+
+在本机启动聊天服务（不经过 app.py / asgi_app.py 的 __main__，不会改写 config.json），
+--backend 选择 eventlet（app.py，默认）或 asgi（asgi_app.py，需要安装 uvicorn），
+按场景模拟 N 个客户端加入、聊天、发送 @川小农/@电影 命令和断开，输出：
+
+- 连接和加入延迟 p50/p95/p99
+- 房间消息端到端扇出延迟 p50/p95/p99（发送到每个接收者收到）
+- 命令往返延迟（发送到收到 command_result）
+- 发送和投递吞吐（条/秒）、投递率
+- 批量断开后在线名单收敛耗时
+- 重连风暴：重新加入延迟、失败数、恢复会话数、join_success 大小，
+  以及观察者收到的在线名单增量次数和变化人数
+- 服务进程 RSS（每个阶段结束时和峰值，读取 /proc，非 Linux 时为 null）
+
+结果以键排序的 JSON 输出，便于在不同提交之间 diff。
+
+场景由若干阶段组成，内置 steady、join_storm、mass_disconnect，也可以用
+--script 指定 JSON 文件自定义，格式如：
+
+    {"phases": [
+        {"action": "join", "clients": 100, "ramp": 2},
+        {"action": "chat", "duration": 10, "rate": 1, "command_ratio": 0.05},
+        {"action": "sleep", "duration": 1},
+        {"action": "reconnect", "fraction": 1.0, "ramp": 0, "resume": true},
+        {"action": "disconnect", "fraction": 1.0, "ramp": 0, "logout": true}
+    ]}
+
+disconnect 阶段默认先发送 logout（主动退出），logout 为 false 时模拟直接掉线。
+
+用法:
+    python benchmarks/load_test.py --scenario steady --clients 100
+    python benchmarks/load_test.py --script my_scenario.json --output result.json
+    python benchmarks/load_test.py --url http://127.0.0.1:5004 --pid 12345
+    python benchmarks/load_test.py --scenario reconnect_storm --clients 1000 --server-env CHAT_RESUME_GRACE=0
+    python benchmarks/load_test.py --scenario steady --clients 200 --backend asgi
+
+需要 python-socketio 客户端依赖（websocket-client），见 requirements-dev.txt。
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    'steady': [
+        {'action': 'join', 'ramp': 2},
+        {'action': 'chat', 'duration': 10, 'rate': 1, 'command_ratio': 0.05},
+        {'action': 'disconnect', 'fraction': 1.0, 'ramp': 1},
+    ],
+    'join_storm': [
+        {'action': 'join', 'ramp': 0},
+        {'action': 'sleep', 'duration': 1},
+        {'action': 'disconnect', 'fraction': 1.0, 'ramp': 1},
+    ],
+    # 所有客户端同时掉线（不发送 logout），服务器保留会话 CHAT_RESUME_GRACE 秒后才移除
+    'mass_disconnect': [
+        {'action': 'join', 'ramp': 2},
+        {'action': 'chat', 'duration': 3, 'rate': 1, 'command_ratio': 0},
+        {'action': 'disconnect', 'fraction': 1.0, 'ramp': 0, 'logout': False, 'timeout': 60},
+    ],
+    # 所有客户端同时断线重连（如网络抖动），对比 CHAT_RESUME_GRACE=0 即为不使用恢复令牌
+    'reconnect_storm': [
+        {'action': 'join', 'ramp': 5},
+        # 少量消息，重连时客户端需要补齐错过的部分
+        {'action': 'chat', 'duration': 2, 'rate': 0.02, 'command_ratio': 0},
+        {'action': 'reconnect', 'fraction': 1.0, 'ramp': 0, 'resume': True},
+        {'action': 'disconnect', 'fraction': 1.0, 'ramp': 1},
+    ],
+}
+
+# 压测时放宽服务端限流，避免限流本身掩盖延迟
+SERVER_ENV = {
+    'CHAT_LOG_LEVEL': 'WARNING',
+    'CHAT_MESSAGE_RATE': '1000',
+    'CHAT_MESSAGE_BURST': '1000',
+    'CHAT_COMMAND_RATE': '1000',
+    'CHAT_COMMAND_BURST': '1000',
+    'CHAT_COMMAND_MAX_PER_USER': '10',
+    # 不写入仓库目录下的消息日志
+    'CHAT_MESSAGE_LOG': '',
+}
+
+MESSAGE_TAG = 'bench'
+
+
+def percentiles(values):
+    """最近秩百分位数（毫秒，保留一位小数）"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+    return {'count': len(ordered), 'p50': rank(0.50), 'p95': rank(0.95), 'p99': rank(0.99),
+            'max': round(ordered[-1] * 1000, 1)}
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class Recorder:
+    """在所有模拟客户端之间共享的测量数据"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fanout = []
+        self.commands = []
+        self.command_errors = 0
+        self.delivered = 0
+
+    def reset(self):
+        with self.lock:
+            self.fanout = []
+            self.commands = []
+            self.command_errors = 0
+            self.delivered = 0
+
+
+class SimClient:
+    """一个模拟用户：连接、加入、发送消息并记录收到消息的延迟"""
+
+    def __init__(self, index, url, recorder, nickname_prefix):
+        self.index = index
+        self.url = url
+        self.recorder = recorder
+        self.nickname = f'{nickname_prefix}{index}'
+        self.sio = socketio.Client(reconnection=False)
+        self.joined = threading.Event()
+        self.join_error = None
+        self.online_count = None
+        self.online_changed = threading.Condition()
+        self._pending_commands = []
+        self._seq = itertools.count()
+        # 重连所需的状态：恢复令牌、所在房间、最后一条消息编号、在线名单版本、服务器启动标识
+        self.resume_token = None
+        self.room = None
+        self.last_id = 0
+        self.presence_version = 0
+        self.boot_id = None
+        # 最近一次 join_success：是否恢复了原会话、序列化后的字节数
+        self.resumed = False
+        self.join_bytes = 0
+        # 收到的在线名单增量次数和其中的变化人数
+        self.presence_events = 0
+        self.presence_changes = 0
+
+        self.sio.on('join_success', self._on_join_success)
+        self.sio.on('error', self._on_error)
+        self.sio.on('new_message', self._on_message)
+        self.sio.on('message_batch', lambda data: [self._on_message(m) for m in data.get('messages', [])])
+        self.sio.on('command_result', self._on_command_result)
+        self.sio.on('presence_delta', self._on_presence)
+        # 多进程部署（CHAT_STATE_BACKEND=sqlite）时名单变化以完整快照广播
+        self.sio.on('presence_snapshot', self._on_presence_snapshot)
+
+    def connect_and_join(self, timeout=10, resume=False):
+        """
+        Args:
+            resume: 带上恢复令牌和重连前的状态
+
+        Returns:
+            tuple: (连接耗时, 加入耗时)，失败时抛出异常
+        """
+        self.joined.clear()
+        self.join_error = None
+        request = {'nickname': self.nickname}
+        if resume and self.resume_token:
+            request.update(resume_token=self.resume_token, room=self.room, last_id=self.last_id,
+                           presence_version=self.presence_version, boot_id=self.boot_id)
+        start = time.perf_counter()
+        self.sio.connect(self.url, transports=['websocket'], wait_timeout=timeout)
+        connected = time.perf_counter()
+        self.sio.emit('join', request)
+        if not self.joined.wait(timeout):
+            raise TimeoutError(self.join_error or 'join 超时')
+        return connected - start, time.perf_counter() - connected
+
+    def send_chat(self):
+        self.sio.emit('send_message', {
+            'message': f'{MESSAGE_TAG} {self.index} {next(self._seq)} {time.perf_counter():.6f}'
+        })
+
+    def send_command(self, text):
+        with self.recorder.lock:
+            self._pending_commands.append(time.perf_counter())
+        self.sio.emit('send_message', {'message': text})
+
+    def disconnect(self, logout=False):
+        if logout and self.sio.connected:
+            # 主动退出：等服务器确认后再断开，否则断开可能先于 logout 处理
+            try:
+                self.sio.call('logout', timeout=5)
+            except Exception:
+                pass
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def reconnect(self, resume=False):
+        """断开后立即重新连接加入，返回同 connect_and_join"""
+        self.disconnect()
+        return self.connect_and_join(resume=resume)
+
+    def _on_join_success(self, data):
+        self.join_bytes = len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.resume_token = data.get('resume_token')
+        self.room = data.get('room')
+        self.boot_id = data.get('boot_id')
+        self.resumed = bool(data.get('resumed'))
+        self.presence_version = data.get('presence_version', self.presence_version)
+        for message in data.get('missed', data.get('history', ())):
+            self._track_id(message)
+        self._set_online(data.get('online_count'))
+        self.joined.set()
+
+    def _track_id(self, data):
+        message_id = data.get('id')
+        if isinstance(message_id, int) and message_id > self.last_id:
+            self.last_id = message_id
+
+    def _on_error(self, data):
+        self.join_error = data.get('message')
+
+    def _on_message(self, data):
+        now = time.perf_counter()
+        self._track_id(data)
+        message = data.get('message', '')
+        if message.startswith(MESSAGE_TAG + ' '):
+            sent_at = float(message.rsplit(' ', 1)[1])
+            with self.recorder.lock:
+                self.recorder.fanout.append(now - sent_at)
+                self.recorder.delivered += 1
+        elif data.get('is_system') and self._pending_commands:
+            # 命令被拒绝或验证失败时只会收到系统消息
+            with self.recorder.lock:
+                self.recorder.commands.append(now - self._pending_commands.pop(0))
+                self.recorder.command_errors += 1
+
+    def _on_command_result(self, data):
+        now = time.perf_counter()
+        with self.recorder.lock:
+            if self._pending_commands:
+                self.recorder.commands.append(now - self._pending_commands.pop(0))
+            if not data.get('success', True):
+                self.recorder.command_errors += 1
+
+    def _on_presence(self, data):
+        self.presence_version = data.get('version', self.presence_version)
+        self.presence_events += 1
+        self.presence_changes += len(data.get('added', ())) + len(data.get('removed', ()))
+        self._set_online(data.get('online_count'))
+
+    def _on_presence_snapshot(self, data):
+        if data.get('version', 0) < self.presence_version:
+            return
+        self.presence_version = data['version']
+        self.presence_events += 1
+        self._set_online(data.get('online_count'))
+
+    def _set_online(self, count):
+        with self.online_changed:
+            self.online_count = count
+            self.online_changed.notify_all()
+
+    def wait_online(self, expected, timeout):
+        deadline = time.monotonic() + timeout
+        with self.online_changed:
+            while self.online_count != expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.online_changed.wait(remaining)
+        return True
+
+
+class LoadTest:
+    """
+    按阶段执行负载场景
+
+    Args:
+        url: 服务地址
+        clients: join 阶段未指定 clients 时的默认客户端数
+        server_pid: 服务进程号，用于采样 RSS
+        movie_url: @电影 命令使用的链接
+    """
+
+    def __init__(self, url, clients, server_pid=None, movie_url='http://127.0.0.1/bench.mp4', seed=1):
+        self.url = url
+        self.default_clients = clients
+        self.server_pid = server_pid
+        self.movie_url = movie_url
+        self.random = random.Random(seed)
+        self.recorder = Recorder()
+        self.prefix = f'lt{os.getpid() % 10000}_'
+        self.next_index = 0
+        self.clients = []
+        self.peak_rss = None
+        self._sampling = True
+        # 观察者始终在线，用于判断在线名单何时收敛
+        self.observer = SimClient('observer', url, Recorder(), self.prefix)
+
+    def run(self, phases):
+        sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        sampler.start()
+        self.observer.connect_and_join()
+        results = []
+        try:
+            for phase in phases:
+                action = phase['action']
+                start = time.perf_counter()
+                result = getattr(self, f'_phase_{action}')(phase)
+                result['action'] = action
+                result['elapsed_s'] = round(time.perf_counter() - start, 2)
+                result['rss_kb'] = read_rss_kb(self.server_pid) if self.server_pid else None
+                results.append(result)
+                print(f"[{action}] {json.dumps(result, ensure_ascii=False, sort_keys=True)}", file=sys.stderr)
+        finally:
+            self._sampling = False
+            for client in self.clients:
+                client.disconnect()
+            self.observer.disconnect()
+        return results
+
+    def _sample_rss(self):
+        while self._sampling and self.server_pid:
+            rss = read_rss_kb(self.server_pid)
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            time.sleep(0.2)
+
+    def _spread(self, count, ramp, action):
+        """在 ramp 秒内均匀发起 count 个操作，ramp 为 0 时同时发起"""
+        results = []
+        with ThreadPoolExecutor(max_workers=min(max(count, 1), 200)) as pool:
+            start = time.perf_counter()
+            futures = []
+            for i in range(count):
+                delay = start + (ramp * i / count if count else 0) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(action, i))
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def _phase_join(self, phase):
+        count = phase.get('clients', self.default_clients)
+        new_clients = [SimClient(self.next_index + i, self.url, self.recorder, self.prefix) for i in range(count)]
+        self.next_index += count
+        outcomes = self._spread(count, phase.get('ramp', 0), lambda i: new_clients[i].connect_and_join())
+
+        connect_times, join_times, failures = [], [], 0
+        for client, outcome in zip(new_clients, outcomes):
+            if isinstance(outcome, Exception):
+                failures += 1
+                client.disconnect()
+            else:
+                connect_times.append(outcome[0])
+                join_times.append(outcome[1])
+                self.clients.append(client)
+        return {
+            'clients': count,
+            'failures': failures,
+            'online': len(self.clients),
+            'connect_ms': percentiles(connect_times),
+            'join_ms': percentiles(join_times),
+        }
+
+    def _phase_chat(self, phase):
+        duration = phase.get('duration', 10)
+        rate = phase.get('rate', 1)
+        command_ratio = phase.get('command_ratio', 0)
+        self.recorder.reset()
+        senders = list(self.clients)
+        sent = commands = 0
+        if senders:
+            # 所有客户端的发送合并到一个按固定间隔推进的调度循环
+            interval = 1 / (rate * len(senders))
+            start = time.perf_counter()
+            next_send = start
+            while next_send < start + duration:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                client = senders[(sent + commands) % len(senders)]
+                if self.random.random() < command_ratio:
+                    if commands % 2:
+                        client.send_command(f'@电影 {self.movie_url}')
+                    else:
+                        client.send_command('@川小农 你好')
+                    commands += 1
+                else:
+                    client.send_chat()
+                    sent += 1
+                next_send += interval
+        elapsed = time.perf_counter() - start if senders else 0
+        time.sleep(phase.get('drain', 1))
+
+        with self.recorder.lock:
+            delivered = self.recorder.delivered
+            fanout = list(self.recorder.fanout)
+            command_times = list(self.recorder.commands)
+            command_errors = self.recorder.command_errors
+        # 观察者使用单独的记录器，不计入投递数
+        expected = sent * len(senders)
+        return {
+            'clients': len(senders),
+            'messages_sent': sent,
+            'commands_sent': commands,
+            'send_rate': round(sent / elapsed, 1) if elapsed else 0,
+            'delivered': delivered,
+            'delivery_ratio': round(delivered / expected, 4) if expected else None,
+            'delivery_rate': round(delivered / elapsed, 1) if elapsed else 0,
+            'fanout_ms': percentiles(fanout),
+            'command_ms': percentiles(command_times),
+            'command_errors': command_errors,
+        }
+
+    def _phase_disconnect(self, phase):
+        count = int(len(self.clients) * phase.get('fraction', 1.0))
+        leaving, self.clients = self.clients[:count], self.clients[count:]
+        start = time.perf_counter()
+        logout = phase.get('logout', True)
+        self._spread(count, phase.get('ramp', 0), lambda i: leaving[i].disconnect(logout))
+        # 观察者收到的在线人数回落到剩余人数即视为收敛
+        settled = self.observer.wait_online(len(self.clients) + 1, phase.get('timeout', 30))
+        return {
+            'clients': count,
+            'online': len(self.clients),
+            'settle_ms': round((time.perf_counter() - start) * 1000, 1) if settled else None,
+        }
+
+    def _phase_reconnect(self, phase):
+        count = int(len(self.clients) * phase.get('fraction', 1.0))
+        targets = self.clients[:count]
+        resume = phase.get('resume', True)
+        observer = self.observer
+        observer.presence_events = observer.presence_changes = 0
+        start = time.perf_counter()
+        outcomes = self._spread(count, phase.get('ramp', 0), lambda i: targets[i].reconnect(resume))
+
+        join_times, join_bytes, failures, errors = [], [], 0, {}
+        for client, outcome in zip(targets, outcomes):
+            if isinstance(outcome, Exception):
+                failures += 1
+                errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+                client.disconnect()
+                self.clients.remove(client)
+            else:
+                join_times.append(outcome[0] + outcome[1])
+                join_bytes.append(client.join_bytes)
+        # 在线名单收敛后再等待一个防抖窗口，统计观察者收到的全部增量
+        settled = observer.wait_online(len(self.clients) + 1, phase.get('timeout', 30))
+        settle_ms = round((time.perf_counter() - start) * 1000, 1) if settled else None
+        time.sleep(phase.get('drain', 1))
+        return {
+            'clients': count,
+            'failures': failures,
+            'errors': errors,
+            'resumed': sum(1 for client in targets if client.resumed and client in self.clients),
+            'online': len(self.clients),
+            'rejoin_ms': percentiles(join_times),
+            'join_success_bytes': {'total': sum(join_bytes), 'max': max(join_bytes, default=0)},
+            'settle_ms': settle_ms,
+            'observer_presence_events': observer.presence_events,
+            'observer_presence_changes': observer.presence_changes,
+        }
+
+    def _phase_sleep(self, phase):
+        time.sleep(phase.get('duration', 1))
+        return {}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# 各后端的启动代码
+BACKENDS = {
+    'eventlet': "import app; app.socketio.run(app.app, host='127.0.0.1', port=%d, use_reloader=False, log_output=False)",
+    'asgi': "import asgi_app; asgi_app.serve('127.0.0.1', %d, log_level='warning')",
+}
+
+
+def start_server(port, extra_env, backend='eventlet'):
+    # --server-env 可以覆盖 SERVER_ENV 中的默认值
+    env = dict(os.environ, **dict(SERVER_ENV, **extra_env), CHAT_PORT=str(port))
+    code = BACKENDS[backend] % port
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'服务启动失败，退出码 {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('服务启动超时')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='聊天服务负载与延迟测试')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='steady')
+    parser.add_argument('--script', help='自定义场景 JSON 文件，优先于 --scenario')
+    parser.add_argument('--clients', type=int, default=50, help='join 阶段默认的客户端数')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='eventlet', help='本机启动的服务使用的后端')
+    parser.add_argument('--url', help='压测已运行的服务，不在本机启动')
+    parser.add_argument('--pid', type=int, help='配合 --url 指定服务进程号以采样 RSS')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='传给本机启动的服务的环境变量，可重复')
+    parser.add_argument('--movie-url', default='http://127.0.0.1/bench.mp4', help='@电影 命令使用的链接')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    if args.script:
+        with open(args.script, encoding='utf-8') as f:
+            phases = json.load(f)['phases']
+        scenario = os.path.basename(args.script)
+    else:
+        phases = SCENARIOS[args.scenario]
+        scenario = args.scenario
+
+    server = None
+    url, pid = args.url, args.pid
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+    if url is None:
+        port = free_port()
+        server = start_server(port, server_env, args.backend)
+        url, pid = f'http://127.0.0.1:{port}', server.pid
+
+    try:
+        test = LoadTest(url, args.clients, pid, args.movie_url, args.seed)
+        results = test.run(phases)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    report = {
+        'scenario': scenario,
+        'revision': git_revision(),
+        'config': {'clients': args.clients, 'server_env': server_env, 'seed': args.seed,
+                   'backend': args.backend if args.url is None else None},
+        'phases': results,
+        'peak_rss_kb': test.peak_rss,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
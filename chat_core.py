@@ -0,0 +1,927 @@
+"""
+聊天服务的核心：配置、各项服务、HTTP 路由和 Socket.IO 事件处理
+
+这里不依赖具体的异步框架，事件处理函数显式接收会话ID，发送、进出房间和后台任务
+都通过 services.transport 中的传输层完成。入口负责创建 Socket.IO 服务器、
+调用 bind 绑定传输层和命令执行器，再把 HANDLERS 中的事件注册到服务器上：
+
+    app.py       Flask-SocketIO + eventlet（默认）
+    asgi_app.py  python-socketio AsyncServer + ASGI 服务器（asyncio）
+"""
+from flask import Flask, Response, abort, render_template, request, jsonify, redirect
+import json
+import logging
+import os
+import secrets
+import socket
+from datetime import datetime
+import sys
+import time
+from functools import wraps
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from commands.command_manager import CommandManager
+from services.broadcast import BroadcastCoalescer
+from services.history import MessageHistory, SQLiteMessageIds
+from services.message_log import MessageLog
+from services.moderation import Moderator, REJECT
+from services.log import setup_logging, parse_sample_rates
+from services.metrics import MetricsRegistry, SIZE_BUCKETS
+from services.presence import create_session_registry
+from services.server_config import ConfigStore, ServerProber
+from services.rate_limit import FloodControl, ALLOW, WARN, MUTE, MUTED
+from services.resume import ResumeTokens, SQLiteResumeNonces
+from services.search_index import SearchIndex
+from services.roster import PresenceTracker
+from services.static_assets import PageCache, StaticAssets, VENDOR_FILES, socketio_client_name
+from services.transport import Transport
+from services.wire import (WIRE_COMPACT, WIRE_FORMATS, WIRE_JSON, compact_message, format_timestamp, now_ms,
+                           resolve_serializer, split_wire_room, wire_room)
+
+# 服务端口，多进程部署时每个工作进程使用不同端口
+PORT = int(os.environ.get('CHAT_PORT', 5004))
+# 在线状态后端：memory（单进程）或 sqlite（同机多进程共享）。
+# 多进程部署时所有工作进程的 CHAT_STATE_DB 和 CHAT_MESSAGE_LOG 必须指向同一组文件；
+# 状态库默认位于程序所在目录（与启动时的当前目录无关），同一份代码启动的工作进程自动共用
+STATE_BACKEND = os.environ.get('CHAT_STATE_BACKEND', 'memory')
+STATE_DB = os.environ.get('CHAT_STATE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chat_state.db'))
+# Socket.IO 消息队列，如 sqlite:///chat_state.db 或 redis://localhost:6379/0
+# 使用 sqlite 状态后端且未指定时，默认与状态共用同一个数据库文件
+MESSAGE_QUEUE = os.environ.get('CHAT_MESSAGE_QUEUE') or (f'sqlite:///{STATE_DB}' if STATE_BACKEND == 'sqlite' else None)
+WORKER_ID = os.environ.get('CHAT_WORKER_ID', str(PORT))
+# 日志级别与按事件采样率（如 send_message=0.01），调试模式默认关闭
+LOG_LEVEL = os.environ.get('CHAT_LOG_LEVEL', 'INFO')
+LOG_SAMPLE = parse_sample_rates(os.environ.get('CHAT_LOG_SAMPLE', ''))
+DEBUG = os.environ.get('CHAT_DEBUG', '').lower() in ('1', 'true', 'yes')
+# 房间消息合并窗口（毫秒，0 表示逐条发送）和单批最多消息数
+BATCH_WINDOW_MS = int(os.environ.get('CHAT_BATCH_WINDOW_MS', 0))
+BATCH_MAX = int(os.environ.get('CHAT_BATCH_MAX', 50))
+# 每个房间保留的历史消息条数、总字符数上限，以及加入时回放的条数
+HISTORY_SIZE = int(os.environ.get('CHAT_HISTORY_SIZE', 500))
+HISTORY_CHARS = int(os.environ.get('CHAT_HISTORY_CHARS', 256 * 1024))
+HISTORY_BACKFILL = int(os.environ.get('CHAT_HISTORY_BACKFILL', 50))
+# 最多保存历史消息的房间数，超出时丢弃最久没有新消息的房间
+HISTORY_ROOMS = int(os.environ.get('CHAT_HISTORY_ROOMS', 1000))
+
+# 持久化的消息日志文件路径，如 /var/lib/chat/chat_messages.db；默认不持久化
+MESSAGE_LOG = os.environ.get('CHAT_MESSAGE_LOG', '')
+MESSAGE_LOG_SYNC = os.environ.get('CHAT_MESSAGE_LOG_SYNC', 'normal')
+MESSAGE_LOG_BATCH = int(os.environ.get('CHAT_MESSAGE_LOG_BATCH', 500))
+MESSAGE_LOG_FLUSH_MS = int(os.environ.get('CHAT_MESSAGE_LOG_FLUSH_MS', 100))
+# 消息日志最多保留的条数和时长（秒，默认 30 天），为 0 时不限；加入回放和重连补齐同样不超出保留时长
+MESSAGE_LOG_MAX_MESSAGES = int(os.environ.get('CHAT_MESSAGE_LOG_MAX_MESSAGES', 1000000))
+MESSAGE_RETENTION = float(os.environ.get('CHAT_MESSAGE_RETENTION', 30 * 24 * 3600))
+
+# @搜索 索引的最多消息条数，为 0 时不建立索引
+SEARCH_MAX_DOCS = int(os.environ.get('CHAT_SEARCH_MAX_DOCS', 200000))
+# 异步命令协程池大小和每个用户同时执行的命令数上限
+COMMAND_POOL_SIZE = int(os.environ.get('CHAT_COMMAND_POOL_SIZE', 100))
+COMMAND_MAX_PER_USER = int(os.environ.get('CHAT_COMMAND_MAX_PER_USER', 2))
+# Socket.IO 序列化方式：default（JSON）或 msgpack（需安装 msgpack，对所有客户端生效）
+SERIALIZER = resolve_serializer(os.environ.get('CHAT_SERIALIZER'))
+# 本地 static/vendor/ 下没有 socket.io 客户端时是否改从 CDN 加载；默认允许并在启动时记录警告，
+# 校园内网离线部署设为 0，缺少文件时拒绝启动，避免页面因无法访问外网而不可用
+SOCKETIO_CDN = os.environ.get('CHAT_SOCKETIO_CDN', '1').lower() not in ('0', 'false', 'no')
+# 用户未指定房间时进入的默认房间，以及同时有人在线的房间数上限
+DEFAULT_ROOM = os.environ.get('CHAT_DEFAULT_ROOM', 'chat_room')
+MAX_ROOMS = int(os.environ.get('CHAT_MAX_ROOMS', 500))
+# 在线名单增量的防抖窗口（毫秒）
+PRESENCE_DEBOUNCE_MS = int(os.environ.get('CHAT_PRESENCE_DEBOUNCE_MS', 200))
+
+# 按客户端的发送队列：积压上限、开始积压的 Engine.IO 队列长度、溢出处理方式、累计丢弃多少后断开（0 不断开）
+OUTBOX_MAX = int(os.environ.get('CHAT_OUTBOX_MAX', 200))
+OUTBOX_ENGINEIO_LIMIT = int(os.environ.get('CHAT_OUTBOX_ENGINEIO_LIMIT', 32))
+OUTBOX_POLICY = os.environ.get('CHAT_OUTBOX_POLICY', 'drop_oldest')
+OUTBOX_DISCONNECT_AFTER = int(os.environ.get('CHAT_OUTBOX_DISCONNECT_AFTER', 1000))
+
+# 断线后保留会话（昵称和房间）等待重连的时间（秒），为 0 时断开即移除
+RESUME_GRACE = float(os.environ.get('CHAT_RESUME_GRACE', 30))
+
+# 敏感词表文件（每行一个词，可用制表符指定该词的处理方式），设为空字符串时不过滤；
+# 未指定处理方式的词按 CHAT_MODERATION_ACTION 处理：flag（标记）、mask（打码）或 reject（拒绝发送）
+BANNED_WORDS = os.environ.get('CHAT_BANNED_WORDS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'banned_words.txt'))
+MODERATION_ACTION = os.environ.get('CHAT_MODERATION_ACTION', 'mask')
+MODERATION_MASK = os.environ.get('CHAT_MODERATION_MASK', '*')
+
+# 服务器探测间隔（秒），为 0 时不探测
+PROBE_INTERVAL = float(os.environ.get('CHAT_PROBE_INTERVAL', 15))
+PROBE_TIMEOUT = float(os.environ.get('CHAT_PROBE_TIMEOUT', 2))
+# 发送限流：普通消息和命令每秒补充的额度及突发上限，按会话ID和昵称分别计算
+MESSAGE_RATE = float(os.environ.get('CHAT_MESSAGE_RATE', 2))
+MESSAGE_BURST = int(os.environ.get('CHAT_MESSAGE_BURST', 8))
+COMMAND_RATE = float(os.environ.get('CHAT_COMMAND_RATE', 0.2))
+COMMAND_BURST = int(os.environ.get('CHAT_COMMAND_BURST', 3))
+# 刷屏处罚：违规多少次后警告、多少次后禁言，以及禁言时长（秒）
+FLOOD_WARN_AFTER = int(os.environ.get('CHAT_FLOOD_WARN_AFTER', 3))
+FLOOD_MUTE_AFTER = int(os.environ.get('CHAT_FLOOD_MUTE_AFTER', 6))
+FLOOD_MUTE_SECONDS = int(os.environ.get('CHAT_FLOOD_MUTE_SECONDS', 30))
+
+log_writer = setup_logging('DEBUG' if DEBUG else LOG_LEVEL, LOG_SAMPLE)
+logger = logging.getLogger('chat.app')
+
+# 传输层和异步命令执行器由入口在启动前调用 bind 绑定
+transport = Transport()
+command_executor = None
+
+# 本次启动的标识，客户端重连时据此判断消息编号和在线名单版本是否仍然有效
+BOOT_ID = secrets.token_hex(4)
+
+# 热路径日志使用的结构化字段，预先构建避免每次分配
+_EVENT_CONNECT = {'event': 'connect'}
+_EVENT_DISCONNECT = {'event': 'disconnect'}
+_EVENT_JOIN = {'event': 'join'}
+_EVENT_MESSAGE = {'event': 'send_message'}
+
+# 静态资源由 StaticAssets 提供（带指纹、预压缩），不使用 Flask 默认的静态路由
+app = Flask(__name__, static_folder=None)
+app.config['SECRET_KEY'] = 'daipp_chat_secret_key'
+static_assets = StaticAssets(os.path.join(app.root_path, 'static'), auto_reload=DEBUG)
+page_cache = PageCache(enabled=not DEBUG)
+
+
+@app.context_processor
+def inject_static_assets():
+    return {'asset_url': static_assets.url, 'asset_exists': static_assets.exists}
+
+# 运行指标，通过 /metrics 以 Prometheus 文本格式输出
+metrics = MetricsRegistry()
+event_total = metrics.counter('socketio_events_total', 'Socket.IO 事件次数', ('event',))
+event_errors = metrics.counter('socketio_event_errors_total', 'Socket.IO 事件处理异常次数', ('event',))
+event_duration = metrics.histogram('socketio_event_duration_seconds', 'Socket.IO 事件处理耗时', ('event',))
+fanout_size = metrics.histogram('broadcast_fanout_size', '每条房间消息在本进程的接收人数', buckets=SIZE_BUCKETS)
+command_duration = metrics.histogram('command_duration_seconds', '命令执行耗时', ('command',))
+command_errors = metrics.counter('command_errors_total', '命令执行失败次数', ('command',))
+moderation_hits = metrics.counter('moderation_hits_total', '命中敏感词的消息数', ('action',))
+
+def record_command(command_name, duration, success):
+    command_duration.observe(duration, command_name)
+    if not success:
+        command_errors.inc(command_name)
+
+def track_event(event):
+    """统计 Socket.IO 事件的次数和处理耗时"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                event_total.inc(event)
+                event_duration.observe(time.perf_counter() - start, event)
+        return wrapper
+    return decorator
+
+# 聊天记录的倒排索引，供 @搜索 使用
+search_index = SearchIndex(SEARCH_MAX_DOCS) if SEARCH_MAX_DOCS > 0 else None
+
+# 初始化命令管理器
+command_manager = CommandManager(on_executed=record_command, context={'search_index': search_index})
+
+# 房间消息广播器，开启合并时按时间窗口批量发送
+broadcaster = BroadcastCoalescer(transport, BATCH_WINDOW_MS / 1000, BATCH_MAX)
+
+# 房间最近消息，用于加入时回放和向前翻页；多进程共享状态时消息编号由共享存储分配，各进程互不重复
+history = MessageHistory(HISTORY_SIZE, HISTORY_CHARS,
+                         SQLiteMessageIds(STATE_DB) if STATE_BACKEND != 'memory' else None,
+                         MESSAGE_RETENTION, HISTORY_ROOMS)
+
+# 消息日志：广播后异步批量写入 SQLite，由 start_services 恢复各房间最近的消息并启动写入线程
+if MESSAGE_LOG:
+    message_log = MessageLog(MESSAGE_LOG, MESSAGE_LOG_SYNC, MESSAGE_LOG_BATCH, MESSAGE_LOG_FLUSH_MS / 1000,
+                             max_messages=MESSAGE_LOG_MAX_MESSAGES, max_age=MESSAGE_RETENTION)
+else:
+    message_log = None
+
+# 发送限流与刷屏处罚
+flood_control = FloodControl(MESSAGE_RATE, MESSAGE_BURST, COMMAND_RATE, COMMAND_BURST,
+                             FLOOD_WARN_AFTER, FLOOD_MUTE_AFTER, FLOOD_MUTE_SECONDS)
+
+# 敏感词过滤：命令和普通消息广播前都要经过，词表文件变化时在后台重新加载
+moderator = Moderator(BANNED_WORDS, MODERATION_ACTION, MODERATION_MASK) if BANNED_WORDS else None
+
+# 会话注册表：在线用户、昵称和房间分配统一由它维护，按会话ID和昵称 O(1) 查询
+sessions = create_session_registry(STATE_BACKEND, STATE_DB, WORKER_ID)
+
+# 带版本号的在线名单，加入/离开合并为防抖后的 presence_delta 广播
+# 多进程共享状态时版本号取自共享存储，名单变化以完整快照广播
+presence = PresenceTracker(transport, sessions.nicknames, sessions.count, PRESENCE_DEBOUNCE_MS / 1000,
+                           shared_roster=sessions if STATE_BACKEND != 'memory' else None)
+if MESSAGE_QUEUE and STATE_BACKEND == 'memory':
+    logger.warning("使用了消息队列但在线状态保存在本进程内，多进程部署须设置 CHAT_STATE_BACKEND=sqlite")
+
+# 会话恢复令牌：断线的会话保留一段时间，持有令牌重连时直接接管，不广播离开和加入
+def expire_session(session_id, nickname):
+    session = sessions.remove(session_id)
+    if session:
+        presence.left(session.room, nickname)
+        logger.info("用户断线后未重连: %s, 剩余用户: %d", nickname, sessions.count(), extra=_EVENT_DISCONNECT)
+
+# 多进程共享状态时令牌随机串也放在共享存储中，重连落到任一工作进程都能接管会话
+resume_tokens = ResumeTokens(transport, app.config['SECRET_KEY'], RESUME_GRACE, expire_session,
+                             SQLiteResumeNonces(STATE_DB) if STATE_BACKEND != 'memory' else None) if RESUME_GRACE > 0 else None
+
+# 服务器配置：按修改时间缓存，后台探测各服务器的健康状态和延迟
+config_store = ConfigStore(os.path.join(app.root_path, 'config.json'), {
+    "servers": [
+        {"name": "默认服务器", "url": "http://localhost:5000"}
+    ]
+})
+server_prober = ServerProber(transport, lambda: config_store.get()[0].get('servers', []), PROBE_INTERVAL, PROBE_TIMEOUT)
+# (配置版本, 探测版本, 序列化后的 /config 响应)
+_config_response = (None, None, None)
+
+metrics.gauge('online_users', '在线用户数', lambda: sessions.count())
+metrics.gauge('rooms', '有人在线的房间数', lambda: len(sessions.rooms()))
+metrics.gauge('command_pool_greenthreads', '异步命令执行池', lambda: {
+    (key,): value for key, value in command_executor.stats().items() if key != 'by_command'
+} if command_executor is not None else {}, ('state',))
+if message_log:
+    log_flush_lag = metrics.histogram('message_log_flush_lag_seconds', '消息从广播到写入消息日志的延迟（每批最早一条）')
+    log_batch_size = metrics.histogram('message_log_batch_size', '消息日志每批写入的条数', buckets=SIZE_BUCKETS)
+    log_write_duration = metrics.histogram('message_log_write_duration_seconds', '消息日志每批写入耗时')
+
+    def record_log_flush(count, lag, duration):
+        log_flush_lag.observe(lag)
+        log_batch_size.observe(count)
+        log_write_duration.observe(duration)
+
+    message_log.on_flush = record_log_flush
+    metrics.gauge('message_log_messages', '消息日志的消息数', lambda: {
+        ('written',): message_log.written,
+        ('pending',): message_log.pending(),
+        ('dropped',): message_log.dropped,
+        ('pruned',): message_log.pruned
+    }, ('state',))
+    metrics.gauge('message_log_write_errors', '消息日志写入失败次数', lambda: message_log.errors)
+if search_index is not None:
+    metrics.gauge('search_index', '搜索索引规模，bytes 为估算的内存占用', lambda: {
+        (key,): value for key, value in search_index.stats().items()
+    }, ('stat',))
+if moderator is not None:
+    metrics.gauge('moderation', '敏感词表规模、重新加载次数和最近一次构建耗时', lambda: {
+        (key,): value for key, value in moderator.stats().items()
+    }, ('stat',))
+if resume_tokens is not None:
+    metrics.gauge('session_resume', '断线保留的会话数和累计的恢复、超时次数', lambda: {
+        (key,): value for key, value in resume_tokens.stats().items()
+    }, ('stat',))
+metrics.gauge('log_records_dropped', '日志队列已满时丢弃的日志条数', lambda: log_writer.dropped)
+
+def validate_room(room):
+    """
+    检查房间名称，未指定时使用默认房间
+    
+    Returns:
+        tuple: (房间名称, 错误消息)
+    """
+    if room is None or room == '':
+        return DEFAULT_ROOM, None
+    if not isinstance(room, str) or len(room) > 32 or not room.isprintable() or any(c.isspace() for c in room):
+        return None, '房间名称须为1到32个字符，且不能包含空白'
+    # 只有新建房间时才需要检查房间数上限
+    if room != DEFAULT_ROOM and sessions.count(room) == 0 and len(sessions.rooms()) >= MAX_ROOMS:
+        return None, '房间数量已达上限，请进入已有的房间'
+    return room, None
+
+def room_state(room):
+    """进入房间时发给用户的房间状态：在线名单快照及其版本号、最近的消息"""
+    snapshot = presence.snapshot(room)
+    return {
+        'room': room,
+        'online_count': snapshot['online_count'],
+        'users': snapshot['users'],
+        'presence_version': snapshot['version'],
+        'history': history.latest(room, HISTORY_BACKFILL)
+    }
+
+def resume_state(room, data):
+    """
+    重连时的房间状态：只包含客户端错过的消息，在线名单没有变化时不重复发送
+    
+    Args:
+        data: join 请求，客户端在其中带上重连前的房间 room、最后一条消息编号 last_id、
+              在线名单版本 presence_version 和服务器启动标识 boot_id
+    
+    Returns:
+        dict: 无法只补齐错过的消息时返回 None，由调用方发送完整的房间状态
+    """
+    last_id = data.get('last_id')
+    if data.get('room') != room or not isinstance(last_id, int) or isinstance(last_id, bool):
+        return None
+    same_boot = data.get('boot_id') == BOOT_ID
+    # 没有消息日志时重启后消息编号从头开始，旧编号不再可比
+    if not same_boot and not message_log:
+        return None
+    page = history.after(room, last_id, HISTORY_BACKFILL)
+    if not page['complete']:
+        return None
+    state = {
+        'room': room,
+        'missed': page['messages'],
+        'online_count': sessions.count(room),
+        'presence_version': presence.version(room)
+    }
+    if not same_boot or data.get('presence_version') != state['presence_version']:
+        state['users'] = sessions.nicknames(room)
+    return state
+
+def moderate(session_id, nickname, text):
+    """
+    广播前的敏感词检查
+    
+    Returns:
+        str: 可以发送的文本（mask 时已打码），拒绝发送时返回 None 并通知发送者
+    """
+    if moderator is None:
+        return text
+    verdict, text, terms = moderator.check(text)
+    if not terms:
+        return text
+    moderation_hits.inc(verdict)
+    if verdict == REJECT:
+        logger.info("消息含违禁词，拒绝发送: %s: %s", nickname, '、'.join(terms))
+        transport.emit('error', {'message': '消息包含违禁内容，未发送'}, to=session_id)
+        return None
+    # 标记和打码的消息照常发送，记录命中的词供管理员复查
+    logger.warning("消息命中敏感词(%s): %s: %s", verdict, nickname, '、'.join(terms))
+    return text
+
+def broadcast_room_message(room, message_data):
+    """
+    记录并广播一条房间消息
+    
+    消息带毫秒时间戳 ts，按客户端协商的格式分别发往两个子房间：
+    完整格式另带格式化好的 timestamp，紧凑格式只发送数组和 ts。
+    """
+    fanout_size.observe(transport.room_size(room))
+    ts = now_ms()
+    message_data['ts'] = ts
+    message_data['timestamp'] = format_timestamp(ts)
+    history.append(room, message_data)
+    broadcaster.emit(wire_room(room, WIRE_JSON), message_data)
+    broadcaster.emit(wire_room(room, WIRE_COMPACT), compact_message(message_data))
+    if message_log:
+        message_log.append(room, message_data)
+    if search_index is not None:
+        search_index.add(room, message_data)
+
+def record_remote_messages(event, data, target):
+    """
+    记录其他工作进程广播的房间消息，使本进程的历史和搜索索引包含整个房间的消息
+    
+    每条消息会以两种格式各广播一次，只处理完整格式的子房间；消息日志由发出消息的进程写入。
+    """
+    if event not in ('new_message', 'message_batch') or not isinstance(target, str):
+        return
+    room, wire = split_wire_room(target)
+    if wire != WIRE_JSON:
+        return
+    for message_data in (data['messages'] if event == 'message_batch' else [data]):
+        if history.record(room, message_data) and search_index is not None:
+            search_index.add(room, message_data)
+
+# 各连接协商的消息格式 {session_id: wire}，只记录本进程的连接
+client_wire = {}
+
+def enter_socket_room(session_id, room, wire):
+    """加入房间及对应消息格式的子房间"""
+    transport.enter_room(session_id, room)
+    transport.enter_room(session_id, wire_room(room, wire))
+
+def leave_socket_room(session_id, room, wire):
+    transport.leave_room(session_id, room)
+    transport.leave_room(session_id, wire_room(room, wire))
+
+def build_command_message(nickname, command_result):
+    """根据命令执行结果构建广播到房间的消息"""
+    # 根据命令类型进行不同的处理
+    if command_result.get('command_name') == '@电影' and 'movie_url' in command_result:
+        # 电影命令特殊处理
+        return {
+            'nickname': nickname,
+            'message': command_result['message'],
+            'is_command': True,
+            'command_type': 'movie',
+            'movie_url': command_result['movie_url'],
+            'movie_meta': command_result.get('movie_meta')
+        }
+    if command_result.get('command_name') == '@川小农' and 'reply' in command_result:
+        # 川小农命令特殊处理
+        return {
+            'nickname': nickname,
+            'message': command_result['message'],
+            'is_command': True,
+            'command_type': 'chuannong',
+            'user_question': command_result.get('user_question', ''),
+            'reply': command_result['reply']
+        }
+    if command_result.get('command_type') == 'search':
+        # 搜索结果只发给搜索者
+        return {
+            'nickname': nickname,
+            'message': command_result['message'],
+            'is_command': True,
+            'command_type': 'search',
+            'query': command_result['query'],
+            'page': command_result['page'],
+            'has_more': command_result['has_more'],
+            'truncated': command_result['truncated'],
+            'results': command_result['results']
+        }
+    # 普通命令处理
+    return {
+        'nickname': nickname,
+        'message': command_result['message'],
+        'is_command': True
+    }
+
+def send_command_error(session_id, message):
+    """命令执行失败，只发送给当前用户"""
+    transport.emit('new_message', {
+        'nickname': '系统',
+        'message': message,
+        'timestamp': datetime.now().strftime('%H:%M:%S'),
+        'is_system': True
+    }, to=session_id)
+
+def deliver_command_result(session_id, room, nickname, command_result, request_id=None):
+    """
+    发送命令执行结果
+    
+    成功时广播到房间（私有结果如搜索只发给发送者）；异步命令另外向发送者发送 command_result 以替换占位提示。
+    """
+    success = command_result.get('success', True)
+    if success and command_result.get('private'):
+        # 私有结果只发给命令发送者
+        transport.emit('command_response', build_command_message(nickname, command_result), to=session_id)
+    elif success:
+        # 广播命令响应到房间
+        broadcast_room_message(room, build_command_message(nickname, command_result))
+    elif request_id is None:
+        send_command_error(session_id, command_result['message'])
+    
+    if request_id is not None:
+        transport.emit('command_result', {
+            'request_id': request_id,
+            'success': success,
+            'command_name': command_result.get('command_name'),
+            'message': command_result['message']
+        }, to=session_id)
+
+# 首页路由（登录页面）
+@app.route('/')
+def index():
+    return page_cache.serve('login', lambda: render_template('login.html'), request.headers)
+
+# 静态资源
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    response = static_assets.serve(filename, request.headers)
+    if response is None:
+        abort(404)
+    return response
+
+# 配置文件路由
+@app.route('/config')
+def get_config():
+    global _config_response
+    server_prober.start()
+    config, config_version = config_store.get()
+    cached_config, cached_probe, body = _config_response
+    if body is None or cached_config != config_version or cached_probe != server_prober.version:
+        probe_version = server_prober.version
+        data = dict(config, servers=server_prober.ranked(config.get('servers', [])))
+        body = json.dumps(data, ensure_ascii=False)
+        _config_response = (config_version, probe_version, body)
+    return Response(body, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+
+# 健康检查，供其他服务器探测延迟
+@app.route('/health')
+def health():
+    return jsonify({'status': 'ok', 'online': sessions.count()})
+
+# 运行指标
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# 聊天页面路由
+@app.route('/chat')
+def chat():
+    nickname = request.args.get('nickname')
+    
+    if not nickname:
+        return redirect('/')
+    
+    # 昵称和服务器由页面脚本从 URL 读取，页面内容只取决于序列化方式，渲染一次后缓存
+    socketio_client = socketio_client_name(SERIALIZER)
+    return page_cache.serve(('chat', SERIALIZER),
+                            lambda: render_template('chat.html', socketio_client=socketio_client,
+                                                    socketio_cdn_url=VENDOR_FILES[socketio_client] if SOCKETIO_CDN else None),
+                            request.headers)
+
+# WebSocket事件处理，第一个参数均为会话ID，返回值作为确认回调的结果
+@track_event('connect')
+def handle_connect(session_id, client_ip, auth=None):
+    logger.debug("新的WebSocket连接: %s, sid: %s, 连接参数: %s", client_ip, session_id, auth,
+                 extra=_EVENT_CONNECT)
+    # 可以在这里添加连接验证逻辑
+
+@track_event('logout')
+def handle_logout(session_id):
+    """处理用户主动退出"""
+    session = sessions.remove(session_id)
+    
+    if session:
+        nickname = session.nickname
+        # 离开房间，离开消息合并到下一次 presence_delta
+        leave_socket_room(session_id, session.room, client_wire.pop(session_id, WIRE_JSON))
+        presence.left(session.room, nickname)
+        if resume_tokens is not None:
+            resume_tokens.forget(nickname)
+        
+        online_count = sessions.count()
+        logger.info('用户主动退出: %s, 剩余用户: %d', nickname, online_count)
+
+@track_event('disconnect')
+def handle_disconnect(session_id):
+    """处理连接断开（可能是非正常断开）"""
+    flood_control.forget_session(session_id)
+    wire = client_wire.pop(session_id, WIRE_JSON)
+    
+    if resume_tokens is not None:
+        # 保留会话等待重连，超时仍未重连时才移除并广播离开
+        session = sessions.get(session_id)
+        if session:
+            leave_socket_room(session_id, session.room, wire)
+            resume_tokens.detach(session.nickname, session_id)
+            logger.info("用户断开连接，保留会话 %.0f 秒: %s", resume_tokens.grace, session.nickname,
+                        extra=_EVENT_DISCONNECT)
+            return
+    
+    # 用户数据可能已被logout事件清理
+    session = sessions.remove(session_id)
+    
+    if session:
+        nickname = session.nickname
+        # 离开房间，离开消息合并到下一次 presence_delta
+        leave_socket_room(session_id, session.room, wire)
+        presence.left(session.room, nickname)
+        
+        online_count = sessions.count()
+        logger.info("用户断开连接: %s, 剩余用户: %d", nickname, online_count, extra=_EVENT_DISCONNECT)
+    else:
+        logger.debug("未知用户断开连接: %s", session_id, extra=_EVENT_DISCONNECT)
+
+@track_event('join')
+def handle_join(session_id, data):
+    logger.debug("接收到join请求: %s, sid: %s", data, session_id, extra=_EVENT_JOIN)
+    nickname = data.get('nickname')
+    
+    if not nickname:
+        transport.emit('error', {'message': '昵称不能为空'}, to=session_id)
+        return
+    
+    # 验证昵称格式
+    if not nickname.strip() or len(nickname) > 20:
+        transport.emit('error', {'message': '昵称长度不能超过20个字符'}, to=session_id)
+        return
+    
+    # 同一连接只能加入一次，换昵称或房间须先退出或使用 switch_room
+    if session_id in sessions:
+        logger.debug("join失败: 会话已加入: %s", session_id, extra=_EVENT_JOIN)
+        transport.emit('error', {'message': '已经加入聊天室，请勿重复加入'}, to=session_id)
+        return
+    
+    # 持有最新令牌时接管保留的会话（或服务器尚未发现断开的旧连接），昵称和房间不变
+    resumed = None
+    token = data.get('resume_token')
+    if resume_tokens is not None and token and resume_tokens.owns(token, nickname):
+        held = sessions.get_by_nickname(nickname)
+        if held is not None:
+            detached_sid = resume_tokens.reattach(nickname)
+            old_sid = held.session_id
+            if old_sid != session_id:
+                resumed = sessions.rebind(old_sid, session_id)
+                if resumed is not None and detached_sid is None:
+                    # 旧连接仍然登记在线（服务器尚未发现断开），接管后断开它；
+                    # 须在转移会话之后，断开可能立即切换过去执行
+                    transport.disconnect(old_sid)
+    
+    if resumed is not None:
+        room = resumed.room
+    else:
+        room, error = validate_room(data.get('room'))
+        if error:
+            transport.emit('error', {'message': error}, to=session_id)
+            return
+        
+        # 登记用户，昵称已存在时失败（多进程部署时由共享存储保证唯一）
+        if sessions.add(session_id, nickname, room) is None:
+            logger.debug("join失败: 昵称已存在: %s", nickname, extra=_EVENT_JOIN)
+            transport.emit('error', {'message': '昵称已被使用，请选择其他昵称'}, to=session_id)
+            return
+    
+    # 加入聊天室，房间消息按客户端声明的格式发送，未声明或不支持时使用完整 JSON
+    wire = data.get('wire') if data.get('wire') in WIRE_FORMATS else WIRE_JSON
+    client_wire[session_id] = wire
+    enter_socket_room(session_id, room, wire)
+    
+    # 发送成功加入消息：接管了保留的会话时只补齐错过的消息，否则包含在线名单的完整快照及其版本号
+    join_response = resume_state(room, data) if resumed is not None else None
+    if join_response is None:
+        join_response = room_state(room)
+    join_response['nickname'] = nickname
+    join_response['timestamp'] = datetime.now().strftime('%H:%M:%S')
+    join_response['wire'] = wire
+    join_response['resumed'] = resumed is not None
+    join_response['boot_id'] = BOOT_ID
+    if resume_tokens is not None:
+        join_response['resume_token'] = resume_tokens.issue(nickname)
+    online_count = join_response['online_count']
+    transport.emit('join_success', join_response, to=session_id)
+    
+    if resumed is not None:
+        logger.info("用户重连恢复会话: %s, 会话ID: %s, 房间: %s", nickname, session_id, room, extra=_EVENT_JOIN)
+        return
+    
+    # 加入消息合并到下一次 presence_delta
+    presence.joined(room, nickname)
+    
+    logger.info("用户加入成功: %s, 会话ID: %s, 房间: %s, 房间在线: %d", nickname, session_id, room, online_count,
+                extra=_EVENT_JOIN)
+
+@track_event('switch_room')
+def handle_switch_room(session_id, data):
+    """切换房间，只更新会话的房间索引，不影响其他房间"""
+    session = sessions.get(session_id)
+    if session is None:
+        transport.emit('error', {'message': '请先加入聊天室'}, to=session_id)
+        return
+    
+    room, error = validate_room(data.get('room') if isinstance(data, dict) else None)
+    if error:
+        transport.emit('error', {'message': error}, to=session_id)
+        return
+    
+    old_room = session.room
+    if room != old_room:
+        if sessions.move(session_id, room) is None:
+            return
+        wire = client_wire.get(session_id, WIRE_JSON)
+        leave_socket_room(session_id, old_room, wire)
+        enter_socket_room(session_id, room, wire)
+    
+    transport.emit('room_joined', room_state(room), to=session_id)
+    
+    if room != old_room:
+        # 离开和加入分别合并到两个房间各自的 presence_delta
+        presence.left(old_room, session.nickname)
+        presence.joined(room, session.nickname)
+        logger.debug("用户切换房间: %s, %s -> %s", session.nickname, old_room, room, extra=_EVENT_JOIN)
+
+@track_event('list_rooms')
+def handle_list_rooms(session_id):
+    """有人在线的房间列表，按人数从多到少排列，结果通过确认回调返回"""
+    session = sessions.get(session_id)
+    rooms = sorted(sessions.rooms().items(), key=lambda item: (-item[1], item[0]))[:100]
+    return {
+        'current': session.room if session else None,
+        'rooms': [{'room': room, 'online_count': count} for room, count in rooms]
+    }
+
+@track_event('send_message')
+def handle_message(session_id, data):
+    logger.debug("接收到send_message请求: %s, sid: %s", data, session_id, extra=_EVENT_MESSAGE)
+    
+    # 验证用户是否已加入
+    session = sessions.get(session_id)
+    if session is None:
+        transport.emit('error', {'message': '请先加入聊天室'}, to=session_id)
+        return
+    
+    nickname = session.nickname
+    message = data.get('message', '').strip()
+    
+    if not message:
+        return
+    
+    # 消息长度限制
+    if len(message) > 500:
+        transport.emit('error', {'message': '消息长度不能超过500个字符'}, to=session_id)
+        return
+    
+    # 限流：超出额度的消息直接丢弃，不广播到房间
+    verdict, mute_remaining = flood_control.check(session_id, nickname, message.startswith('@'))
+    if verdict != ALLOW:
+        if verdict == WARN:
+            transport.emit('error', {'message': '发送太频繁，请稍后再试，继续刷屏将被禁言'}, to=session_id)
+        elif verdict == MUTE:
+            logger.info("用户刷屏被禁言: %s (%ds)", nickname, mute_remaining, extra=_EVENT_MESSAGE)
+            transport.emit('error', {'message': f'发送太频繁，已被禁言 {mute_remaining} 秒'}, to=session_id)
+        elif verdict == MUTED:
+            transport.emit('error', {'message': f'你已被禁言，{int(mute_remaining) + 1} 秒后可以发言'}, to=session_id)
+        return
+    
+    # 敏感词过滤在命令处理和普通广播之前，命令使用打码后的文本
+    message = moderate(session_id, nickname, message)
+    if message is None:
+        return
+    
+    # 使用命令管理器处理消息
+    if message.startswith('@'):
+        user_data = {'nickname': nickname, 'session_id': session_id, 'room': session.room}
+        handler, command_data, error = command_manager.prepare_command(message, user_data)
+        if error:
+            send_command_error(session_id, error['message'])
+        elif handler.is_async:
+            # 异步命令：先返回占位提示，执行完成后通过 command_result 返回
+            room = session.room
+            request_id, reject_reason = command_executor.submit(
+                handler, command_data, session_id,
+                lambda request_id, result: deliver_command_result(session_id, room, nickname, result, request_id)
+            )
+            if request_id is None:
+                send_command_error(session_id, reject_reason)
+            else:
+                transport.emit('command_pending', {
+                    'request_id': request_id,
+                    'command_name': handler.command_name,
+                    'timestamp': datetime.now().strftime('%H:%M:%S')
+                }, to=session_id)
+        else:
+            deliver_command_result(session_id, session.room, nickname, command_manager.execute_command(handler, command_data))
+    else:
+        # 普通聊天消息处理
+        message_data = {
+            'nickname': nickname,
+            'message': message,
+            'is_command': False
+        }
+        
+        # 广播消息到房间
+        broadcast_room_message(session.room, message_data)
+    
+    logger.debug("收到消息: %s: %s", nickname, message, extra=_EVENT_MESSAGE)
+
+@track_event('presence_sync')
+def handle_presence_sync(session_id):
+    """客户端发现在线名单版本不连续时请求完整快照"""
+    session = sessions.get(session_id)
+    if session is None:
+        return
+    transport.emit('presence_snapshot', presence.snapshot(session.room), to=session_id)
+
+@track_event('history_before')
+def handle_history_before(session_id, data):
+    """按游标向前翻页获取历史消息"""
+    session = sessions.get(session_id)
+    if session is None:
+        return
+    
+    cursor = data.get('cursor') if isinstance(data, dict) else None
+    if not isinstance(cursor, int):
+        transport.emit('error', {'message': '无效的历史消息游标'}, to=session_id)
+        return
+    limit = data.get('limit', HISTORY_BACKFILL)
+    limit = min(limit, HISTORY_BACKFILL) if isinstance(limit, int) else HISTORY_BACKFILL
+    
+    page = history.before(session.room, cursor, limit)
+    page['room'] = session.room
+    page['cursor'] = cursor
+    transport.emit('history_page', page, to=session_id)
+
+@track_event('command_suggest')
+def handle_command_suggest(session_id, data):
+    """输入命令时按前缀补全，结果通过确认回调直接返回"""
+    prefix = data.get('prefix') if isinstance(data, dict) else None
+    if not isinstance(prefix, str) or not prefix.startswith('@') or len(prefix) > 32:
+        return {'prefix': prefix, 'suggestions': []}
+    return {'prefix': prefix, 'suggestions': command_manager.suggest(prefix)}
+
+# 处理命令消息的响应
+@track_event('command_response')
+def handle_command_response(session_id, data):
+    session = sessions.get(session_id)
+    if session is None:
+        return
+    
+    message = data.get('message', '') if isinstance(data, dict) else ''
+    if not isinstance(message, str):
+        return
+    message = moderate(session_id, session.nickname, message)
+    if message is None:
+        return
+    
+    # 添加命令响应的标识和时间戳
+    response_data = {
+        'message': message,
+        'timestamp': datetime.now().strftime('%H:%M:%S'),
+        'is_command': True
+    }
+    
+    # 广播命令响应结果
+    transport.emit('command_response', response_data, to=session.room)
+
+def record_event_error(event, e):
+    """事件处理抛出异常时记录指标和日志"""
+    event_errors.inc(event or 'unknown')
+    logger.exception('WebSocket错误: %s', e)
+
+# 事件名称与处理函数，由入口注册到各自的 Socket.IO 服务器；connect 和 disconnect 的参数不同，单独注册
+HANDLERS = {
+    'logout': handle_logout,
+    'join': handle_join,
+    'switch_room': handle_switch_room,
+    'list_rooms': handle_list_rooms,
+    'send_message': handle_message,
+    'presence_sync': handle_presence_sync,
+    'history_before': handle_history_before,
+    'command_suggest': handle_command_suggest,
+    'command_response': handle_command_response,
+}
+
+def bind(transport_impl, executor):
+    """
+    绑定传输层和异步命令执行器，须在开始接受连接前调用
+    
+    Args:
+        transport_impl: services.transport 中的传输层实现
+        executor: 异步命令执行器（CommandExecutor 或 ThreadCommandExecutor）
+    """
+    global command_executor
+    transport.bind(transport_impl)
+    command_executor = executor
+
+def get_local_ip():
+    """获取局域网IP地址"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(('8.8.8.8', 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except:
+        return 'localhost'
+
+def check_socketio_client():
+    """
+    检查页面所需的 socket.io 客户端是否已放到 static/vendor/ 下
+
+    Raises:
+        RuntimeError: 缺少客户端且设置了 CHAT_SOCKETIO_CDN=0 不允许从 CDN 加载
+    """
+    name = 'vendor/' + socketio_client_name(SERIALIZER)
+    if static_assets.exists(name):
+        return
+    if not SOCKETIO_CDN:
+        raise RuntimeError(f"缺少 static/{name}，请执行 python -m services.static_assets --fetch-vendor 下载后"
+                           f"随代码分发，或去掉 CHAT_SOCKETIO_CDN=0 改从 CDN 加载")
+    logger.warning("缺少 static/%s，页面将从 CDN 加载 socket.io 客户端"
+                   "（离线部署请执行 python -m services.static_assets --fetch-vendor）", name)
+
+def start_services(port):
+    """
+    以脚本方式启动服务时调用：检查静态资源，从消息日志恢复历史和搜索索引并启动写入线程，
+    更新配置文件中的局域网地址并开始探测服务器
+    """
+    check_socketio_client()
+    if message_log:
+        message_log.recover(history, HISTORY_SIZE)
+        if search_index is not None:
+            for logged_room, logged_message in message_log.tail(SEARCH_MAX_DOCS):
+                search_index.add(logged_room, logged_message)
+            logger.info("已从消息日志建立搜索索引: %d 条消息", len(search_index))
+        message_log.start()
+    local_ip = get_local_ip()
+    logger.info("服务器启动在: http://localhost:%d", port)
+    logger.info("局域网地址: http://%s:%d", local_ip, port)
+    if STATE_BACKEND != 'memory':
+        # 各工作进程须共用同一组文件，启动时打印出来便于核对
+        logger.info("工作进程 %s 共享状态库: %s, 消息队列: %s, 消息日志: %s",
+                    WORKER_ID, STATE_DB, MESSAGE_QUEUE, MESSAGE_LOG or '未启用')
+    
+    # 更新配置文件中的局域网服务器地址，地址没有变化时不重写文件
+    def update_lan_server(config):
+        for server in config.get('servers', []):
+            if server['name'] == '局域网服务器1':
+                url = f"http://{local_ip}:{port}"
+                if server['url'] == url:
+                    return False
+                server['url'] = url
+                return True
+        return False
+
+    try:
+        config_store.update(update_lan_server)
+    except Exception as e:
+        logger.warning("更新配置文件失败: %s", e)
+    server_prober.start()
+
+def stop_services():
+    """停止后台探测，写完消息日志和日志队列"""
+    server_prober.stop()
+    if message_log:
+        message_log.stop()
+    log_writer.stop()
@@ -3,6 +3,18 @@ from abc import ABC, abstractmethod
 class CommandHandler(ABC):
     """命令处理器基类"""
     
+    # 是否在后台协程池中异步执行；异步命令先向发送者返回占位提示，
+    # 执行完成后通过 command_result 事件返回结果
+    is_async = False
+    # 异步执行的超时时间（秒）
+    timeout = 5.0
+    # 该命令同时执行的最大数量
+    max_concurrency = 50
+    # 命令别名，如 ('@movie',)；须写成字面量，以便不导入模块即可建立索引
+    aliases = ()
+    # 命令说明，用于输入命令时的自动补全提示
+    description = ''
+    
     def __init__(self):
         self.command_name = self.get_command_name()
     
@@ -1,9 +1,223 @@
 from commands.base import CommandHandler
+from utils.aho_corasick import AhoCorasick
+from utils.tfidf import TfidfIndex
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
 import re
+import threading
+
+logger = logging.getLogger('chat.commands')
+
+# 未匹配到知识库时的默认回答
+DEFAULT_REPLY = "抱歉，我现在还不能回答这个问题。如果你有关于学校位置或我的功能的问题，我很乐意为你解答！"
+
+# 问答缓存容量（以归一化后的问题为键）
+ANSWER_CACHE_SIZE = 1024
+
+# FAQ 问答数据文件，设为空串时只使用正则规则
+FAQ_PATH = os.environ.get(
+    'CHAT_CHUANNONG_FAQ',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'chuannong_faq.json')
+)
+# FAQ 检索的最低相似度，低于该值时改用正则规则
+FAQ_THRESHOLD = float(os.environ.get('CHAT_CHUANNONG_FAQ_THRESHOLD', 0.3))
+# 字符 n 元组的长度范围
+FAQ_NGRAM_RANGE = (2, 3)
+
+# 正则元字符，出现时打断字面量片段
+_REGEX_META = set('.^$*+?{}[]\\|()')
+_QUANTIFIERS = set('*+?{')
+# 内联 verbose 标志会改变空白字符的含义
+_VERBOSE_FLAG = re.compile(r'\(\?[aiLmsu-]*x')
+# {m}、{m,}、{,n}、{m,n} 形式的量词，其他写法的花括号按普通字符处理
+_BRACE_QUANTIFIER = re.compile(r'\{(?:\d+(?:,\d*)?|,\d*)\}')
+# 规则数少于该值时逐条校验比预筛选更快
+MATCHER_MIN_RULES = 16
+
+
+def _required_literal(pattern):
+    """
+    提取规则中必然出现的最长字面量片段，用作预筛选的锚点
+    
+    只考虑顶层（不在分组、字符集内）且不带量词的普通字符；规则顶层含有 | 或
+    使用了 verbose 标志时无法保证，返回空串表示该规则没有锚点，每次都需要校验。
+    """
+    if _VERBOSE_FLAG.search(pattern):
+        return ''
+    
+    best = ''
+    run = []
+    depth = 0
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            run = []
+            index += 2
+            continue
+        if char == '[':
+            # 跳过字符集，字符集开头的 ] 和转义字符不算结束
+            run = []
+            index += 1
+            if index < len(pattern) and pattern[index] == '^':
+                index += 1
+            if index < len(pattern) and pattern[index] == ']':
+                index += 1
+            while index < len(pattern) and pattern[index] != ']':
+                index += 2 if pattern[index] == '\\' else 1
+            index += 1
+            continue
+        if char == '{':
+            quantifier = _BRACE_QUANTIFIER.match(pattern, index)
+            if quantifier:
+                # 量词中的数字不是字面量，被修饰的字符已在前面按不一定出现处理
+                run = []
+                index = quantifier.end()
+                continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return ''
+        
+        if depth == 0 and char not in _REGEX_META and (char.isascii() or char.lower() == char.upper()):
+            next_char = pattern[index + 1] if index + 1 < len(pattern) else ''
+            if next_char in _QUANTIFIERS:
+                # 带量词的字符不一定出现
+                run = []
+            else:
+                run.append(char.lower())
+                if len(run) > len(best):
+                    best = ''.join(run)
+        else:
+            run = []
+        index += 1
+    return best
+
+
+class KnowledgeMatcher:
+    """
+    知识库编译后的匹配器
+    
+    加载时把每条规则编译一次，并用规则中必然出现的字面量构建 Aho-Corasick
+    自动机。匹配时对问题做一次线性扫描得到候选规则，再按知识库顺序逐条校验，
+    第一个命中的规则即为答案，与原先逐条 re.search 的"先匹配先返回"语义一致。
+    
+    规则数少于 min_rules 时扫描自动机的开销超过省下的校验，直接逐条校验编译好的规则。
+    """
+    
+    def __init__(self, knowledge_base, min_rules=MATCHER_MIN_RULES):
+        self._patterns = []
+        self._answers = []
+        self._anchors = AhoCorasick()
+        # 没有锚点、每次都需要校验的规则序号
+        self._unanchored = []
+        
+        for index, (pattern, answer) in enumerate(knowledge_base.items()):
+            self._patterns.append(re.compile(pattern, re.IGNORECASE))
+            self._answers.append(answer)
+            literal = _required_literal(pattern)
+            if literal:
+                self._anchors.add(literal, index)
+            else:
+                self._unanchored.append(index)
+        self._anchors.build()
+        self._use_anchors = len(self._patterns) >= min_rules
+    
+    def match(self, question):
+        """
+        匹配问题
+        
+        Returns:
+            str: 命中规则的回答，未命中时返回 None
+        """
+        if not self._use_anchors:
+            for pattern, answer in zip(self._patterns, self._answers):
+                if pattern.search(question):
+                    return answer
+            return None
+        candidates = {index for _, _, index in self._anchors.iter_matches(question.casefold())}
+        candidates.update(self._unanchored)
+        for index in sorted(candidates):
+            if self._patterns[index].search(question):
+                return self._answers[index]
+        return None
+    
+    def __len__(self):
+        return len(self._patterns)
+
+
+class FaqRetriever:
+    """
+    FAQ 问答检索
+    
+    数据文件是 JSON 列表，每项为 {"questions": [问法, ...], "answer": 回答}
+    （只有一种问法时也可以写成 "question": 问法）。每种问法作为一篇文档建立
+    字符 n 元组 TF-IDF 索引，查询时取相似度最高的问法对应的回答。
+    索引保存在数据文件旁的 .tfidf 文件中，数据文件内容不变时启动直接读取，不再重建。
+    
+    Args:
+        path: 数据文件路径
+        threshold: 最低相似度
+    """
+    
+    def __init__(self, path, threshold=FAQ_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        with open(path, 'rb') as f:
+            raw = f.read()
+        questions = []
+        # 各问法对应的回答序号
+        self._doc_answers = []
+        self._answers = []
+        for entry in json.loads(raw):
+            variants = entry.get('questions') or [entry['question']]
+            questions.extend(variants)
+            self._doc_answers.extend([len(self._answers)] * len(variants))
+            self._answers.append(entry['answer'])
+        
+        digest = hashlib.sha256(raw + repr(FAQ_NGRAM_RANGE).encode()).hexdigest()
+        index_path = f'{path}.tfidf'
+        self.index = TfidfIndex.load(index_path, digest)
+        if self.index is None or len(self.index) != len(questions):
+            self.index = TfidfIndex.build(questions, FAQ_NGRAM_RANGE)
+            try:
+                self.index.save(index_path, digest)
+            except OSError as e:
+                logger.warning("保存 FAQ 索引失败: %s", e)
+            logger.info("构建 FAQ 索引: %d 条问答，%d 种问法", len(self._answers), len(questions))
+    
+    def match(self, question):
+        """
+        检索问题
+        
+        Returns:
+            str: 相似度达到阈值的回答，否则返回 None
+        """
+        doc, score = self.index.best(question)
+        if doc is None or score < self.threshold:
+            return None
+        return self._answers[self._doc_answers[doc]]
+    
+    def __len__(self):
+        return len(self._answers)
+
 
 class ChuannongCommandHandler(CommandHandler):
     """川小农命令处理器"""
     
+    is_async = True
+    timeout = 3.0
+    aliases = ('@ai',)
+    description = '向川小农提问：@川小农 <你的问题>'
+    # FAQ 数据文件和最低相似度，见 FaqRetriever
+    faq_path = FAQ_PATH
+    faq_threshold = FAQ_THRESHOLD
+    
     def __init__(self):
         super().__init__()
         # 简单问答系统的知识库
@@ -25,6 +239,8 @@ class ChuannongCommandHandler(CommandHandler):
             r'.*谢谢.*': '不客气！有什么问题随时问我。',
             r'.*再见.*': '再见！祝你有美好的一天！'
         }
+        self._load_faq()
+        self._compile_knowledge_base()
     
     def get_command_name(self):
         """获取命令名称"""
@@ -60,15 +276,56 @@ class ChuannongCommandHandler(CommandHandler):
             'nickname': nickname  # 确保返回发送者昵称
         }
     
-    def _match_answer(self, question):
-        """从知识库中匹配回答"""
-        # 遍历知识库，使用正则表达式匹配问题
-        for pattern, answer in self.knowledge_base.items():
-            if re.search(pattern, question, re.IGNORECASE):
-                return answer
+    def _load_faq(self):
+        """加载 FAQ 检索，数据文件不存在或格式有误时只使用正则规则"""
+        self._faq = None
+        if not self.faq_path or not os.path.exists(self.faq_path):
+            return
+        try:
+            self._faq = FaqRetriever(self.faq_path, self.faq_threshold)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("加载 FAQ 数据失败，只使用正则规则: %s", e)
+    
+    def _compile_knowledge_base(self):
+        """编译知识库并清空问答缓存，修改 knowledge_base 后需要重新调用"""
+        self._matcher = KnowledgeMatcher(self.knowledge_base)
+        # {归一化后的问题: 回答}，按最近使用排序
+        self._answer_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize_question(question):
+        """
+        归一化问题：合并空白并转为小写，只用作缓存键
+
+        正则规则忽略大小写匹配，FAQ 检索忽略大小写和标点空白，同一个键的不同写法得到相同的回答；
+        含连续空白的规则例外，以第一次查询的写法为准。
+        """
+        return ' '.join(question.split()).lower()
+    
+    def _lookup_answer(self, question):
+        """先检索 FAQ，没有足够相似的问答时使用编译后的正则规则"""
+        reply = self._faq.match(question) if self._faq is not None else None
+        if reply is None:
+            reply = self._matcher.match(question)
         
         # 如果没有匹配到，返回默认回答
-        return "抱歉，我现在还不能回答这个问题。如果你有关于学校位置或我的功能的问题，我很乐意为你解答！"
+        return reply if reply is not None else DEFAULT_REPLY
+    
+    def _match_answer(self, question):
+        """从知识库中匹配回答，回答由原始问题计算，按归一化后的问题缓存"""
+        key = self._normalize_question(question)
+        with self._cache_lock:
+            reply = self._answer_cache.get(key)
+            if reply is not None:
+                self._answer_cache.move_to_end(key)
+                return reply
+        reply = self._lookup_answer(question)
+        with self._cache_lock:
+            self._answer_cache[key] = reply
+            if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                self._answer_cache.popitem(last=False)
+        return reply
     
     def format_response(self, message, success=True, **kwargs):
         """格式化响应"""
@@ -1,43 +1,238 @@
+import ast
 import os
 import importlib.util
 import sys
 import inspect
+import logging
+import threading
+import time
 from commands.base import CommandHandler
+from utils.prefix_trie import PrefixTrie
+
+logger = logging.getLogger('chat.commands')
+
+# commands 目录下不是命令模块的文件
+NON_COMMAND_FILES = ('__init__.py', 'base.py', 'command_manager.py')
+
+
+class CommandEntry:
+    """命令索引条目：命令名称对应的模块文件、处理器类名、别名和说明"""
+    __slots__ = ('command_name', 'module_name', 'path', 'class_name', 'mtime', 'aliases', 'description')
+
+    def __init__(self, command_name, module_name, path, class_name, mtime, aliases=(), description=''):
+        self.command_name = command_name
+        self.module_name = module_name
+        self.path = path
+        self.class_name = class_name
+        self.mtime = mtime
+        self.aliases = tuple(aliases)
+        self.description = description
+
+
+def scan_command_module(path):
+    """
+    不导入模块，通过语法树找出其中的命令处理器
+    
+    Returns:
+        tuple: ([(命令名称, 类名, 别名, 说明)], 是否存在无法静态确定名称的处理器)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    
+    found = []
+    dynamic = False
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        base_names = {base.id if isinstance(base, ast.Name) else getattr(base, 'attr', None) for base in node.bases}
+        if 'CommandHandler' not in base_names:
+            continue
+        command_name = None
+        attributes = {'aliases': (), 'description': ''}
+        for item in node.body:
+            # 别名和说明须为字面量类属性
+            if (isinstance(item, ast.Assign) and len(item.targets) == 1
+                    and isinstance(item.targets[0], ast.Name) and item.targets[0].id in attributes):
+                try:
+                    attributes[item.targets[0].id] = ast.literal_eval(item.value)
+                except ValueError:
+                    pass
+            if isinstance(item, ast.FunctionDef) and item.name == 'get_command_name':
+                returns = [stmt for stmt in ast.walk(item) if isinstance(stmt, ast.Return)]
+                if (len(returns) == 1 and isinstance(returns[0].value, ast.Constant)
+                        and isinstance(returns[0].value.value, str)):
+                    command_name = returns[0].value.value
+        if command_name is None:
+            dynamic = True
+        else:
+            found.append((command_name, node.name, attributes['aliases'], attributes['description']))
+    return found, dynamic
+
 
 class CommandManager:
-    """命令管理器"""
+    """
+    命令管理器
     
-    def __init__(self):
+    启动时只解析 commands 目录下各模块的语法树，建立"命令名称 → 模块"的索引，
+    模块在命令第一次被使用时才导入。文件修改时间发生变化时重新建立该文件的索引，
+    已加载的处理器在下次使用时重新导入，无需重启服务。
+    
+    Args:
+        commands_dir: 命令模块所在目录，默认为本文件所在目录
+        reload_interval: 检查文件变化的最短间隔（秒），为 None 时不热加载
+        on_executed: 每次执行命令后的回调 on_executed(命令名称, 耗时秒数, 是否成功)，用于统计
+        context: 传给命令的共享服务，如 {'search_index': SearchIndex}，命令通过 data['context'] 访问
+    """
+    
+    def __init__(self, commands_dir=None, reload_interval=2.0, on_executed=None, context=None):
+        self.commands_dir = commands_dir or os.path.dirname(os.path.abspath(__file__))
+        self.reload_interval = reload_interval
+        self.on_executed = on_executed
+        self.context = context if context is not None else {}
+        # 已实例化的命令处理器：{command_name: handler}
         self.command_handlers = {}
+        # 命令索引：{command_name: CommandEntry}
+        self._index = {}
+        # 已索引的文件：{path: mtime}
+        self._file_mtimes = {}
+        # 别名映射 {别名: 命令名称}、命令名称和别名的前缀树、未知命令提示，命令集合变化时重建
+        self._aliases = {}
+        self._trie = PrefixTrie().build()
+        self._unknown_hint = ""
+        self._last_check = 0.0
+        self._lock = threading.RLock()
         self._load_command_handlers()
     
     def _load_command_handlers(self):
-        """加载所有命令处理器"""
-        # 获取commands目录下的所有Python文件
-        import inspect
-        import sys
-        commands_dir = os.path.dirname(os.path.abspath(__file__))
-        for filename in os.listdir(commands_dir):
-            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'command_manager.py']:
-                module_name = filename[:-3]
-                try:
-                    # 动态导入模块，使用绝对路径并添加到sys.modules
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(commands_dir, filename))
-                    module = importlib.util.module_from_spec(spec)
-                    sys.modules[module_name] = module
-                    spec.loader.exec_module(module)
-                    
-                    # 查找并实例化CommandHandler的子类
-                    for name, obj in inspect.getmembers(module, inspect.isclass):
-                        if (issubclass(obj, CommandHandler) and 
-                            obj.__name__ != 'CommandHandler' and 
-                            obj.__module__ == module_name):
-                            handler = obj()
-                            self.command_handlers[handler.command_name] = handler
-                            print(f"已加载命令处理器: {handler.command_name}")
-                except Exception as e:
-                    print(f"加载命令处理器 {module_name} 失败: {e}")
+        """建立所有命令模块的索引"""
+        with self._lock:
+            for path, mtime in self._list_command_files().items():
+                self._index_file(path, mtime)
+            self._rebuild_lookup()
+            self._last_check = time.monotonic()
+        logger.info("已索引命令: %s", "、".join(self._index))
+    
+    def _list_command_files(self):
+        """commands 目录下所有命令模块文件及其修改时间"""
+        files = {}
+        for entry in os.scandir(self.commands_dir):
+            if entry.name.endswith('.py') and entry.name not in NON_COMMAND_FILES:
+                files[entry.path] = entry.stat().st_mtime
+        return files
+    
+    def _index_file(self, path, mtime):
+        """为单个模块文件建立索引，替换该文件原有的条目"""
+        self._drop_file(path)
+        self._file_mtimes[path] = mtime
+        module_name = os.path.basename(path)[:-3]
+        try:
+            found, dynamic = scan_command_module(path)
+        except (SyntaxError, UnicodeDecodeError, OSError) as e:
+            logger.error("解析命令模块 %s 失败: %s", module_name, e)
+            return
+        
+        for command_name, class_name, aliases, description in found:
+            self._index[command_name] = CommandEntry(command_name, module_name, path, class_name, mtime,
+                                                     aliases, description)
+        if dynamic:
+            # 命令名称无法静态确定的处理器只能导入后获取
+            for handler in self._import_handlers(module_name, path):
+                self._index[handler.command_name] = CommandEntry(
+                    handler.command_name, module_name, path, type(handler).__name__, mtime,
+                    handler.aliases, handler.description)
+                self.command_handlers[handler.command_name] = handler
 
+    def _rebuild_lookup(self):
+        """命令集合变化后重建别名映射、前缀树和未知命令提示"""
+        aliases = {}
+        trie = PrefixTrie()
+        for command_name, entry in self._index.items():
+            # 名称和别名对应同一个值，补全时每个命令只出现一次
+            trie.insert(command_name, command_name)
+            for alias in entry.aliases:
+                aliases[alias.casefold()] = command_name
+                trie.insert(alias, command_name)
+        self._aliases = aliases
+        self._trie = trie.build()
+        self._unknown_hint = "、".join(self._index.keys())
+    
+    def _drop_file(self, path):
+        """移除某个文件的所有索引条目和已加载的处理器"""
+        self._file_mtimes.pop(path, None)
+        for command_name in [name for name, entry in self._index.items() if entry.path == path]:
+            del self._index[command_name]
+            self.command_handlers.pop(command_name, None)
+    
+    def _import_handlers(self, module_name, path, class_name=None):
+        """导入模块并实例化其中的命令处理器，class_name 为 None 时实例化全部"""
+        try:
+            # 动态导入模块，使用绝对路径并添加到sys.modules
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            
+            # 查找并实例化CommandHandler的子类
+            handlers = []
+            for name, obj in inspect.getmembers(module, inspect.isclass):
+                if (issubclass(obj, CommandHandler) and 
+                    obj.__name__ != 'CommandHandler' and 
+                    obj.__module__ == module_name and
+                    class_name in (None, name)):
+                    handlers.append(obj())
+            return handlers
+        except Exception as e:
+            logger.exception("加载命令处理器 %s 失败: %s", module_name, e)
+            return []
+    
+    def check_reload(self, force=False):
+        """
+        检查命令模块是否有新增、修改或删除，并更新索引
+        
+        Returns:
+            bool: 索引是否发生变化
+        """
+        now = time.monotonic()
+        if not force and (self.reload_interval is None or now - self._last_check < self.reload_interval):
+            return False
+        
+        with self._lock:
+            self._last_check = now
+            files = self._list_command_files()
+            changed = False
+            for path in list(self._file_mtimes):
+                if path not in files:
+                    logger.info("命令模块已删除: %s", path)
+                    self._drop_file(path)
+                    changed = True
+            for path, mtime in files.items():
+                if self._file_mtimes.get(path) != mtime:
+                    logger.info("重新加载命令模块: %s", path)
+                    self._index_file(path, mtime)
+                    changed = True
+            if changed:
+                self._rebuild_lookup()
+            return changed
+    
+    def get_handler(self, command_name):
+        """获取命令处理器（支持别名），第一次使用时导入对应模块"""
+        self.check_reload()
+        command_name = self._aliases.get(command_name.casefold(), command_name)
+        handler = self.command_handlers.get(command_name)
+        if handler is not None:
+            return handler
+        
+        entry = self._index.get(command_name)
+        if entry is None:
+            return None
+        with self._lock:
+            handler = self.command_handlers.get(command_name)
+            if handler is None:
+                for loaded in self._import_handlers(entry.module_name, entry.path, entry.class_name):
+                    self.command_handlers[loaded.command_name] = loaded
+                    logger.info("已加载命令处理器: %s", loaded.command_name)
+                handler = self.command_handlers.get(command_name)
+        return handler
     
     def process_command(self, command_text, user_data):
         """
@@ -53,16 +248,32 @@ class CommandManager:
         if not command_text.startswith('@'):
             return None
         
+        handler, data, error = self.prepare_command(command_text, user_data)
+        if error:
+            return error
+        return self.execute_command(handler, data)
+    
+    def prepare_command(self, command_text, user_data):
+        """
+        解析并验证命令，不执行
+        
+        Args:
+            command_text: 以 @ 开头的命令文本
+            user_data: 用户数据
+            
+        Returns:
+            tuple: (命令处理器, 命令数据, 错误结果)，验证失败时前两项为 None
+        """
         # 解析命令名称和参数
         parts = command_text.split(' ', 1)
         command_name = parts[0]
         command_args = parts[1] if len(parts) > 1 else ''
         
         # 检查是否存在对应的命令处理器
-        handler = self.command_handlers.get(command_name)
+        handler = self.get_handler(command_name)
         if not handler:
-            return {
-                'message': f'未知命令: {command_name}，可用命令: {"、".join(self.command_handlers.keys())}',
+            return None, None, {
+                'message': f'未知命令: {command_name}，可用命令: {self._unknown_hint}',
                 'success': False,
                 'is_command': True
             }
@@ -71,21 +282,64 @@ class CommandManager:
         data = {
             'user': user_data,
             'args': command_args,
-            'full_text': command_text
+            'full_text': command_text,
+            'context': self.context
         }
         
-        # 验证并执行命令
+        # 验证命令
         is_valid, error_msg = handler.validate(data)
         if not is_valid:
-            return handler.format_response(error_msg, success=False)
+            return None, None, handler.format_response(error_msg, success=False)
+        return handler, data, None
+    
+    def execute_command(self, handler, data):
+        """
+        执行已通过验证的命令
         
+        Returns:
+            dict: 命令执行结果
+        """
+        start = time.perf_counter()
+        success = False
         try:
             result = handler.execute(data)
             result['is_command'] = True
+            success = result.get('success', True)
             return result
         except Exception as e:
+            logger.exception("执行命令 %s 出错", handler.command_name)
             return handler.format_response(f'执行命令时出错: {str(e)}', success=False)
+        finally:
+            # 超时等 BaseException 也会经过这里，按失败统计
+            if self.on_executed is not None:
+                self.on_executed(handler.command_name, time.perf_counter() - start, success)
     
+    def suggest(self, prefix, limit=10):
+        """
+        按前缀补全命令名称和别名
+
+        Args:
+            prefix: 用户已输入的命令前缀，如 '@电'
+            limit: 最多返回的条数
+
+        Returns:
+            list: [{'command': 命令名称, 'alias': 名称不匹配时匹配到的别名，否则为 None,
+                    'aliases': 全部别名, 'description': 命令说明}]，每个命令只出现一次
+        """
+        self.check_reload()
+        folded = prefix.casefold()
+        suggestions = []
+        for command_name in self._trie.complete(prefix)[:limit]:
+            entry = self._index.get(command_name)
+            if entry is None:
+                continue
+            alias = None
+            if not command_name.casefold().startswith(folded):
+                alias = next((name for name in entry.aliases if name.casefold().startswith(folded)), None)
+            suggestions.append({'command': command_name, 'alias': alias, 'aliases': list(entry.aliases),
+                                'description': entry.description})
+        return suggestions
+
     def get_available_commands(self):
         """
         获取所有可用命令
@@ -93,4 +347,5 @@ class CommandManager:
         Returns:
             list: 可用命令列表
         """
-        return list(self.command_handlers.keys())
\ No newline at end of file
+        self.check_reload()
+        return list(self._index.keys())
\ No newline at end of file
@@ -1,9 +1,58 @@
+import http.client
+import ipaddress
 import re
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from commands.base import CommandHandler
+from utils.http_pool import HTTPConnectionPool
+from utils.ttl_cache import TTLCache
+
+# 探测请求的请求头
+PROBE_HEADERS = {'User-Agent': 'DaiP-Chat-LinkProbe/1.0', 'Accept': '*/*'}
+# 最多跟随的重定向次数
+MAX_REDIRECTS = 3
+# 元数据中 Content-Type 的格式（type/subtype），不符合时不返回
+CONTENT_TYPE_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9!#$&.+^_-]*/[A-Za-z0-9][A-Za-z0-9!#$&.+^_-]*$')
+
+
+def normalize_url(url):
+    """归一化URL作为缓存键：补全协议、小写协议和主机、去掉默认端口和锚点"""
+    if '://' not in url:
+        url = f'http://{url}'
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if parts.port and parts.port != {'http': 80, 'https': 443}.get(scheme):
+        netloc = f'{host}:{parts.port}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
 
 class MovieCommandHandler(CommandHandler):
     """电影命令处理器"""
     
+    is_async = True
+    timeout = 5.0
+    aliases = ('@movie',)
+    description = '分享电影链接：@电影 <电影URL>'
+    # 单次分享探测链接的总耗时上限（秒）
+    probe_budget = 3.0
+    # 探测结果缓存：可访问的链接缓存 10 分钟，失败的链接缓存 1 分钟
+    cache_size = 1024
+    cache_ttl = 600
+    failure_ttl = 60
+    # 是否允许探测本机、内网等非公网地址（只用于本地测试）
+    allow_private = False
+    
+    def __init__(self):
+        super().__init__()
+        self._http = HTTPConnectionPool()
+        self._cache = TTLCache(self.cache_size, self.cache_ttl)
+        # 正在探测的链接：{url: Event}，同一链接同时只发起一次探测
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+    
     def get_command_name(self):
         """获取命令名称"""
         return '@电影'
@@ -37,19 +86,148 @@ class MovieCommandHandler(CommandHandler):
         url = data['args'].strip()
         nickname = data['user'].get('nickname', '用户')
         
-        # 在实际项目中，这里可以添加更多电影URL处理逻辑
-        # 比如解析视频类型、提取缩略图等
+        # 探测链接的可访问性、类型和大小，结果按归一化URL缓存
+        movie_meta = self.probe(url)
         
         # 返回电影播放信息，添加command_type字段以便前端正确识别
         return {
             'message': f'{nickname} 分享了一部电影',
             'movie_url': url,
+            'movie_meta': movie_meta,
             'command_name': self.command_name,
             'command_type': 'movie',  # 添加command_type字段
             'nickname': nickname,  # 确保返回发送者昵称
             'user_question': f"{self.command_name} {url}"  # 添加用户原始问题
         }
     
+    def probe(self, url):
+        """
+        获取链接元数据，命中缓存时不发起任何请求
+        
+        Returns:
+            dict: {'reachable', 'status', 'content_type', 'size', 'final_url'}
+        """
+        key = normalize_url(url)
+        meta = self._cache.get(key)
+        if meta is not None:
+            return meta
+        
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        
+        if not leader:
+            # 其他用户正在探测同一链接，等待其结果
+            event.wait(self.probe_budget)
+            return self._cache.get(key) or self._unknown_meta(key)
+        
+        try:
+            meta = self._fetch_meta(key)
+            self._cache.set(key, meta, self.cache_ttl if meta['reachable'] else self.failure_ttl)
+            return meta
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+    
+    @staticmethod
+    def _unknown_meta(url):
+        return {'reachable': None, 'status': None, 'content_type': None, 'size': None, 'final_url': url}
+    
+    def _is_allowed_address(self, ip):
+        """只允许公网地址，IPv4 映射的 IPv6 地址按其中的 IPv4 地址判断"""
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if self.allow_private:
+            return not ip.is_unspecified
+        return ip.is_global and not ip.is_multicast
+    
+    def _resolve_allowed(self, host):
+        """
+        解析主机名并检查全部地址，避免被用来访问服务器本机或校园内网的服务
+        
+        Returns:
+            str: 用于连接的 IP 地址；解析失败或任一地址不允许访问时返回 None
+        """
+        if not host:
+            return None
+        try:
+            addresses = [info[4][0] for info in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)]
+        except (OSError, UnicodeError):
+            return None
+        if not addresses:
+            return None
+        for address in addresses:
+            try:
+                ip = ipaddress.ip_address(address.split('%')[0])
+            except ValueError:
+                return None
+            if not self._is_allowed_address(ip):
+                return None
+        return addresses[0]
+    
+    def _fetch_meta(self, url):
+        """
+        HEAD 请求获取元数据，服务器不支持时改用只取 1 字节的 Range 请求
+        
+        每一跳（包括重定向）都先解析并检查地址，再直接连接检查过的 IP，
+        请求时不会再次解析域名，DNS 重绑定无法绕过检查。
+        """
+        meta = self._unknown_meta(url)
+        deadline = time.monotonic() + self.probe_budget
+        method = 'HEAD'
+        address = None
+        for _ in range(MAX_REDIRECTS + 2):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if address is None:
+                parts = urlsplit(url)
+                if parts.scheme not in ('http', 'https'):
+                    break
+                address = self._resolve_allowed(parts.hostname)
+                if address is None:
+                    break
+            headers = dict(PROBE_HEADERS)
+            if method == 'GET':
+                headers['Range'] = 'bytes=0-0'
+            try:
+                status, response_headers = self._http.request(method, url, headers, timeout=remaining,
+                                                              address=address)
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                meta['reachable'] = False
+                meta['error'] = type(e).__name__
+                break
+            
+            if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                url = urljoin(url, response_headers['location'])
+                # 重定向目标重新解析和检查
+                address = None
+                continue
+            if method == 'HEAD' and status in (403, 405, 501):
+                method = 'GET'
+                continue
+            
+            meta['status'] = status
+            meta['reachable'] = status < 400
+            meta['final_url'] = url
+            content_type = response_headers.get('content-type', '').split(';')[0].strip()
+            meta['content_type'] = content_type if CONTENT_TYPE_PATTERN.match(content_type) else None
+            meta['size'] = self._content_size(status, response_headers)
+            break
+        return meta
+    
+    @staticmethod
+    def _content_size(status, headers):
+        """从 Content-Range（206 响应）或 Content-Length 中取得完整大小"""
+        if status == 206:
+            total = headers.get('content-range', '').rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        length = headers.get('content-length', '')
+        return int(length) if length.isdigit() else None
+    
     def format_response(self, message, success=True, **kwargs):
         """格式化响应"""
         response = super().format_response(message, success)
@@ -0,0 +1,81 @@
+import re
+from commands.base import CommandHandler
+from services.search_index import tokenize
+
+# 末尾的页码，如 '@搜索 电影 #2'
+_PAGE_SUFFIX = re.compile(r'\s+#(\d+)$')
+
+
+class SearchCommandHandler(CommandHandler):
+    """搜索命令处理器：在当前房间的聊天记录中搜索关键词，结果只发送给搜索者"""
+
+    aliases = ('@search',)
+    description = '搜索聊天记录：@搜索 <关键词> [#页码]'
+    # 每页的结果条数
+    page_size = 5
+    # 最多翻到的页数
+    max_page = 20
+
+    def get_command_name(self):
+        """获取命令名称"""
+        return '@搜索'
+
+    def parse(self, args):
+        """
+        解析关键词和页码
+
+        Returns:
+            tuple: (关键词, 页码)
+        """
+        args = args.strip()
+        page = 1
+        match = _PAGE_SUFFIX.search(args)
+        if match:
+            page = int(match.group(1))
+            args = args[:match.start()].strip()
+        return args, page
+
+    def validate(self, data):
+        """验证命令数据"""
+        is_valid, error_msg = super().validate(data)
+        if not is_valid:
+            return is_valid, error_msg
+
+        if (data.get('context') or {}).get('search_index') is None:
+            return False, "搜索功能未启用"
+
+        query, page = self.parse(data.get('args', ''))
+        if not query:
+            return False, f"用法: {self.command_name} <关键词> [#页码]"
+        if not tokenize(query):
+            return False, "关键词太短，中文请至少输入两个字"
+        if not 1 <= page <= self.max_page:
+            return False, f"页码须在 1 到 {self.max_page} 之间"
+        return True, None
+
+    def execute(self, data):
+        """执行命令"""
+        query, page = self.parse(data['args'])
+        room = data['user'].get('room')
+        found = data['context']['search_index'].search(
+            query, room, offset=(page - 1) * self.page_size, limit=self.page_size
+        )
+
+        if found['results']:
+            message = f'“{query}” 的搜索结果（第 {page} 页）'
+        elif page > 1:
+            message = f'“{query}” 没有更多结果了'
+        else:
+            message = f'没有找到包含 “{query}” 的消息'
+        return {
+            'message': message,
+            'command_name': self.command_name,
+            'command_type': 'search',
+            # 搜索结果只发送给搜索者，不广播到房间
+            'private': True,
+            'query': query,
+            'page': page,
+            'has_more': found['has_more'],
+            'truncated': found['truncated'],
+            'results': found['results']
+        }
@@ -0,0 +1,61 @@
+import threading
+
+
+class BroadcastCoalescer:
+    """
+    房间消息合并广播
+
+    同一房间在时间窗口内的消息先缓存起来，窗口结束或缓存达到上限时合并为一个
+    message_batch 事件发出，每个客户端只收到一帧。窗口为 0 时退化为逐条发送
+    new_message，与原先的行为一致。
+
+    Args:
+        transport: 传输层（Transport），用于发送事件和启动定时发送任务
+        window: 合并窗口（秒）
+        max_batch: 单批最多消息数，达到后立即发送
+    """
+
+    def __init__(self, transport, window=0.02, max_batch=50):
+        self.transport = transport
+        self.window = window
+        self.max_batch = max_batch
+        # {room: [message_data, ...]}
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def emit(self, room, message_data):
+        """发送一条房间消息，开启合并时先进入缓存"""
+        if not self.enabled:
+            self.transport.emit('new_message', message_data, to=room)
+            return
+
+        with self._lock:
+            buffer = self._buffers.get(room)
+            if buffer is None:
+                buffer = self._buffers[room] = []
+                # 每个窗口只为房间启动一个定时发送任务
+                self.transport.start_background_task(self._flush_later, room)
+            buffer.append(message_data)
+            full = len(buffer) >= self.max_batch
+        if full:
+            self.flush(room)
+
+    def flush(self, room=None):
+        """立即发送指定房间（默认所有房间）缓存的消息"""
+        with self._lock:
+            if room is None:
+                batches = self._buffers
+                self._buffers = {}
+            else:
+                buffer = self._buffers.pop(room, None)
+                batches = {room: buffer} if buffer else {}
+        for target, messages in batches.items():
+            self.transport.emit('message_batch', {'messages': messages}, to=target)
+
+    def _flush_later(self, room):
+        self.transport.sleep(self.window)
+        self.flush(room)
@@ -0,0 +1,175 @@
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('chat.commands')
+
+
+class CommandExecutor:
+    """
+    异步命令执行器
+
+    异步命令在有界的绿色线程池中执行，不阻塞发送者的事件处理。每条命令受
+    处理器声明的超时时间约束，并同时限制每个用户和每个命令的并发数量。
+
+    Args:
+        command_manager: 命令管理器
+        pool_size: 线程池大小，池满时拒绝新命令
+        max_per_user: 每个用户同时执行的命令数上限
+    """
+
+    def __init__(self, command_manager, pool_size=100, max_per_user=2):
+        self.command_manager = command_manager
+        self.pool_size = pool_size
+        self.pool = self._create_pool(pool_size)
+        self.max_per_user = max_per_user
+        # {用户标识: 执行中的命令数}
+        self._running_by_user = {}
+        # {命令名称: 执行中的命令数}
+        self._running_by_command = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, handler, data, user_key, on_done):
+        """
+        提交命令
+
+        Args:
+            handler: 已验证的命令处理器
+            data: 命令数据
+            user_key: 用户标识，用于并发限制
+            on_done: 完成回调 on_done(request_id, result)，在后台线程中调用
+
+        Returns:
+            tuple: (请求编号, 错误消息)，被拒绝时请求编号为 None
+        """
+        command_name = handler.command_name
+        with self._lock:
+            if self._free() == 0:
+                return None, '服务器繁忙，请稍后再试'
+            if self._running_by_user.get(user_key, 0) >= self.max_per_user:
+                return None, '你的命令还在执行中，请稍后再试'
+            if self._running_by_command.get(command_name, 0) >= handler.max_concurrency:
+                return None, f'{command_name} 使用人数过多，请稍后再试'
+
+            request_id = next(self._ids)
+            self._running_by_user[user_key] = self._running_by_user.get(user_key, 0) + 1
+            self._running_by_command[command_name] = self._running_by_command.get(command_name, 0) + 1
+        self._spawn(self._run, request_id, handler, data, user_key, on_done)
+        return request_id, None
+
+    def _create_pool(self, pool_size):
+        # 在用到时才导入 eventlet，asyncio 入口使用 ThreadCommandExecutor 时不需要安装 eventlet
+        import eventlet
+        return eventlet.GreenPool(pool_size)
+
+    def _free(self):
+        return self.pool.free()
+
+    def _spawn(self, func, *args):
+        self.pool.spawn_n(func, *args)
+
+    def _run(self, request_id, handler, data, user_key, on_done):
+        import eventlet
+        # eventlet.Timeout 继承自 BaseException，不会被命令内部的 except Exception 吞掉
+        timer = eventlet.Timeout(handler.timeout)
+        try:
+            result = self.command_manager.execute_command(handler, data)
+        except eventlet.Timeout as e:
+            if e is not timer:
+                raise
+            logger.warning("命令执行超时: %s (%.1fs)", handler.command_name, handler.timeout)
+            result = handler.format_response('命令执行超时，请稍后再试', success=False)
+        finally:
+            timer.cancel()
+            self._release(user_key, handler.command_name)
+
+        try:
+            on_done(request_id, result)
+        except Exception:
+            logger.exception("处理命令结果出错: %s", handler.command_name)
+
+    def _release(self, user_key, command_name):
+        with self._lock:
+            for counter, key in ((self._running_by_user, user_key), (self._running_by_command, command_name)):
+                remaining = counter.get(key, 0) - 1
+                if remaining > 0:
+                    counter[key] = remaining
+                else:
+                    counter.pop(key, None)
+
+    def stats(self):
+        running = self.pool_size - self._free()
+        return {
+            'running': running,
+            'free': self.pool_size - running,
+            'by_command': dict(self._running_by_command)
+        }
+
+
+class ThreadCommandExecutor(CommandExecutor):
+    """
+    使用系统线程池的异步命令执行器，供 asyncio 入口使用
+
+    并发限制与 CommandExecutor 相同。系统线程无法像绿色线程那样从外部中断，
+    超时后先向用户返回超时提示，命令在线程中实际结束后才释放并发额度，
+    之后返回的结果被丢弃。完成回调通过 call_soon 交回事件循环执行，
+    房间广播、历史记录和搜索索引仍然只在事件循环中修改。
+
+    Args:
+        command_manager: 命令管理器
+        pool_size: 线程池大小，池满时拒绝新命令
+        max_per_user: 每个用户同时执行的命令数上限
+        call_soon: 在事件循环中执行回调的函数 call_soon(func, *args)，默认在当前线程直接调用
+    """
+
+    def __init__(self, command_manager, pool_size=100, max_per_user=2, call_soon=None):
+        super().__init__(command_manager, pool_size, max_per_user)
+        self.call_soon = call_soon or (lambda func, *args: func(*args))
+        self._running = 0
+
+    def _create_pool(self, pool_size):
+        return ThreadPoolExecutor(pool_size, thread_name_prefix='command')
+
+    def _free(self):
+        return self.pool_size - self._running
+
+    def _spawn(self, func, *args):
+        with self._lock:
+            self._running += 1
+        self.pool.submit(func, *args)
+
+    def _run(self, request_id, handler, data, user_key, on_done):
+        delivered = threading.Lock()
+
+        def deliver(result):
+            # 结果和超时提示只送达先到的一个
+            if delivered.acquire(blocking=False):
+                self.call_soon(self._deliver, handler, on_done, request_id, result)
+
+        def expire():
+            logger.warning("命令执行超时: %s (%.1fs)", handler.command_name, handler.timeout)
+            deliver(handler.format_response('命令执行超时，请稍后再试', success=False))
+
+        timer = threading.Timer(handler.timeout, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = self.command_manager.execute_command(handler, data)
+        finally:
+            timer.cancel()
+            self._release(user_key, handler.command_name)
+            with self._lock:
+                self._running -= 1
+        deliver(result)
+
+    @staticmethod
+    def _deliver(handler, on_done, request_id, result):
+        try:
+            on_done(request_id, result)
+        except Exception:
+            logger.exception("处理命令结果出错: %s", handler.command_name)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,289 @@
+import json
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# 缓冲区头部淘汰的条数达到该值且超过一半时压缩列表
+_COMPACT_MIN = 64
+
+
+class _RoomBuffer:
+    """
+    单个房间的消息缓冲区
+
+    编号、消息和时间戳存放在三个并行列表中，有效部分从下标 start 开始：淘汰最旧的消息
+    只移动 start，头部积累到一定数量后再统一删除。列表支持 O(1) 下标访问，按编号二分查找
+    是 O(log n)（deque 的下标访问是 O(n)）。
+    """
+    __slots__ = ('ids', 'messages', 'stamps', 'start', 'last_id', 'size')
+
+    def __init__(self, last_id=0):
+        # 消息编号、对应的紧凑 JSON 字符串和毫秒时间戳，按编号递增排列
+        self.ids = []
+        self.messages = []
+        self.stamps = []
+        self.start = 0
+        # 本进程已知的最新消息编号
+        self.last_id = last_id
+        # 缓冲区占用的字符数
+        self.size = 0
+
+    def __len__(self):
+        return len(self.ids) - self.start
+
+    def popleft(self):
+        """淘汰最旧的一条消息"""
+        self.size -= len(self.messages[self.start])
+        self.messages[self.start] = None
+        self.start += 1
+        if self.start >= _COMPACT_MIN and self.start * 2 >= len(self.ids):
+            del self.ids[:self.start]
+            del self.messages[:self.start]
+            del self.stamps[:self.start]
+            self.start = 0
+
+
+class SQLiteMessageIds:
+    """
+    多进程共享的房间消息编号
+
+    每个房间一行计数器，分配编号时在一条语句中原子递增，所有工作进程分配的编号
+    在房间内唯一且连续，客户端可以直接按编号去重和补齐。
+
+    Args:
+        path: SQLite 数据库文件路径（与共享状态库相同即可）
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS message_ids ('
+            'room TEXT PRIMARY KEY, '
+            'last_id INTEGER NOT NULL)'
+        )
+
+    def next_id(self, room):
+        """分配房间的下一个消息编号"""
+        return self._conn.execute(
+            'INSERT INTO message_ids (room, last_id) VALUES (?, 1) '
+            'ON CONFLICT (room) DO UPDATE SET last_id = last_id + 1 RETURNING last_id', (room,)
+        ).fetchone()[0]
+
+    def last_id(self, room):
+        """房间最近分配的消息编号，没有消息时为 0"""
+        row = self._conn.execute('SELECT last_id FROM message_ids WHERE room = ?', (room,)).fetchone()
+        return row[0] if row else 0
+
+    def advance(self, room, last_id):
+        """保证之后分配的编号大于 last_id（从消息日志恢复时调用）"""
+        self._conn.execute(
+            'INSERT INTO message_ids (room, last_id) VALUES (?, ?) '
+            'ON CONFLICT (room) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)', (room, last_id)
+        )
+
+
+class MessageHistory:
+    """
+    按房间保存最近的聊天消息
+
+    每个房间一个环形缓冲区，同时限制消息条数和总字符数，超出时淘汰最旧的消息，
+    因此无论服务运行多久内存占用都保持不变。消息以紧凑 JSON 字符串保存，
+    每条消息带有房间内递增的编号 id，客户端用它作为翻页游标和去重依据。
+
+    单进程时编号在本进程内分配；多进程部署时传入共享的 message_ids（SQLiteMessageIds），
+    各工作进程分配的编号互不重复。缓冲区按编号查找，允许编号不连续
+    （其他工作进程的消息没有记录到本进程时），补齐时据此判断是否完整。
+
+    设置 max_age 时与消息日志的保留时长一致，读取前先淘汰超过时长的消息，
+    回放和补齐都不会返回日志中已经删除的消息。
+
+    房间名称可以任意创建，缓冲区的数量也有上限：最多保存 max_rooms 个房间，超出时
+    丢弃最久没有新消息的房间，消息全部过期的房间直接丢弃。本进程分配编号时，重新创建的
+    房间从被丢弃房间的最大编号之后继续，同一房间的编号不会倒退。
+
+    Args:
+        max_messages: 每个房间最多保存的消息条数
+        max_chars: 每个房间保存的消息总字符数上限
+        message_ids: 共享的消息编号分配器，为 None 时在本进程内分配
+        max_age: 消息保留时长（秒），为 0 时不按时间淘汰
+        max_rooms: 最多保存消息的房间数
+    """
+
+    def __init__(self, max_messages=500, max_chars=256 * 1024, message_ids=None, max_age=0, max_rooms=1000):
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.message_ids = message_ids
+        self.max_age = max_age
+        self.max_rooms = max_rooms
+        # {room: _RoomBuffer}，按最近写入排序
+        self._rooms = OrderedDict()
+        # 已丢弃房间的最大消息编号，本进程分配编号时新建的缓冲区从这里继续
+        self._id_floor = 0
+        self._lock = threading.Lock()
+
+    def _buffer(self, room):
+        """取得或创建房间的缓冲区并标记为最近使用，须持有锁"""
+        buffer = self._rooms.get(room)
+        if buffer is None:
+            while len(self._rooms) >= self.max_rooms:
+                self._drop(next(iter(self._rooms)))
+            buffer = self._rooms[room] = _RoomBuffer(self._id_floor)
+        else:
+            self._rooms.move_to_end(room)
+        return buffer
+
+    def _drop(self, room):
+        """丢弃房间的缓冲区，须持有锁"""
+        buffer = self._rooms.pop(room)
+        self._id_floor = max(self._id_floor, buffer.last_id)
+
+    def append(self, room, message_data):
+        """
+        记录一条消息，并把分配的编号写入 message_data['id']
+
+        Returns:
+            int: 消息编号
+        """
+        with self._lock:
+            buffer = self._buffer(room)
+            if self.message_ids is not None:
+                message_id = self.message_ids.next_id(room)
+            else:
+                message_id = buffer.last_id + 1
+            message_data['id'] = message_id
+            self._insert(buffer, message_data)
+        return message_id
+
+    def record(self, room, message_data):
+        """
+        记录一条已分配编号的消息（其他工作进程广播的消息），编号已存在时忽略
+
+        Returns:
+            bool: 是否记录
+        """
+        message_id = message_data.get('id')
+        if not isinstance(message_id, int):
+            return False
+        with self._lock:
+            return self._insert(self._buffer(room), message_data)
+
+    def _insert(self, buffer, message_data):
+        """按编号顺序插入并淘汰超出上限的旧消息，须持有锁"""
+        message_id = message_data['id']
+        index = len(buffer.ids)
+        if len(buffer) and buffer.ids[-1] >= message_id:
+            # 其他进程的消息可能晚于本进程编号更大的消息到达
+            index = bisect_left(buffer.ids, message_id, buffer.start)
+            if index < len(buffer.ids) and buffer.ids[index] == message_id:
+                return False
+            if index == buffer.start and len(buffer) >= self.max_messages:
+                # 比缓冲区中所有消息都旧，且缓冲区已满
+                return False
+        encoded = json.dumps(message_data, ensure_ascii=False, separators=(',', ':'))
+        buffer.ids.insert(index, message_id)
+        buffer.messages.insert(index, encoded)
+        buffer.stamps.insert(index, message_data.get('ts', 0))
+        buffer.size += len(encoded)
+        buffer.last_id = max(buffer.last_id, message_id)
+        while len(buffer) and (len(buffer) > self.max_messages or buffer.size > self.max_chars):
+            buffer.popleft()
+        return True
+
+    def _expire(self, room, buffer):
+        """
+        淘汰超过保留时长的消息，消息全部过期时丢弃缓冲区，须持有锁
+
+        Returns:
+            _RoomBuffer: 缓冲区，已丢弃时返回 None
+        """
+        if self.max_age > 0:
+            cutoff = time.time() * 1000 - self.max_age * 1000
+            while len(buffer) and buffer.stamps[buffer.start] < cutoff:
+                buffer.popleft()
+            if not len(buffer):
+                self._drop(room)
+                return None
+        return buffer
+
+    def restore(self, room, messages):
+        """
+        用持久化的消息恢复房间缓冲区，之后的消息编号从最后一条消息继续递增
+
+        Args:
+            messages: 带编号 id 的消息列表
+        """
+        messages = sorted({message_data['id']: message_data for message_data in messages}.values(),
+                          key=lambda message_data: message_data['id'])
+        with self._lock:
+            if room in self._rooms:
+                self._drop(room)
+            buffer = self._buffer(room)
+            for message_data in messages:
+                self._insert(buffer, message_data)
+            if messages and self.message_ids is not None:
+                self.message_ids.advance(room, buffer.last_id)
+
+    def latest(self, room, limit):
+        """房间最近的 limit 条消息，按时间正序"""
+        return self.before(room, None, limit)['messages']
+
+    def before(self, room, cursor, limit):
+        """
+        获取编号小于 cursor 的最近 limit 条消息
+
+        Args:
+            cursor: 消息编号游标，None 表示从最新消息开始
+
+        Returns:
+            dict: {'messages': [...], 'has_more': 是否还有更早的消息}
+        """
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is not None:
+                buffer = self._expire(room, buffer)
+            if buffer is None or limit <= 0:
+                return {'messages': [], 'has_more': False}
+            end = len(buffer.ids) if cursor is None else bisect_left(buffer.ids, cursor, buffer.start)
+            start = max(buffer.start, end - limit)
+            encoded = buffer.messages[start:end]
+            has_more = start > buffer.start
+        return {'messages': [json.loads(item) for item in encoded], 'has_more': has_more}
+
+    def after(self, room, last_id, limit):
+        """
+        获取编号大于 last_id 的消息，用于断线重连后补齐
+
+        Returns:
+            dict: {'messages': [...], 'complete': 是否补齐了 last_id 之后的全部消息}，
+                  中间有消息已被淘汰、没有记录到本进程或超过 limit 条时 complete 为 False，messages 为空
+        """
+        latest = self.message_ids.last_id(room) if self.message_ids is not None else None
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is not None:
+                buffer = self._expire(room, buffer)
+            if latest is None:
+                latest = buffer.last_id if buffer is not None else self._id_floor
+            missed = latest - last_id
+            if missed < 0 or missed > limit:
+                return {'messages': [], 'complete': False}
+            if missed == 0:
+                return {'messages': [], 'complete': True}
+            if buffer is None:
+                return {'messages': [], 'complete': False}
+            # 编号在房间内唯一，last_id 之后的条数与编号差相等时说明中间没有缺失
+            start = bisect_right(buffer.ids, last_id, buffer.start)
+            if len(buffer.ids) - start != missed:
+                return {'messages': [], 'complete': False}
+            encoded = buffer.messages[start:]
+        return {'messages': [json.loads(item) for item in encoded], 'complete': True}
+
+    def stats(self):
+        """各房间保存的消息条数和字符数"""
+        with self._lock:
+            return {room: {'messages': len(buffer), 'chars': buffer.size}
+                    for room, buffer in self._rooms.items()}
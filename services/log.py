@@ -0,0 +1,167 @@
+import logging
+import sys
+
+try:
+    # eventlet 环境下使用未打补丁的线程和队列，日志写出在真实的系统线程中进行，
+    # 不会阻塞 eventlet 的事件循环
+    from eventlet import patcher
+    _threading = patcher.original('threading')
+    _queue = patcher.original('queue')
+except ImportError:  # pragma: no cover
+    import threading as _threading
+    import queue as _queue
+
+# LogRecord 自带的属性，其余属性视为结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class StructuredFormatter(logging.Formatter):
+    """在日志末尾追加 extra 传入的结构化字段，如 event=join sid=xxx"""
+
+    def __init__(self, fmt=LOG_FORMAT):
+        super().__init__(fmt)
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f'{key}={value}' for key, value in record.__dict__.items() if key not in _RECORD_ATTRS]
+        if fields:
+            line = f"{line} {' '.join(fields)}"
+        return line
+
+
+class EventSampler(logging.Filter):
+    """
+    按事件采样日志
+
+    rates 形如 {'send_message': 0.01}，表示 event=send_message 的日志每 100 条
+    保留 1 条。WARNING 及以上级别和没有 event 字段的日志不受影响。
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.intervals = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()}
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        interval = self.intervals.get(getattr(record, 'event', None))
+        if interval is None or interval == 1:
+            return True
+        if interval == 0:
+            return False
+        count = self._counters.get(record.event, 0)
+        self._counters[record.event] = count + 1
+        return count % interval == 0
+
+
+class BackgroundWriter:
+    """
+    后台日志写出线程
+
+    日志记录放入有界队列后立即返回，由独立的系统线程格式化并写出；
+    队列满时丢弃记录并计数，调用方永远不会被阻塞。
+    """
+
+    def __init__(self, stream=None, formatter=None, maxsize=10000):
+        self.stream = stream or sys.stderr
+        self.formatter = formatter or StructuredFormatter()
+        self.dropped = 0
+        self._queue = _queue.Queue(maxsize)
+        self._thread = None
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """写完队列中剩余的日志后停止"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except _queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except _queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            try:
+                self.stream.write(self.formatter.format(record) + '\n')
+                # 队列清空时才刷新，突发日志合并为一次写出
+                if self._queue.empty():
+                    self.stream.flush()
+            except Exception:
+                pass
+        self.stream.flush()
+
+
+class QueueLogHandler(logging.Handler):
+    """把日志记录交给 BackgroundWriter 的处理器"""
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        # 在调用方展开消息参数，避免后台线程读到之后被修改的对象
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.writer.put(record)
+
+
+def parse_sample_rates(text):
+    """解析 'send_message=0.01,join=0.5' 形式的采样配置"""
+    rates = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            event, rate = item.split('=', 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(level='INFO', sample_rates=None, stream=None):
+    """
+    配置聊天室日志
+
+    所有模块使用 'chat' 下的子日志器，日志经队列交给后台线程写出。
+
+    Args:
+        level: 日志级别名称
+        sample_rates: 按事件的采样率 {event: rate}
+        stream: 输出流，默认 stderr
+
+    Returns:
+        BackgroundWriter: 后台写出线程，可用于查看丢弃数或在退出时 stop()
+    """
+    writer = BackgroundWriter(stream)
+    handler = QueueLogHandler(writer)
+    if sample_rates:
+        handler.addFilter(EventSampler(sample_rates))
+
+    logger = logging.getLogger('chat')
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+        if isinstance(old_handler, QueueLogHandler):
+            old_handler.writer.stop()
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    writer.start()
+    return writer
@@ -0,0 +1,269 @@
+import json
+import logging
+import sqlite3
+import time
+
+try:
+    # 与日志写出相同，SQLite 写入放在未打补丁的系统线程中，不阻塞 eventlet 的事件循环
+    from eventlet import patcher
+    _threading = patcher.original('threading')
+    _queue = patcher.original('queue')
+except ImportError:  # pragma: no cover
+    import threading as _threading
+    import queue as _queue
+
+logger = logging.getLogger('chat.message_log')
+
+# fsync 策略对应的 SQLite synchronous 设置（WAL 模式）
+#   off: 不主动 fsync，交给操作系统，断电可能丢失最近的消息
+#   normal: 检查点时 fsync，进程崩溃不丢消息，断电可能丢失最后几批
+#   full: 每批提交都 fsync
+SYNC_MODES = {'off': 'OFF', 'normal': 'NORMAL', 'full': 'FULL'}
+# 清理过期消息时每个事务最多删除的条数，避免长时间占用写锁
+PRUNE_CHUNK = 5000
+
+
+class MessageLog:
+    """
+    写后持久化的聊天消息日志
+
+    append 只把消息放入内存队列就返回，不会阻塞消息广播；后台系统线程攒够
+    batch_size 条或等待 flush_interval 秒后，在一个事务中批量写入 SQLite（WAL 模式）。
+    日志只追加，重启时用 recover 从日志恢复各房间最近的消息。
+    队列满时丢弃消息并计数，写入失败时保留这一批稍后重试。
+
+    按条数和时长保留：写入线程每隔 prune_interval 秒从最旧的一端按 seq 分段删除
+    超出 max_messages 条或早于 max_age 秒的消息，删除释放的页由之后的写入复用，
+    文件大小随保留窗口稳定下来。启动恢复前也先清理一次，回放不会超出保留窗口。
+
+    Args:
+        path: SQLite 数据库文件路径
+        sync: fsync 策略，见 SYNC_MODES
+        batch_size: 每批最多写入的消息条数
+        flush_interval: 一批消息最长等待时间（秒）
+        maxsize: 队列容量
+        max_messages: 最多保留的消息条数，为 0 时不限
+        max_age: 消息保留时长（秒），为 0 时不限
+        prune_interval: 清理间隔（秒）
+    """
+
+    def __init__(self, path, sync='normal', batch_size=500, flush_interval=0.1, maxsize=100000,
+                 max_messages=0, max_age=0, prune_interval=60.0):
+        if sync not in SYNC_MODES:
+            raise ValueError(f'未知的 fsync 策略: {sync}')
+        self.path = path
+        self.sync = sync
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        # 每写入一批后调用 on_flush(条数, 最早一条消息的等待时间, 写入耗时)，在写入线程中执行
+        self.on_flush = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.pruned = 0
+        # 最近一批写入时最早一条消息从 append 到提交的时间（秒）
+        self.last_lag = 0.0
+        self._queue = _queue.Queue(maxsize)
+        self._thread = None
+        self._conn = self._connect()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'room TEXT NOT NULL, '
+            'id INTEGER NOT NULL, '
+            'ts INTEGER NOT NULL, '
+            'payload TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_room ON messages (room, seq)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={SYNC_MODES[self.sync]}')
+        return conn
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._run, name='message-log', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """写完队列中剩余的消息后停止"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except _queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def pending(self):
+        """队列中尚未写入的消息条数"""
+        return self._queue.qsize()
+
+    def append(self, room, message_data):
+        """
+        记录一条已分配编号的房间消息，立即返回
+
+        Returns:
+            bool: 是否放入了队列，队列满时返回 False
+        """
+        payload = json.dumps(message_data, ensure_ascii=False, separators=(',', ':'))
+        try:
+            self._queue.put_nowait((room, message_data['id'], message_data['ts'], payload, time.monotonic()))
+            return True
+        except _queue.Full:
+            self.dropped += 1
+            return False
+
+    def _next_batch(self):
+        """
+        取出下一批消息
+
+        Returns:
+            tuple: (消息列表, 是否收到停止信号)
+        """
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = item[4] + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except _queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except _queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        start = time.monotonic()
+        with self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('INSERT INTO messages (room, id, ts, payload) VALUES (?, ?, ?, ?)',
+                                   [item[:4] for item in batch])
+        now = time.monotonic()
+        self.written += len(batch)
+        self.last_lag = now - batch[0][4]
+        if self.on_flush is not None:
+            self.on_flush(len(batch), self.last_lag, now - start)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            retry_delay = 0.1
+            while batch:
+                try:
+                    self._write(batch)
+                    break
+                except Exception:
+                    self.errors += 1
+                    logger.exception("写入消息日志失败，%d 条消息稍后重试", len(batch))
+                    if stopping:
+                        break
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, 5.0)
+            if time.monotonic() >= self._next_prune:
+                try:
+                    self.prune()
+                except Exception:
+                    self.errors += 1
+                    logger.exception("清理过期消息失败")
+
+    def prune(self):
+        """
+        删除保留窗口之外的消息
+
+        Returns:
+            int: 删除的消息条数
+        """
+        self._next_prune = time.monotonic() + self.prune_interval
+        if self.max_messages <= 0 and self.max_age <= 0:
+            return 0
+        first_seq, last_seq = self._conn.execute('SELECT MIN(seq), MAX(seq) FROM messages').fetchone()
+        if first_seq is None:
+            return 0
+        # 删除 seq 不大于 bound 的消息
+        bound = last_seq - self.max_messages if self.max_messages > 0 else 0
+        if self.max_age > 0:
+            cutoff = int(time.time() * 1000) - int(self.max_age * 1000)
+            # 按 seq 顺序找到第一条未过期的消息，只扫描过期的部分
+            row = self._conn.execute(
+                'SELECT seq FROM messages WHERE ts >= ? ORDER BY seq LIMIT 1', (cutoff,)
+            ).fetchone()
+            bound = max(bound, row[0] - 1 if row else last_seq)
+        removed = 0
+        while first_seq <= bound:
+            chunk_end = min(bound, first_seq + PRUNE_CHUNK - 1)
+            with self._conn:
+                self._conn.execute('BEGIN')
+                removed += self._conn.execute('DELETE FROM messages WHERE seq <= ?', (chunk_end,)).rowcount
+            first_seq = chunk_end + 1
+        if removed:
+            self.pruned += removed
+            logger.info("已清理保留窗口之外的消息 %d 条", removed)
+        return removed
+
+    def tail(self, limit):
+        """
+        按写入顺序逐条读取最近 limit 条消息
+
+        Returns:
+            generator: (房间, 消息)
+        """
+        last_seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM messages').fetchone()[0]
+        cursor = self._conn.execute(
+            'SELECT room, payload FROM messages WHERE seq > ? ORDER BY seq', (last_seq - limit,)
+        )
+        for room, payload in cursor:
+            yield room, json.loads(payload)
+
+    def recover(self, history, limit):
+        """
+        启动时从日志恢复各房间最近的消息
+
+        WAL 中未完成的事务由 SQLite 在打开数据库时回滚，这里读到的都是完整提交的批次。
+        恢复前先清理保留窗口之外的消息。
+
+        Args:
+            history: MessageHistory 实例
+            limit: 每个房间最多恢复的消息条数
+
+        Returns:
+            int: 恢复的消息条数
+        """
+        self.prune()
+        restored = 0
+        rooms = []
+        room = self._conn.execute('SELECT MIN(room) FROM messages').fetchone()[0]
+        while room is not None:
+            # 按索引逐个跳到下一个房间，不扫描整张表
+            rooms.append(room)
+            room = self._conn.execute('SELECT MIN(room) FROM messages WHERE room > ?', (room,)).fetchone()[0]
+        # 房间数超过历史缓冲区的上限时只恢复最近有消息的房间，按时间先后恢复
+        last_seq = {room: self._conn.execute('SELECT MAX(seq) FROM messages WHERE room = ?', (room,)).fetchone()[0]
+                    for room in rooms}
+        rooms = sorted(rooms, key=last_seq.get)[-history.max_rooms:]
+        for room in rooms:
+            rows = self._conn.execute(
+                'SELECT payload FROM messages WHERE room = ? ORDER BY seq DESC LIMIT ?', (room, limit)
+            ).fetchall()
+            messages = [json.loads(payload) for payload, in reversed(rows)]
+            history.restore(room, messages)
+            restored += len(messages)
+        if restored:
+            logger.info("从消息日志恢复了 %d 个房间的 %d 条消息", len(rooms), restored)
+        return restored
@@ -0,0 +1,262 @@
+import bisect
+import math
+import time
+import weakref
+from functools import wraps
+
+try:
+    # 按系统线程分片，eventlet 入口中使用未打补丁的线程局部变量和锁（绿色线程共用所在系统线程的分片）
+    from eventlet import patcher
+    _threading = patcher.original('threading')
+except ImportError:  # pragma: no cover
+    import threading as _threading
+
+# 处理耗时的默认分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 扇出人数的默认分桶
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # 最后一个桶对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    def __init__(self, name, help_text, kind, labelnames):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+
+class _ShardOwner:
+    """保存在线程局部变量中，线程结束时随之释放，用弱引用判断分片的线程是否还在"""
+    __slots__ = ('__weakref__',)
+
+
+class _ShardedMetric(_Metric):
+    """
+    按系统线程分片记录的指标
+
+    每个系统线程写自己的分片，记录时不加锁；分片在线程第一次记录时登记到列表中，
+    取值时把各分片的副本相加。线程结束后它的分片并入 _retired，分片数量不随线程增长。
+    """
+
+    def __init__(self, name, help_text, kind, labelnames):
+        super().__init__(name, help_text, kind, labelnames)
+        self._local = _threading.local()
+        # [(线程局部 _ShardOwner 的弱引用, 分片)]，只在登记新分片和取值时加锁
+        self._shards = []
+        self._retired = {}
+        self._shards_lock = _threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            owner = self._local.owner = _ShardOwner()
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append((weakref.ref(owner), shard))
+            return shard
+
+    def _snapshots(self):
+        """
+        各分片的副本，已结束线程的分片先并入 _retired
+
+        dict.copy() 和 list() 复制时不执行 Python 代码，不会与写入线程交错，
+        副本中每个数值都是完整的。
+
+        Returns:
+            list: 分片副本列表
+        """
+        with self._shards_lock:
+            live = []
+            for owner, shard in self._shards:
+                if owner() is not None:
+                    live.append((owner, shard))
+                else:
+                    self._merge(self._retired, shard.copy())
+            self._shards = live
+            snapshots = [self._copy(self._retired)]
+            snapshots.extend(self._copy(shard) for _, shard in live)
+        return snapshots
+
+    def _totals(self):
+        totals = {}
+        for snapshot in self._snapshots():
+            self._merge(totals, snapshot)
+        return totals
+
+
+class Counter(_ShardedMetric):
+    def __init__(self, name, help_text, labelnames=()):
+        # 分片为 {标签值元组: 计数}
+        super().__init__(name, help_text, 'counter', labelnames)
+
+    def inc(self, *labels, amount=1):
+        values = self._shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    @staticmethod
+    def _copy(shard):
+        return shard.copy()
+
+    @staticmethod
+    def _merge(totals, shard):
+        for labels, value in shard.items():
+            totals[labels] = totals.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self._totals().items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram(_ShardedMetric):
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        # 分片为 {标签值元组: _Histogram}
+        super().__init__(name, help_text, 'histogram', labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        children = self._shard()
+        child = children.get(labels)
+        if child is None:
+            child = children[labels] = _Histogram(self.buckets)
+        child.observe(value)
+
+    def time(self, *labels):
+        """装饰器：记录函数执行耗时"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labels)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _copy(shard):
+        # 分桶计数和总和分别复制，记录中的那一次可能只计入其一
+        return {labels: (list(child.counts), child.sum) for labels, child in shard.copy().items()}
+
+    def _merge(self, totals, shard):
+        for labels, child in shard.items():
+            counts, total = (child.counts, child.sum) if isinstance(child, _Histogram) else child
+            merged = totals.get(labels)
+            if merged is None:
+                merged = totals[labels] = _Histogram(self.buckets)
+            merged.counts = [a + b for a, b in zip(merged.counts, counts)]
+            merged.sum += total
+
+    def samples(self):
+        for labels, child in self._totals().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labelnames, labels, ('le', _format_value(float(bound)))), cumulative)
+            yield f'{self.name}_sum', _format_labels(self.labelnames, labels), child.sum
+            yield f'{self.name}_count', _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge(_Metric):
+    """取值时调用回调函数，回调返回数值，或 {标签值元组: 数值}"""
+
+    def __init__(self, name, help_text, func, labelnames=()):
+        super().__init__(name, help_text, 'gauge', labelnames)
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            for labels, item in value.items():
+                yield self.name, _format_labels(self.labelnames, labels), item
+        elif value is not None:
+            yield self.name, '', value
+
+
+class MetricsRegistry:
+    """
+    Prometheus 文本格式的指标注册表
+
+    为了常开也不影响性能，计数器和直方图记录时不加锁。指标会在多个系统线程中记录和读取
+    （eventlet 入口的消息日志写入线程，asyncio 入口的命令线程池和渲染 /metrics 的 WSGI 线程），
+    因此按系统线程分片：每个线程只写自己的分片，同一系统线程上的协程只在 IO 处切换，
+    一次自增或一次 observe 中间不会被打断；渲染时复制各分片相加。
+    直方图的分桶在创建时确定，记录一次只需一次二分查找和两次加法。
+
+    Args:
+        prefix: 指标名称前缀
+    """
+
+    def __init__(self, prefix='chat_'):
+        self.prefix = prefix
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, func, labelnames=()):
+        return self._register(Gauge(self.prefix + name, help_text, func, labelnames))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """按 Prometheus 文本格式 0.0.4 输出全部指标"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def eventlet_hub_stats():
+    """eventlet 事件循环的定时器和监听的文件描述符数量"""
+    from eventlet import hubs
+    hub = hubs.get_hub()
+    return {
+        ('timers',): hub.get_timers_count(),
+        ('timers_canceled',): hub.timers_canceled,
+        ('readers',): len(hub.get_readers()),
+        ('writers',): len(hub.get_writers()),
+    }
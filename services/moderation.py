@@ -0,0 +1,199 @@
+import logging
+import os
+import time
+
+from utils.aho_corasick import AhoCorasick
+
+try:
+    # 重建自动机是纯计算，放在未打补丁的系统线程中，重建期间 eventlet 的事件循环照常处理消息
+    from eventlet import patcher
+    _threading = patcher.original('threading')
+except ImportError:  # pragma: no cover
+    import threading as _threading
+
+logger = logging.getLogger('chat.moderation')
+
+# 检查结果，后三者同时也是命中敏感词时的处理方式，按严重程度从低到高排列
+#   flag: 照常发送，记录日志供管理员复查
+#   mask: 敏感词替换为屏蔽字符后发送
+#   reject: 整条消息不发送
+ALLOW = 'allow'
+FLAG = 'flag'
+MASK = 'mask'
+REJECT = 'reject'
+ACTIONS = (FLAG, MASK, REJECT)
+
+# 全角字母数字和标点转半角、大写转小写，每个字符一一对应，命中位置可以直接用于原文打码
+_FOLD = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FOLD.update({code: code + 32 for code in range(ord('A'), ord('Z') + 1)})
+_FOLD.update({code + 0xFEE0: code + 32 for code in range(ord('A'), ord('Z') + 1)})
+_FOLD[0x3000] = ord(' ')
+
+
+def fold(text):
+    """敏感词匹配前的归一化，不改变文本长度"""
+    return text.translate(_FOLD)
+
+
+class WordFilter:
+    """
+    编译好的敏感词过滤器
+
+    所有敏感词构建为一个 Aho-Corasick 自动机，每条消息只做一次线性扫描，
+    耗时只与消息长度和命中数有关，与词表大小无关。每个敏感词可以单独指定
+    处理方式，一条消息命中多个敏感词时取最严重的一种，命中 reject 时立即停止扫描。
+
+    Args:
+        terms: {敏感词: 处理方式}
+        mask_char: 屏蔽字符
+    """
+
+    def __init__(self, terms, mask_char='*'):
+        self.mask_char = mask_char
+        self._automaton = AhoCorasick()
+        for term, action in terms.items():
+            self._automaton.add(fold(term), (term, action))
+        self._automaton.build()
+
+    def __len__(self):
+        return len(self._automaton)
+
+    def check(self, text):
+        """
+        检查一条消息
+
+        Returns:
+            tuple: (检查结果, 处理后的文本, 命中的敏感词列表)，检查结果为 ALLOW、FLAG、MASK 或 REJECT；
+                   MASK 时文本中 mask 类敏感词已被替换
+        """
+        if not len(self._automaton):
+            return ALLOW, text, []
+        matches = []
+        for start, end, (term, action) in self._automaton.iter_matches(fold(text)):
+            if action == REJECT:
+                return REJECT, text, [term]
+            matches.append((start, end, term, action))
+        if not matches:
+            return ALLOW, text, []
+
+        terms = list(dict.fromkeys(term for _, _, term, _ in matches))
+        spans = [(start, end) for start, end, _, action in matches if action == MASK]
+        if not spans:
+            return FLAG, text, terms
+        chars = list(text)
+        for start, end in spans:
+            # 重叠的命中重复打码即可
+            chars[start:end] = self.mask_char * (end - start)
+        return MASK, ''.join(chars), terms
+
+
+class Moderator:
+    """
+    从词表文件加载的敏感词过滤，文件变化时自动重新加载
+
+    词表为 UTF-8 文本，每行一个敏感词，# 开头的行和空行忽略。词后可以用制表符
+    分隔指定该词的处理方式（flag、mask 或 reject），未指定时使用 default_action。
+
+    检查时最多每隔 reload_interval 秒 stat 一次词表文件，修改时间或大小变化时
+    在后台线程中构建新的过滤器，构建完成后整体替换；构建期间继续使用旧的过滤器，
+    消息处理不会停顿。文件不存在时不过滤，之后创建文件也会自动加载。
+
+    Args:
+        path: 词表文件路径
+        default_action: 未指定处理方式的敏感词的处理方式
+        mask_char: 屏蔽字符
+        reload_interval: 检查文件变化的最短间隔（秒），为 None 时不热加载
+    """
+
+    def __init__(self, path, default_action=MASK, mask_char='*', reload_interval=2.0):
+        if default_action not in ACTIONS:
+            raise ValueError(f'未知的敏感词处理方式: {default_action}')
+        self.path = path
+        self.default_action = default_action
+        self.mask_char = mask_char
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        # 最近一次构建过滤器的耗时（秒）
+        self.last_build = 0.0
+        self._stamp = self._file_stamp()
+        self._filter = self._build()
+        self._last_check = time.monotonic()
+        self._loading = False
+        self._lock = _threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_terms(self):
+        terms = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    term, _, action = line.partition('\t')
+                    term, action = term.strip(), action.strip().lower() or self.default_action
+                    if action not in ACTIONS:
+                        logger.warning("敏感词表第 %d 行的处理方式无效，使用默认值: %s", line_number, action)
+                        action = self.default_action
+                    if term:
+                        terms[term] = action
+        except FileNotFoundError:
+            return {}
+        return terms
+
+    def _build(self):
+        start = time.perf_counter()
+        word_filter = WordFilter(self._read_terms(), self.mask_char)
+        self.last_build = time.perf_counter() - start
+        if len(word_filter):
+            logger.info("已加载敏感词 %d 个，耗时 %.2f s", len(word_filter), self.last_build)
+        return word_filter
+
+    def check_reload(self, force=False):
+        """
+        检查词表文件是否变化，变化时启动后台重新加载
+
+        Returns:
+            bool: 是否启动了重新加载
+        """
+        now = time.monotonic()
+        if not force and (self.reload_interval is None or now - self._last_check < self.reload_interval):
+            return False
+        with self._lock:
+            self._last_check = now
+            stamp = self._file_stamp()
+            if self._loading or (stamp == self._stamp and not force):
+                return False
+            self._loading = True
+        _threading.Thread(target=self._reload, args=(stamp,), name='moderation-reload', daemon=True).start()
+        return True
+
+    def _reload(self, stamp):
+        try:
+            self._filter = self._build()
+            self.reloads += 1
+            logger.info("敏感词表已重新加载: %s", self.path)
+        except Exception:
+            logger.exception("重新加载敏感词表失败，继续使用原词表: %s", self.path)
+        finally:
+            # 失败时同样记录文件状态，文件再次变化后才重试
+            with self._lock:
+                self._stamp = stamp
+                self._loading = False
+
+    def check(self, text):
+        """检查一条消息，见 WordFilter.check"""
+        self.check_reload()
+        return self._filter.check(text)
+
+    def __len__(self):
+        return len(self._filter)
+
+    def stats(self):
+        return {'terms': len(self._filter), 'reloads': self.reloads, 'build_seconds': round(self.last_build, 3)}
@@ -0,0 +1,263 @@
+import logging
+from collections import deque
+
+logger = logging.getLogger('chat.outbox')
+
+# 积压溢出时的处理方式
+#   drop_oldest: 合并在线名单事件、丢弃最旧的聊天消息，恢复后通知客户端补齐；
+#                积压中全是不能丢弃的事件时断开连接
+#   disconnect: 积压超过上限立即断开连接
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DISCONNECT = 'disconnect'
+POLICIES = (POLICY_DROP_OLDEST, POLICY_DISCONNECT)
+
+# 可合并的在线名单事件：积压时直接丢弃，客户端恢复后用完整快照重新同步
+COALESCE_EVENTS = frozenset(('presence_delta', 'presence_snapshot'))
+# 完整快照取代同一房间之前积压的在线名单事件，每个房间只保留最新的一个
+SNAPSHOT_EVENTS = frozenset(('presence_snapshot',))
+# 可丢弃的聊天消息事件，客户端恢复后按编号补齐
+CHAT_EVENTS = frozenset(('new_message', 'message_batch'))
+
+_KIND_OTHER = 0
+_KIND_PRESENCE = 1
+_KIND_CHAT = 2
+
+
+def _message_ids(event, data):
+    """聊天消息事件中的消息编号（完整格式取 id，紧凑格式取第一项）"""
+    items = data.get('messages', ()) if event == 'message_batch' and isinstance(data, dict) else (data,)
+    ids = []
+    for item in items:
+        message_id = item.get('id') if isinstance(item, dict) else (item[0] if item else None)
+        if isinstance(message_id, int):
+            ids.append(message_id)
+    return ids
+
+
+class _Outbox:
+    """单个客户端的积压队列和丢弃统计"""
+    __slots__ = ('items', 'pumping', 'closing', 'dropped_chat', 'dropped_presence',
+                 'gaps', 'presence_rooms')
+
+    def __init__(self):
+        # [(类型, 数据包, 房间, 消息编号列表)]
+        self.items = deque()
+        self.pumping = False
+        self.closing = False
+        self.dropped_chat = 0
+        self.dropped_presence = 0
+        # 本轮积压中丢弃的聊天消息 {房间: [数量, 最小编号, 最大编号]}
+        self.gaps = {}
+        # 本轮积压中丢弃过在线名单事件的房间
+        self.presence_rooms = set()
+
+
+class OutboundQueues:
+    """
+    按客户端的有界发送队列
+
+    房间广播原本直接写入每个连接的 Engine.IO 发送队列，网络差的客户端收不完的数据帧
+    会无限堆积在服务器内存中。这里在写入前检查该连接 Engine.IO 队列中尚未取走的
+    数据包数，超过 engineio_limit 时改为放入本客户端的积压队列，由后台任务在
+    Engine.IO 队列消化后再逐个转交。积压超过 max_queue 时按 policy 处理溢出。
+    没有积压的客户端只多一次字典查找和一次队列长度读取。
+
+    Args:
+        max_queue: 每个客户端积压队列的上限
+        engineio_limit: Engine.IO 队列中未发送的数据包超过该数量时开始积压
+        policy: 溢出处理方式，见 POLICIES
+        disconnect_after: 一个客户端累计丢弃的事件超过该数量时断开连接，0 表示不断开
+        poll_interval: 积压时检查 Engine.IO 队列的间隔（秒）
+        on_recovered: 积压消化后调用 on_recovered(sid, gaps, presence_rooms)，用于通知客户端补齐
+    """
+
+    def __init__(self, max_queue=200, engineio_limit=32, policy=POLICY_DROP_OLDEST, disconnect_after=1000,
+                 poll_interval=0.05, on_recovered=None):
+        if policy not in POLICIES:
+            raise ValueError(f'未知的溢出处理方式: {policy}')
+        self.max_queue = max_queue
+        self.engineio_limit = engineio_limit
+        self.policy = policy
+        self.disconnect_after = disconnect_after
+        self.poll_interval = poll_interval
+        self.on_recovered = on_recovered
+        self.server = None
+        # {eio_sid: _Outbox}，只包含有积压或丢弃过事件的客户端
+        self._boxes = {}
+        # 累计值，包含已断开的客户端
+        self.dropped_chat = 0
+        self.dropped_presence = 0
+        # 被更新的完整快照取代的在线名单事件，不计入丢弃
+        self.coalesced = 0
+        self.disconnects = 0
+
+    def attach(self, server):
+        self.server = server
+
+    def _engineio_depth(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        if socket is None or socket.closed:
+            return None
+        return socket.queue.qsize()
+
+    def send(self, eio_sid, pkt, event=None, data=None, room=None):
+        """
+        发送一个已编码的数据包
+
+        Args:
+            eio_sid: Engine.IO 会话ID
+            pkt: Socket.IO 数据包
+            event: 事件名称，用于判断积压时能否丢弃
+            data: 事件数据，聊天消息从中取出消息编号
+            room: 发送到的房间
+        """
+        box = self._boxes.get(eio_sid)
+        if box is None or not (box.items or box.closing):
+            depth = self._engineio_depth(eio_sid)
+            if depth is None or depth < self.engineio_limit:
+                self.server._send_packet(eio_sid, pkt)
+                return
+            if box is None:
+                box = self._boxes[eio_sid] = _Outbox()
+        if box.closing:
+            return
+
+        if event in COALESCE_EVENTS:
+            # 在线名单事件按数据中的房间合并，发给单个连接的快照也归到它所在的房间
+            if isinstance(data, dict) and isinstance(data.get('room'), str):
+                room = data['room']
+            if event in SNAPSHOT_EVENTS:
+                self._supersede(box, room)
+            item = (_KIND_PRESENCE, pkt, room, None)
+        elif event in CHAT_EVENTS:
+            item = (_KIND_CHAT, pkt, room, _message_ids(event, data))
+        else:
+            item = (_KIND_OTHER, pkt, room, None)
+        box.items.append(item)
+        if len(box.items) > self.max_queue:
+            self._overflow(eio_sid, box)
+        if box.items and not box.pumping and not box.closing:
+            box.pumping = True
+            self.server.start_background_task(self._pump, eio_sid, box)
+
+    def _supersede(self, box, room):
+        """删除同一房间积压的在线名单事件，新的完整快照已经包含它们的变化"""
+        # 快照送达后无需再为该房间补发快照；之后快照本身被丢弃时会重新记录
+        box.presence_rooms.discard(room)
+        kept = [item for item in box.items if item[0] != _KIND_PRESENCE or item[2] != room]
+        if len(kept) < len(box.items):
+            self.coalesced += len(box.items) - len(kept)
+            box.items.clear()
+            box.items.extend(kept)
+
+    def _overflow(self, eio_sid, box):
+        if self.policy == POLICY_DISCONNECT:
+            self._disconnect(eio_sid, box, '发送队列溢出')
+            return
+        # 先丢弃在线名单事件，再丢弃最旧的聊天消息
+        for kind in (_KIND_PRESENCE, _KIND_CHAT):
+            for index, item in enumerate(box.items):
+                if item[0] == kind:
+                    del box.items[index]
+                    self._record_drop(box, item)
+                    break
+            else:
+                continue
+            break
+        else:
+            # 积压中全是不能丢弃的事件，客户端已经无法跟上
+            self._disconnect(eio_sid, box, '发送队列中的事件无法丢弃')
+            return
+        if self.disconnect_after and box.dropped_chat + box.dropped_presence > self.disconnect_after:
+            self._disconnect(eio_sid, box, '丢弃的事件过多')
+
+    def _record_drop(self, box, item):
+        kind, _, room, message_ids = item
+        room = room.split('\x00', 1)[0] if isinstance(room, str) else room
+        if kind == _KIND_PRESENCE:
+            box.dropped_presence += 1
+            self.dropped_presence += 1
+            box.presence_rooms.add(room)
+            return
+        box.dropped_chat += 1
+        self.dropped_chat += 1
+        if message_ids:
+            gap = box.gaps.get(room)
+            if gap is None:
+                box.gaps[room] = [len(message_ids), min(message_ids), max(message_ids)]
+            else:
+                gap[0] += len(message_ids)
+                gap[1] = min(gap[1], *message_ids)
+                gap[2] = max(gap[2], *message_ids)
+
+    def _disconnect(self, eio_sid, box, reason):
+        if box.closing:
+            return
+        box.closing = True
+        box.items.clear()
+        self.disconnects += 1
+        logger.warning("客户端接收过慢，断开连接: %s (%s)", eio_sid, reason)
+        self.server.start_background_task(self.server.eio.disconnect, eio_sid)
+
+    def _pump(self, eio_sid, box):
+        """把积压的数据包转交给 Engine.IO 队列，消化完后通知客户端补齐"""
+        try:
+            while box.items and not box.closing:
+                depth = self._engineio_depth(eio_sid)
+                if depth is None:
+                    box.items.clear()
+                    return
+                if depth >= self.engineio_limit:
+                    self.server.sleep(self.poll_interval)
+                    continue
+                for _ in range(min(self.engineio_limit - depth, len(box.items))):
+                    self.server._send_packet(eio_sid, box.items.popleft()[1])
+        finally:
+            box.pumping = False
+        if box.closing or not (box.gaps or box.presence_rooms):
+            return
+        gaps, presence_rooms = box.gaps, box.presence_rooms
+        box.gaps, box.presence_rooms = {}, set()
+        if self.on_recovered is not None:
+            sid = self.server.manager.sid_from_eio_sid(eio_sid, '/')
+            if sid is not None:
+                self.on_recovered(sid, {room: tuple(gap) for room, gap in gaps.items()}, presence_rooms)
+
+    def forget(self, eio_sid):
+        """客户端断开后删除它的积压队列和统计"""
+        box = self._boxes.pop(eio_sid, None)
+        if box is not None:
+            box.closing = True
+            box.items.clear()
+
+    def clients(self):
+        """
+        有积压或丢弃过事件的客户端
+
+        Returns:
+            dict: {sid: {'queued', 'engineio', 'dropped_chat', 'dropped_presence'}}
+        """
+        result = {}
+        for eio_sid, box in list(self._boxes.items()):
+            sid = self.server.manager.sid_from_eio_sid(eio_sid, '/')
+            if sid is None:
+                continue
+            result[sid] = {
+                'queued': len(box.items),
+                'engineio': self._engineio_depth(eio_sid) or 0,
+                'dropped_chat': box.dropped_chat,
+                'dropped_presence': box.dropped_presence
+            }
+        return result
+
+    def stats(self):
+        """当前积压和累计丢弃的合计"""
+        boxes = list(self._boxes.values())
+        return {
+            'backlogged_clients': sum(1 for box in boxes if box.items),
+            'queued': sum(len(box.items) for box in boxes),
+            'dropped_chat': self.dropped_chat,
+            'dropped_presence': self.dropped_presence,
+            'coalesced': self.coalesced,
+            'disconnects': self.disconnects
+        }
@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class Session:
+    """在线会话记录"""
+    __slots__ = ('session_id', 'nickname', 'room', 'joined_at')
+
+    def __init__(self, session_id, nickname, room, joined_at=None):
+        self.session_id = session_id
+        self.nickname = nickname
+        self.room = room
+        self.joined_at = joined_at if joined_at is not None else time.time()
+
+    def __repr__(self):
+        return f'Session({self.session_id!r}, {self.nickname!r}, {self.room!r})'
+
+
+class SessionRegistry:
+    """
+    进程内会话注册表（默认后端）
+
+    同一份会话记录同时按会话ID、昵称和房间建立索引，增删、切换房间和查询都是
+    O(1)，在线人数直接取索引长度。只适用于单进程部署。
+    """
+
+    def __init__(self):
+        # {session_id: Session}
+        self._by_sid = {}
+        # {nickname: Session}
+        self._by_nickname = {}
+        # {room: {nickname: Session}}，按加入顺序排列，房间为空时删除
+        self._by_room = {}
+        self._lock = threading.Lock()
+
+    def add(self, session_id, nickname, room):
+        """
+        登记在线会话，昵称检查与写入在同一把锁内完成
+
+        Returns:
+            Session: 新会话记录，昵称已被占用或该会话ID已登记时返回 None
+        """
+        with self._lock:
+            if nickname in self._by_nickname or session_id in self._by_sid:
+                return None
+            session = Session(session_id, nickname, room)
+            self._by_sid[session_id] = session
+            self._by_nickname[nickname] = session
+            self._by_room.setdefault(room, {})[nickname] = session
+            return session
+
+    def remove(self, session_id):
+        """
+        移除在线会话
+
+        Returns:
+            Session: 被移除的会话记录，会话不存在时返回 None
+        """
+        with self._lock:
+            session = self._by_sid.pop(session_id, None)
+            if session is not None:
+                del self._by_nickname[session.nickname]
+                self._leave_room(session)
+            return session
+
+    def move(self, session_id, room):
+        """
+        把会话切换到另一个房间
+
+        Returns:
+            str: 原来所在的房间，会话不存在时返回 None
+        """
+        with self._lock:
+            session = self._by_sid.get(session_id)
+            if session is None:
+                return None
+            old_room = session.room
+            if old_room != room:
+                self._leave_room(session)
+                session.room = room
+                self._by_room.setdefault(room, {})[session.nickname] = session
+            return old_room
+
+    def rebind(self, session_id, new_session_id):
+        """
+        把会话转移到新的连接，昵称和房间不变（断线重连时接管原会话）
+
+        Returns:
+            Session: 转移后的会话记录，会话不存在时返回 None
+        """
+        with self._lock:
+            session = self._by_sid.pop(session_id, None)
+            if session is not None:
+                session.session_id = new_session_id
+                self._by_sid[new_session_id] = session
+            return session
+
+    def _leave_room(self, session):
+        members = self._by_room.get(session.room)
+        if members is not None:
+            members.pop(session.nickname, None)
+            if not members:
+                del self._by_room[session.room]
+
+    def get(self, session_id):
+        return self._by_sid.get(session_id)
+
+    def get_by_nickname(self, nickname):
+        return self._by_nickname.get(nickname)
+
+    def nicknames(self, room=None):
+        """在线昵称，指定 room 时只返回该房间的成员"""
+        if room is None:
+            return list(self._by_nickname)
+        return list(self._by_room.get(room, ()))
+
+    def count(self, room=None):
+        """在线人数，指定 room 时只统计该房间"""
+        if room is None:
+            return len(self._by_sid)
+        return len(self._by_room.get(room, ()))
+
+    def rooms(self):
+        """
+        Returns:
+            dict: 有人在线的房间及其人数 {room: count}
+        """
+        with self._lock:
+            return {room: len(members) for room, members in self._by_room.items()}
+
+    def __contains__(self, session_id):
+        return session_id in self._by_sid
+
+    def __len__(self):
+        return len(self._by_sid)
+
+
+class SQLiteSessionRegistry:
+    """
+    基于 SQLite 的共享会话注册表
+
+    同一台机器上的多个工作进程共用一个数据库文件，由唯一约束保证昵称不重复。
+    每行记录所属工作进程，进程重启时清理自己遗留的会话。
+
+    每个房间的在线名单版本号也保存在数据库中，与名单变化在同一个事务中递增，
+    所有工作进程看到的版本号一致，见 room_snapshot。
+    """
+
+    def __init__(self, path, worker_id):
+        self.path = path
+        self.worker_id = worker_id
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # 同一个连接上的事务不能交错（后台任务可能运行在其他线程中）
+        self._lock = threading.Lock()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS presence ('
+            'session_id TEXT PRIMARY KEY, '
+            'nickname TEXT NOT NULL UNIQUE, '
+            'room TEXT, '
+            'joined_at REAL NOT NULL, '
+            'worker TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS presence_room ON presence (room)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS presence_versions ('
+            'room TEXT PRIMARY KEY, '
+            'version INTEGER NOT NULL)'
+        )
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            stale_rooms = [row[0] for row in self._conn.execute(
+                'SELECT DISTINCT room FROM presence WHERE worker = ?', (worker_id,))]
+            self._conn.execute('DELETE FROM presence WHERE worker = ?', (worker_id,))
+            for room in stale_rooms:
+                self._bump(room)
+
+    def _bump(self, room):
+        """房间名单版本号加一，须在修改名单的事务中调用"""
+        self._conn.execute(
+            'INSERT INTO presence_versions (room, version) VALUES (?, 1) '
+            'ON CONFLICT (room) DO UPDATE SET version = version + 1', (room,)
+        )
+
+    def add(self, session_id, nickname, room):
+        # 昵称和会话ID的唯一约束都由数据库检查
+        session = Session(session_id, nickname, room)
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.execute(
+                    'INSERT INTO presence (session_id, nickname, room, joined_at, worker) VALUES (?, ?, ?, ?, ?)',
+                    (session_id, nickname, room, session.joined_at, self.worker_id)
+                )
+                self._bump(room)
+        except sqlite3.IntegrityError:
+            return None
+        return session
+
+    def remove(self, session_id):
+        # 会话可能同时被其他工作进程接管（rebind），查询和删除须在同一个写事务中
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            session = self.get(session_id)
+            if session is not None:
+                self._conn.execute('DELETE FROM presence WHERE session_id = ?', (session_id,))
+                self._bump(session.room)
+        return session
+
+    def move(self, session_id, room):
+        # 与 remove 一样在写事务内读取会话，读到的原房间不会被其他进程的修改覆盖
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            session = self.get(session_id)
+            if session is None:
+                return None
+            if session.room != room:
+                self._conn.execute('UPDATE presence SET room = ? WHERE session_id = ?', (room, session_id))
+                self._bump(session.room)
+                self._bump(room)
+        return session.room
+
+    def rebind(self, session_id, new_session_id):
+        # 重连可能落到另一个工作进程，同时改为由当前进程负责清理；
+        # 与原进程的 remove 使用同样的写事务，二者只有一个能拿到会话
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            cursor = self._conn.execute('UPDATE presence SET session_id = ?, worker = ? WHERE session_id = ?',
+                                        (new_session_id, self.worker_id, session_id))
+            return self.get(new_session_id) if cursor.rowcount else None
+
+    def get(self, session_id):
+        row = self._conn.execute(
+            'SELECT session_id, nickname, room, joined_at FROM presence WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return Session(*row) if row else None
+
+    def get_by_nickname(self, nickname):
+        row = self._conn.execute(
+            'SELECT session_id, nickname, room, joined_at FROM presence WHERE nickname = ?', (nickname,)
+        ).fetchone()
+        return Session(*row) if row else None
+
+    def nicknames(self, room=None):
+        if room is None:
+            return [row[0] for row in self._conn.execute('SELECT nickname FROM presence ORDER BY rowid')]
+        return [row[0] for row in self._conn.execute(
+            'SELECT nickname FROM presence WHERE room = ? ORDER BY rowid', (room,))]
+
+    def count(self, room=None):
+        if room is None:
+            return self._conn.execute('SELECT COUNT(*) FROM presence').fetchone()[0]
+        return self._conn.execute('SELECT COUNT(*) FROM presence WHERE room = ?', (room,)).fetchone()[0]
+
+    def rooms(self):
+        return dict(self._conn.execute('SELECT room, COUNT(*) FROM presence GROUP BY room'))
+
+    def room_version(self, room):
+        """房间在线名单的版本号，每次加入、离开或切换房间都会递增"""
+        row = self._conn.execute('SELECT version FROM presence_versions WHERE room = ?', (room,)).fetchone()
+        return row[0] if row else 0
+
+    def room_snapshot(self, room):
+        """
+        在同一个读事务中取出房间名单和版本号，二者一定对应
+
+        Returns:
+            tuple: (版本号, 在线昵称列表)
+        """
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            version = self.room_version(room)
+            users = self.nicknames(room)
+        return version, users
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __len__(self):
+        return self.count()
+
+
+def create_session_registry(backend, path=None, worker_id=None):
+    """
+    根据配置创建会话注册表
+
+    Args:
+        backend: 'memory' 或 'sqlite'
+        path: sqlite 数据库文件路径
+        worker_id: 当前工作进程标识
+    """
+    if backend == 'memory':
+        return SessionRegistry()
+    if backend == 'sqlite':
+        return SQLiteSessionRegistry(path, worker_id or str(os.getpid()))
+    raise ValueError(f'未知的状态后端: {backend}')
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 限流检查的结果
+ALLOW = 'allow'
+DROP = 'drop'
+WARN = 'warn'
+MUTE = 'mute'
+MUTED = 'muted'
+
+
+class TokenBucketLimiter:
+    """
+    按键计数的令牌桶
+
+    每个键只保存 [令牌数, 上次更新时间]，消费时按经过的时间惰性补充令牌，
+    不需要为每个用户维护定时器，每次检查都是 O(1)。条目按最近使用顺序保存，
+    键的数量达到 max_keys 时淘汰最久未使用的一个（通常早已补满，与新建的桶等价）。
+
+    Args:
+        rate: 每秒补充的令牌数
+        burst: 桶容量，即允许的最大突发数量
+        max_keys: 最多保存的键数量
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # {key: [令牌数, 上次更新时间]}，按最近使用排序
+        self._buckets = OrderedDict()
+
+    def available(self, key, now):
+        """
+        补充令牌后返回当前可用的令牌数，不扣除
+
+        Returns:
+            float: 可用令牌数
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket[0]
+
+    def consume(self, key, now, cost=1):
+        """
+        尝试消费令牌
+
+        Returns:
+            bool: 令牌足够时返回 True 并扣除
+        """
+        if self.available(key, now) < cost:
+            return False
+        self._buckets[key][0] -= cost
+        return True
+
+    def forget(self, key):
+        self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class FloodControl:
+    """
+    发送消息的限流与刷屏处罚
+
+    普通消息和命令使用各自的令牌桶，并同时按会话ID和昵称限流（重连换了会话ID
+    也不能重置额度）。超出额度记一次违规，违规次数随时间衰减，处罚逐级加重：
+    先静默丢弃，达到 warn_after 次时警告，达到 mute_after 次时禁言 mute_seconds 秒，
+    禁言期间的消息全部丢弃。
+
+    Args:
+        message_rate: 普通消息每秒补充的额度
+        message_burst: 普通消息的突发上限
+        command_rate: 命令每秒补充的额度
+        command_burst: 命令的突发上限
+        warn_after: 触发警告的违规次数
+        mute_after: 触发禁言的违规次数
+        mute_seconds: 禁言时长（秒）
+        strike_decay: 每隔多少秒抵消一次违规
+        clock: 返回当前时间（秒）的函数
+    """
+
+    def __init__(self, message_rate=2.0, message_burst=8, command_rate=0.2, command_burst=3,
+                 warn_after=3, mute_after=6, mute_seconds=30, strike_decay=10.0, clock=time.monotonic):
+        self._limiters = {
+            False: (TokenBucketLimiter(message_rate, message_burst), TokenBucketLimiter(message_rate, message_burst)),
+            True: (TokenBucketLimiter(command_rate, command_burst), TokenBucketLimiter(command_rate, command_burst))
+        }
+        self.warn_after = warn_after
+        self.mute_after = mute_after
+        self.mute_seconds = mute_seconds
+        self.strike_decay = strike_decay
+        self.clock = clock
+        # {昵称: [违规次数, 上次违规时间, 禁言截止时间]}
+        self._offenders = {}
+        self._lock = threading.Lock()
+
+    def check(self, session_id, nickname, is_command=False):
+        """
+        检查一条消息是否允许发送
+
+        Returns:
+            tuple: (检查结果, 剩余禁言秒数)，检查结果为 ALLOW、DROP、WARN、MUTE 或 MUTED
+        """
+        now = self.clock()
+        with self._lock:
+            offender = self._offenders.get(nickname)
+            if offender is not None and offender[2] > now:
+                return MUTED, offender[2] - now
+
+            # 两个桶都有额度才放行，任一拒绝时都不扣除，避免另一个桶被白白消耗
+            by_session, by_nickname = self._limiters[is_command]
+            if by_session.available(session_id, now) >= 1 and by_nickname.available(nickname, now) >= 1:
+                by_session.consume(session_id, now)
+                by_nickname.consume(nickname, now)
+                return ALLOW, 0
+
+            if offender is None:
+                offender = self._offenders[nickname] = [0, now, 0.0]
+            # 违规次数按距上次违规的时间衰减
+            decayed = int((now - offender[1]) / self.strike_decay) if self.strike_decay > 0 else 0
+            offender[0] = max(0, offender[0] - decayed) + 1
+            offender[1] = now
+            strikes = offender[0]
+            if strikes >= self.mute_after:
+                offender[0] = 0
+                offender[2] = now + self.mute_seconds
+                return MUTE, self.mute_seconds
+            if strikes == self.warn_after:
+                return WARN, 0
+            return DROP, 0
+
+    def forget_session(self, session_id):
+        """会话断开后释放按会话ID记录的令牌桶；按昵称的记录由 LRU 淘汰"""
+        with self._lock:
+            for by_session, _ in self._limiters.values():
+                by_session.forget(session_id)
+            if len(self._offenders) > 1000:
+                now = self.clock()
+                expired = [nickname for nickname, (_, last, muted_until) in self._offenders.items()
+                           if muted_until <= now and now - last > self.strike_decay * self.mute_after]
+                for nickname in expired:
+                    del self._offenders[nickname]
+
+    def stats(self):
+        now = self.clock()
+        return {
+            'tracked_sessions': len(self._limiters[False][0]),
+            'muted': sum(1 for _, _, muted_until in list(self._offenders.values()) if muted_until > now)
+        }
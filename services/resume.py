@@ -0,0 +1,176 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import sqlite3
+import threading
+
+
+class ResumeNonces:
+    """单进程的令牌随机串表：{昵称: 最近一次签发的随机串}"""
+
+    def __init__(self):
+        self._nonces = {}
+        self._lock = threading.Lock()
+
+    def get(self, nickname):
+        return self._nonces.get(nickname)
+
+    def set(self, nickname, nonce):
+        self._nonces[nickname] = nonce
+
+    def discard(self, nickname, nonce=None):
+        """删除昵称的随机串；指定 nonce 时只在仍是该随机串时删除（期间签发了新令牌则保留）"""
+        with self._lock:
+            if nonce is None or self._nonces.get(nickname) == nonce:
+                self._nonces.pop(nickname, None)
+
+
+class SQLiteResumeNonces:
+    """
+    多进程共享的令牌随机串表
+
+    重连可能落到另一个工作进程，随机串与会话注册表放在同一个 SQLite 文件中，
+    任一工作进程都能验证其他进程签发的令牌并接管会话。
+
+    Args:
+        path: SQLite 数据库文件路径（与共享状态库相同即可）
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS resume_nonces ('
+            'nickname TEXT PRIMARY KEY, '
+            'nonce TEXT NOT NULL)'
+        )
+
+    def get(self, nickname):
+        row = self._conn.execute('SELECT nonce FROM resume_nonces WHERE nickname = ?', (nickname,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, nickname, nonce):
+        self._conn.execute(
+            'INSERT INTO resume_nonces (nickname, nonce) VALUES (?, ?) '
+            'ON CONFLICT (nickname) DO UPDATE SET nonce = excluded.nonce', (nickname, nonce)
+        )
+
+    def discard(self, nickname, nonce=None):
+        if nonce is None:
+            self._conn.execute('DELETE FROM resume_nonces WHERE nickname = ?', (nickname,))
+        else:
+            self._conn.execute('DELETE FROM resume_nonces WHERE nickname = ? AND nonce = ?', (nickname, nonce))
+
+
+class ResumeTokens:
+    """
+    断线重连的会话恢复令牌
+
+    加入成功时给客户端签发令牌：随机串加上昵称和随机串的 HMAC 签名。随机串表 nonces
+    记录每个昵称最近一次签发的随机串，只有持有最新令牌的连接才能接管该昵称，
+    旧令牌和被盗用的令牌都无法接管。多进程部署时使用共享的 SQLiteResumeNonces，
+    重连落到任一工作进程都能接管；单进程时随机串只在内存中，重启后令牌不再有效，
+    客户端按新加入处理（重启后会话也已不存在，不会占用昵称）。
+
+    连接断开后会话不立即移除，而是在 grace 秒内保留昵称和房间（detach），
+    期间客户端带着令牌重连即可原样接管，不产生离开和加入的在线名单变化；
+    超时仍未重连时调用 on_expired(session_id, nickname)，由调用方移除会话并广播离开。
+    保留和超时检查在断开连接的进程中进行；会话已被其他进程接管时，调用方移除不到会话，
+    接管时签发的新随机串也不会被删除。
+
+    Args:
+        transport: 传输层（Transport），用于调度超时检查
+        secret: 签名密钥
+        grace: 断开后保留会话的时间（秒）
+        on_expired: 保留超时的回调
+        nonces: 随机串表（ResumeNonces 或 SQLiteResumeNonces），默认只在本进程内
+    """
+
+    def __init__(self, transport, secret, grace=30.0, on_expired=None, nonces=None):
+        self.transport = transport
+        self._secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.grace = grace
+        self.on_expired = on_expired
+        self._nonces = nonces if nonces is not None else ResumeNonces()
+        # {nickname: (断开的会话ID, 保留序号, 断开时的随机串)}，序号用于识别过期的超时检查
+        self._detached = {}
+        self._generation = 0
+        self.resumed = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def _sign(self, nickname, nonce):
+        digest = hmac.new(self._secret, f'{nickname}\x00{nonce}'.encode('utf-8'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:18]).decode('ascii')
+
+    def issue(self, nickname):
+        """
+        为昵称签发新令牌，之前签发的令牌随之失效
+
+        Returns:
+            str: 令牌
+        """
+        nonce = secrets.token_urlsafe(12)
+        self._nonces.set(nickname, nonce)
+        return f'{nonce}.{self._sign(nickname, nonce)}'
+
+    def verify(self, token, nickname):
+        """签名是否有效，即令牌是否由持有同一密钥的服务为该昵称签发（不检查是否为最新令牌）"""
+        if not isinstance(token, str) or token.count('.') != 1:
+            return False
+        nonce, signature = token.split('.')
+        return hmac.compare_digest(signature, self._sign(nickname, nonce))
+
+    def owns(self, token, nickname):
+        """令牌是否为该昵称最近一次签发的令牌"""
+        nonce = self._nonces.get(nickname)
+        return nonce is not None and self.verify(token, nickname) and token.split('.')[0] == nonce
+
+    def detach(self, nickname, session_id):
+        """连接断开，保留会话 grace 秒"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._detached[nickname] = (session_id, generation, self._nonces.get(nickname))
+        self.transport.start_background_task(self._expire_later, nickname, generation)
+
+    def is_detached(self, nickname):
+        return nickname in self._detached
+
+    def reattach(self, nickname):
+        """
+        接管保留的会话，取消超时检查
+
+        Returns:
+            str: 保留的会话ID，没有保留时返回 None
+        """
+        with self._lock:
+            detached = self._detached.pop(nickname, None)
+            if detached is None:
+                return None
+            self.resumed += 1
+            return detached[0]
+
+    def forget(self, nickname):
+        """用户主动退出或会话已移除，令牌失效"""
+        self._nonces.discard(nickname)
+        with self._lock:
+            self._detached.pop(nickname, None)
+
+    def _expire_later(self, nickname, generation):
+        self.transport.sleep(self.grace)
+        with self._lock:
+            detached = self._detached.get(nickname)
+            if detached is None or detached[1] != generation:
+                return
+            del self._detached[nickname]
+            self.expired += 1
+        # 只删除断开时的随机串，期间在其他进程重连接管时签发的新随机串保留
+        self._nonces.discard(nickname, detached[2])
+        if self.on_expired is not None:
+            self.on_expired(detached[0], nickname)
+
+    def stats(self):
+        return {'detached': len(self._detached), 'resumed': self.resumed, 'expired': self.expired}
@@ -0,0 +1,133 @@
+import threading
+
+
+class PresenceTracker:
+    """
+    带版本号的房间在线名单
+
+    加入和离开不再逐个广播，而是在防抖窗口内合并为一个 presence_delta 事件：
+    {'room', 'base_version', 'version', 'added', 'removed', 'online_count'}。
+    每次发送增量版本号加一，客户端发现 base_version 与本地版本不一致时，
+    通过 presence_sync 请求完整快照重新同步。
+
+    多进程部署时各工作进程分别发送自己的变化，进程内的版本号无法衔接。此时传入
+    共享的会话注册表 shared_roster，版本号取自共享存储（随名单变化在同一事务中递增），
+    防抖窗口结束时向房间广播 presence_snapshot 完整快照而不是增量；快照的名单和版本号
+    一定对应，客户端只需丢弃版本号更旧的快照，不会出现缺口。
+
+    本进程维护版本号时，房间变空后丢弃它的版本号，房间名称可以任意创建也不会一直占用内存；
+    之后再有人加入时版本号从所有已丢弃房间的最大版本号继续，不会与旧版本号重复。
+
+    Args:
+        transport: 传输层，见 services.transport
+        list_users: 返回房间在线昵称列表的函数 list_users(room)
+        count_users: 返回房间在线人数的函数 count_users(room)
+        debounce: 防抖窗口（秒），为 0 时每次变化立即发送
+        shared_roster: 提供 room_version(room) 和 room_snapshot(room) 的共享会话注册表，
+                       为 None 时版本号在本进程内维护
+    """
+
+    def __init__(self, transport, list_users, count_users, debounce=0.2, shared_roster=None):
+        self.transport = transport
+        self.list_users = list_users
+        self.count_users = count_users
+        self.debounce = debounce
+        self.shared_roster = shared_roster
+        # {room: 已发送的最新版本号}，只保存有人在线的房间
+        self._versions = {}
+        # 已丢弃房间的最大版本号，新房间的版本号从这里开始
+        self._version_floor = 0
+        # {room: (added, removed)} 尚未发送的变化
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def version(self, room):
+        if self.shared_roster is not None:
+            return self.shared_roster.room_version(room)
+        return self._versions.get(room, self._version_floor)
+
+    def snapshot(self, room):
+        """房间完整名单快照，用于 join_success 和重新同步"""
+        if self.shared_roster is not None:
+            version, users = self.shared_roster.room_snapshot(room)
+        else:
+            version, users = self.version(room), self.list_users(room)
+        return {
+            'room': room,
+            'version': version,
+            'users': users,
+            'online_count': len(users)
+        }
+
+    def joined(self, room, nickname):
+        self._record(room, nickname, True)
+
+    def left(self, room, nickname):
+        self._record(room, nickname, False)
+
+    def _record(self, room, nickname, is_join):
+        with self._lock:
+            pending = self._pending.get(room)
+            schedule = pending is None
+            if schedule:
+                pending = self._pending[room] = (set(), set())
+            added, removed = pending
+            if is_join:
+                # 窗口内先离开又加入的用户相互抵消
+                if nickname in removed:
+                    removed.discard(nickname)
+                else:
+                    added.add(nickname)
+            else:
+                if nickname in added:
+                    added.discard(nickname)
+                else:
+                    removed.add(nickname)
+
+        if not schedule:
+            return
+        if self.debounce > 0:
+            self.transport.start_background_task(self._flush_later, room)
+        else:
+            self.flush(room)
+
+    def flush(self, room):
+        """立即发送房间积累的变化"""
+        with self._lock:
+            pending = self._pending.pop(room, None)
+            if pending is None:
+                return
+            added, removed = pending
+            if not added and not removed:
+                return
+            if self.shared_roster is None:
+                base_version = self.version(room)
+                self._versions[room] = base_version + 1
+
+        if self.shared_roster is not None:
+            self.transport.emit('presence_snapshot', self.snapshot(room), to=room)
+            return
+        online_count = self.count_users(room)
+        self.transport.emit('presence_delta', {
+            'room': room,
+            'base_version': base_version,
+            'version': base_version + 1,
+            'added': sorted(added),
+            'removed': sorted(removed),
+            'online_count': online_count
+        }, to=room)
+        if online_count == 0:
+            self._forget(room)
+
+    def _forget(self, room):
+        """房间已经没有人，丢弃版本号；期间又有变化等待发送时保留"""
+        with self._lock:
+            if room in self._pending or self.count_users(room):
+                return
+            version = self._versions.pop(room, None)
+            if version is not None:
+                self._version_floor = max(self._version_floor, version)
+
+    def _flush_later(self, room):
+        self.transport.sleep(self.debounce)
+        self.flush(room)
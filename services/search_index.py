@@ -0,0 +1,253 @@
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+# 中日韩文字：汉字、假名、谚文
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+# 连续的中日韩文字，或连续的其他字母数字
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|([^\\W{_CJK}]+)')
+# 过长的字母数字串（如长链接片段）只取前缀
+MAX_WORD_LENGTH = 32
+
+# 估算内存时每个词项的固定开销：字典槽位、词项字符串和 array 对象头
+_TOKEN_OVERHEAD = 160
+# 每条文档在各并行数组和列表中的开销
+_DOC_OVERHEAD = 8 + 8 + 4 + 8 + 8
+
+
+def normalize(text):
+    """全角转半角、统一大小写，索引和查询使用同样的归一化"""
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def tokenize(text):
+    """
+    中日韩文字按相邻两字切分（二元组），其他文字按连续的字母数字切分
+
+    例如 '分享了一部电影 demo.mp4' -> 分享 享了 了一 一部 部电 电影 demo mp4。
+    不需要分词词典，任意两个以上汉字的查询都能命中。单个汉字不产生词项。
+
+    Returns:
+        list: 词项列表（可能重复）
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if cjk:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(word[:MAX_WORD_LENGTH])
+    return tokens
+
+
+def _contains(postings, doc):
+    index = bisect_left(postings, doc)
+    return index < len(postings) and postings[index] == doc
+
+
+class SearchIndex:
+    """
+    聊天记录的增量倒排索引
+
+    每条消息分配递增的文档编号，倒排表是按文档编号递增的 array('I')，
+    新消息只需追加到各词项的倒排表末尾。查询取最短的倒排表从新到旧遍历，
+    在其余倒排表中二分查找，再校验原文确实包含每个查询词（二元组同时出现
+    不代表相邻），因此结果按时间倒序，凑够一页就停止。
+
+    文档数超过 max_docs 时淘汰最旧的文档：先只移动下界，被淘汰的文档累计到
+    一定数量后再统一截断各倒排表，摊销到每条消息的开销是常数。
+    添加和查询都在处理事件的线程中执行（eventlet 的绿色线程或 asyncio 的事件循环），
+    中间不会切换协程，不需要加锁。
+
+    Args:
+        max_docs: 最多索引的消息条数
+        max_scan: 单次查询最多检查的候选文档数，避免高频词组合拖慢查询
+    """
+
+    def __init__(self, max_docs=200000, max_scan=20000):
+        self.max_docs = max_docs
+        self.max_scan = max_scan
+        # {词项: array('I', 文档编号)}
+        self._postings = {}
+        self._posting_count = 0
+        # 文档按编号存放在并行数组中，下标为 文档编号 - _base
+        self._base = 0
+        self._first_doc = 0
+        self._next_doc = 0
+        self._texts = []
+        self._nicknames = []
+        self._rooms = array('I')
+        self._message_ids = array('q')
+        self._timestamps = array('q')
+        self._text_bytes = 0
+        # 房间名称与编号的对应
+        self._room_ids = {}
+        self._room_names = []
+        # 淘汰的文档累计到该数量时截断倒排表
+        self._compact_every = max(1000, max_docs // 4)
+
+    def __len__(self):
+        return self._next_doc - self._first_doc
+
+    def add(self, room, message_data):
+        """
+        索引一条房间消息
+
+        Args:
+            room: 房间名称
+            message_data: 已分配编号 id 和时间戳 ts 的消息
+        """
+        if message_data.get('is_system'):
+            return
+        parts = [message_data.get('message', '')]
+        for key in ('movie_url', 'reply'):
+            if message_data.get(key):
+                parts.append(message_data[key])
+        text = '\n'.join(parts)
+        tokens = set(tokenize(text))
+        if not tokens:
+            return
+
+        room_id = self._room_ids.get(room)
+        if room_id is None:
+            room_id = self._room_ids[room] = len(self._room_names)
+            self._room_names.append(room)
+
+        doc = self._next_doc
+        self._next_doc += 1
+        self._texts.append(text)
+        self._nicknames.append(sys.intern(message_data.get('nickname', '')))
+        self._rooms.append(room_id)
+        self._message_ids.append(message_data.get('id') or 0)
+        self._timestamps.append(message_data.get('ts') or 0)
+        self._text_bytes += sys.getsizeof(text)
+
+        postings = self._postings
+        for token in tokens:
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = array('I')
+            posting.append(doc)
+        self._posting_count += len(tokens)
+
+        if len(self) > self.max_docs:
+            self._first_doc = self._next_doc - self.max_docs
+        if self._first_doc - self._base >= self._compact_every:
+            self._compact()
+
+    def _compact(self):
+        """删除已淘汰的文档，截断倒排表"""
+        cut = self._first_doc - self._base
+        self._text_bytes -= sum(sys.getsizeof(text) for text in self._texts[:cut])
+        del self._texts[:cut]
+        del self._nicknames[:cut]
+        del self._rooms[:cut]
+        del self._message_ids[:cut]
+        del self._timestamps[:cut]
+        self._base = self._first_doc
+        self._renumber_rooms()
+        first = self._first_doc
+        for token, posting in list(self._postings.items()):
+            index = bisect_left(posting, first)
+            if index == len(posting):
+                del self._postings[token]
+            elif index:
+                del posting[:index]
+            self._posting_count -= index
+
+    def _renumber_rooms(self):
+        """只保留仍有文档的房间并重新编号，房间名称可以任意创建，不能一直累积"""
+        live = sorted(set(self._rooms))
+        if len(live) == len(self._room_names):
+            return
+        mapping = {old: new for new, old in enumerate(live)}
+        self._rooms = array('I', (mapping[room_id] for room_id in self._rooms))
+        self._room_names = [self._room_names[old] for old in live]
+        self._room_ids = {name: room_id for room_id, name in enumerate(self._room_names)}
+
+    def search(self, query, room=None, offset=0, limit=10):
+        """
+        查询同时包含所有关键词的消息，按时间倒序
+
+        Args:
+            query: 以空白分隔的关键词
+            room: 只查询该房间的消息，None 表示所有房间
+            offset: 跳过前 offset 条结果
+            limit: 返回的条数
+
+        Returns:
+            dict: {'results': [{'room', 'id', 'ts', 'nickname', 'text'}], 'has_more', 'truncated'}，
+                  truncated 表示检查的候选文档达到上限，可能还有更早的结果没有找到
+        """
+        empty = {'results': [], 'has_more': False, 'truncated': False}
+        terms = [normalize(term) for term in query.split()]
+        tokens = set(tokenize(query))
+        if not tokens:
+            return empty
+        room_id = None
+        if room is not None:
+            room_id = self._room_ids.get(room)
+            if room_id is None:
+                return empty
+        lists = []
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                return empty
+            lists.append(posting)
+        lists.sort(key=len)
+        shortest, others = lists[0], lists[1:]
+
+        base, first = self._base, self._first_doc
+        found = []
+        skipped = 0
+        scanned = 0
+        truncated = False
+        for position in range(len(shortest) - 1, -1, -1):
+            doc = shortest[position]
+            if doc < first:
+                break
+            scanned += 1
+            if scanned > self.max_scan:
+                truncated = True
+                break
+            slot = doc - base
+            if room_id is not None and self._rooms[slot] != room_id:
+                continue
+            if not all(_contains(posting, doc) for posting in others):
+                continue
+            text = normalize(self._texts[slot])
+            if not all(term in text for term in terms):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            found.append(slot)
+            if len(found) > limit:
+                break
+
+        results = [{
+            'room': self._room_names[self._rooms[slot]],
+            'id': self._message_ids[slot],
+            'ts': self._timestamps[slot],
+            'nickname': self._nicknames[slot],
+            'text': self._texts[slot]
+        } for slot in found[:limit]]
+        return {'results': results, 'has_more': len(found) > limit, 'truncated': truncated}
+
+    def stats(self):
+        """
+        索引规模和估算的内存占用
+
+        Returns:
+            dict: {'docs', 'tokens', 'postings', 'bytes'}
+        """
+        docs = self._next_doc - self._base
+        return {
+            'docs': len(self),
+            'tokens': len(self._postings),
+            'postings': self._posting_count,
+            'bytes': (self._posting_count * 4 + len(self._postings) * _TOKEN_OVERHEAD
+                      + docs * _DOC_OVERHEAD + self._text_bytes)
+        }
@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+from utils.http_pool import HTTPConnectionPool
+
+logger = logging.getLogger('chat.config')
+
+
+def _file_mode(path):
+    """已有文件的权限；文件不存在时取按 umask 新建文件的权限"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_json_atomic(path, data):
+    """
+    原子地写入 JSON 文件
+
+    先写入同目录下的临时文件再 os.replace 替换，读取方不会读到写了一半的文件。
+    mkstemp 创建的临时文件权限为 0600，替换前改为原文件的权限。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ConfigStore:
+    """
+    按修改时间失效的配置文件缓存
+
+    每次读取只 stat 一次文件，修改时间和大小不变时直接返回已解析的配置。
+    文件不存在或解析失败时返回默认配置，下次文件变化后重新读取。
+
+    Args:
+        path: 配置文件路径
+        default: 默认配置
+    """
+
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+        self._config = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self):
+        """
+        Returns:
+            tuple: (配置, 版本)，版本在文件变化后改变；返回的配置不要修改
+        """
+        stamp = self._file_stamp()
+        if self._config is not None and stamp == self._stamp:
+            return self._config, stamp
+        with self._lock:
+            if self._config is None or stamp != self._stamp:
+                self._config = self._load(stamp)
+                self._stamp = stamp
+            return self._config, self._stamp
+
+    def _load(self, stamp):
+        if stamp is None:
+            logger.warning("配置文件不存在: %s", self.path)
+            return self.default
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning("读取配置文件失败: %s", e)
+            return self.default
+
+    def update(self, func):
+        """
+        修改并原子地写回配置文件
+
+        Args:
+            func: 接收配置副本并就地修改的函数，返回 False 表示无需写回
+
+        Returns:
+            bool: 是否写回了文件
+        """
+        with self._lock:
+            config = json.loads(json.dumps(self._load(self._file_stamp())))
+            if func(config) is False:
+                return False
+            write_json_atomic(self.path, config)
+            self._config = config
+            self._stamp = self._file_stamp()
+            return True
+
+
+class ServerStatus:
+    __slots__ = ('healthy', 'latency', 'checked_at', 'failures', 'error')
+
+    def __init__(self):
+        self.healthy = False
+        # 往返延迟的指数加权平均（秒）
+        self.latency = None
+        self.checked_at = None
+        self.failures = 0
+        self.error = None
+
+
+class ServerProber:
+    """
+    定期探测配置中各服务器的健康状态和往返延迟
+
+    后台任务每隔 interval 秒并发请求每个服务器的健康检查地址，状态码为 2xx 视为健康，
+    延迟取指数加权平均，避免一次抖动改变排序。请求复用长连接，测得的是请求往返时间，
+    不包含 TCP 握手。
+
+    Args:
+        transport: 传输层（Transport），用于启动后台任务
+        list_servers: 返回服务器列表 [{'name', 'url'}] 的函数
+        interval: 探测间隔（秒）
+        timeout: 单次探测超时（秒）
+        path: 健康检查路径
+        smoothing: 延迟平均中新样本的权重
+    """
+
+    def __init__(self, transport, list_servers, interval=15, timeout=2.0, path='/health', smoothing=0.3):
+        self.transport = transport
+        self.list_servers = list_servers
+        self.interval = interval
+        self.timeout = timeout
+        self.path = path
+        self.smoothing = smoothing
+        self.pool = HTTPConnectionPool(max_per_host=1)
+        # {url: ServerStatus}
+        self._status = {}
+        # 每轮探测后加一，用于判断排序结果是否变化
+        self.version = 0
+        self._started = False
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台探测任务（重复调用无效）"""
+        with self._lock:
+            if self._started or self.interval <= 0:
+                return
+            self._started = True
+        self.transport.start_background_task(self._run)
+
+    def stop(self):
+        """停止后台探测任务；后台任务不是守护线程，退出进程前需要先停止"""
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.probe_all()
+            except Exception:
+                logger.exception("探测服务器失败")
+            self._stopped.wait(self.interval)
+
+    def probe_all(self):
+        """并发探测全部服务器一次"""
+        urls = list(dict.fromkeys(server['url'] for server in self.list_servers() if server.get('url')))
+        if urls:
+            results = [None] * len(urls)
+            tasks = [self.transport.start_background_task(self._probe_into, results, index, url)
+                     for index, url in enumerate(urls)]
+            for task in tasks:
+                task.join()
+            now = time.time()
+            for url, (healthy, latency, error) in zip(urls, results):
+                self._record(url, healthy, latency, error, now)
+        # 删除已从配置中移除的服务器
+        for url in set(self._status) - set(urls):
+            del self._status[url]
+        self.version += 1
+
+    def _probe_into(self, results, index, url):
+        results[index] = self._probe(url)
+
+    def _probe(self, url):
+        start = time.perf_counter()
+        try:
+            status, _ = self.pool.request('GET', url.rstrip('/') + self.path, timeout=self.timeout)
+        except Exception as e:
+            return False, None, str(e) or e.__class__.__name__
+        latency = time.perf_counter() - start
+        if 200 <= status < 300:
+            return True, latency, None
+        return False, latency, f'HTTP {status}'
+
+    def _record(self, url, healthy, latency, error, now):
+        status = self._status.get(url)
+        if status is None:
+            status = self._status[url] = ServerStatus()
+        status.healthy = healthy
+        status.checked_at = now
+        status.error = error
+        if healthy:
+            status.failures = 0
+            if status.latency is None:
+                status.latency = latency
+            else:
+                status.latency += self.smoothing * (latency - status.latency)
+        else:
+            status.failures += 1
+
+    def ranked(self, servers):
+        """
+        按健康状态和延迟排序的服务器列表
+
+        健康的服务器按延迟从低到高排在前面，其余保持配置中的顺序。
+
+        Returns:
+            list: [{'name', 'url', 'healthy', 'latency_ms', 'checked_at', ...}]，未探测过的服务器 healthy 为 None
+        """
+        entries = []
+        for index, server in enumerate(servers):
+            entry = dict(server)
+            status = self._status.get(server.get('url'))
+            if status is None:
+                entry.update(healthy=None, latency_ms=None, checked_at=None)
+            else:
+                entry.update(healthy=status.healthy,
+                             latency_ms=round(status.latency * 1000, 1) if status.latency is not None else None,
+                             checked_at=int(status.checked_at * 1000))
+                if status.error:
+                    entry['error'] = status.error
+            rank = (0, entry['latency_ms']) if entry['healthy'] and entry['latency_ms'] is not None else (1, 0)
+            entries.append((rank, index, entry))
+        entries.sort(key=lambda item: item[:2])
+        return [entry for _, _, entry in entries]
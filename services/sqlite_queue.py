@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import socketio
+from engineio import json
+
+from services.wire import EncodeOnceManager
+
+
+class SQLiteManager(socketio.PubSubManager, EncodeOnceManager):
+    """
+    基于 SQLite 的 Socket.IO 消息队列
+
+    同一台机器上的多个工作进程通过共享数据库文件转发广播，用于没有 Redis 的
+    本地多进程部署。每个进程轮询新写入的消息，并定期清理过期消息。
+    投递给本进程连接时每条广播只编码一次（见 EncodeOnceManager）。
+    设置了 on_remote_emit(event, data, room) 时，其他工作进程发出的广播在投递前
+    先交给它处理（如记录到本进程的消息历史）。
+
+    Args:
+        url: 形如 'sqlite:///path/to/queue.db' 的地址
+        channel: 频道名称，不同频道的消息互不可见
+        poll_interval: 没有新消息时的轮询间隔（秒）
+        retention: 消息保留时长（秒）
+    """
+    name = 'sqlite'
+    on_remote_emit = None
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None,
+                 poll_interval=0.01, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._conn = self._connect()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS socketio_queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'channel TEXT NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'created REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _publish(self, data):
+        self._conn.execute(
+            'INSERT INTO socketio_queue (channel, payload, created) VALUES (?, ?, ?)',
+            (self.channel, json.dumps(data), time.time())
+        )
+
+    def _handle_emit(self, message):
+        if self.on_remote_emit is not None and message.get('host_id') != self.host_id:
+            try:
+                self.on_remote_emit(message['event'], message['data'], message.get('room'))
+            except Exception:
+                self._get_logger().exception('处理其他工作进程的广播失败')
+        super()._handle_emit(message)
+
+    def _listen(self):
+        conn = self._connect()
+        # 只处理启动之后写入的消息
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_queue').fetchone()[0]
+        last_cleanup = time.time()
+        while True:
+            rows = conn.execute(
+                'SELECT id, payload FROM socketio_queue WHERE id > ? AND channel = ? ORDER BY id',
+                (last_id, self.channel)
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+
+            now = time.time()
+            if now - last_cleanup > self.retention:
+                conn.execute('DELETE FROM socketio_queue WHERE created < ?', (now - self.retention,))
+                last_cleanup = now
+
+            if not rows:
+                self.server.sleep(self.poll_interval)
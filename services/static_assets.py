@@ -0,0 +1,322 @@
+"""
+静态资源服务
+
+启动时扫描静态目录，为每个文件计算内容指纹并预先压缩，请求时只做字典查找：
+    - 模板通过 asset_url('js/chat.js') 得到带指纹的地址 /static/js/chat.<指纹>.js，
+      内容变化后地址随之变化，因此带指纹的地址可以长期缓存（immutable）
+    - 按 Accept-Encoding 返回预先压缩好的 br / gzip 版本（brotli 为可选依赖）
+    - 带 ETag，If-None-Match 命中时返回 304
+
+socket.io 客户端放在 static/vendor/ 下，离线环境无法访问 CDN。首次部署时在能联网的
+机器上执行下面的命令下载（固定版本，文件头带版本和许可证说明），再随代码一起分发：
+    python -m services.static_assets --fetch-vendor
+本地没有客户端时页面从 CDN 加载并在启动时记录警告；设置 CHAT_SOCKETIO_CDN=0 时改为拒绝启动。
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('chat.static')
+
+FINGERPRINT_LENGTH = 10
+# 小于该字节数的文件压缩收益不大，不生成压缩版本
+COMPRESS_MIN_SIZE = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = 'no-cache'
+
+SOCKETIO_CLIENT_VERSION = '4.5.4'
+VENDOR_FILES = {
+    'socket.io.min.js': f'https://cdn.socket.io/{SOCKETIO_CLIENT_VERSION}/socket.io.min.js',
+    'socket.io.msgpack.min.js': f'https://cdn.socket.io/{SOCKETIO_CLIENT_VERSION}/socket.io.msgpack.min.js',
+}
+VENDOR_HEADER = (f'/*! socket.io-client v{SOCKETIO_CLIENT_VERSION} | (c) Guillermo Rauch | MIT License\n'
+                 f' *  https://github.com/socketio/socket.io-client/blob/{SOCKETIO_CLIENT_VERSION}/LICENSE\n'
+                 ' *  source: {url} */\n')
+
+
+def socketio_client_name(serializer):
+    """服务器使用的序列化方式对应的 socket.io 客户端文件名（msgpack 需要内置解析器的版本）"""
+    return 'socket.io.msgpack.min.js' if serializer == 'msgpack' else 'socket.io.min.js'
+
+
+def parse_accept_encoding(header):
+    """
+    解析 Accept-Encoding，返回客户端接受的编码集合（忽略 q=0 的编码）
+
+    Args:
+        header: Accept-Encoding 请求头
+
+    Returns:
+        set: 小写的编码名称，'*' 表示接受任意编码
+    """
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name)
+    return accepted
+
+
+def etag_matches(header, etags):
+    """If-None-Match 是否与资源的任一 ETag 相同（弱比较）"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    for item in header.split(','):
+        item = item.strip()
+        if item.startswith('W/'):
+            item = item[2:]
+        if item in etags:
+            return True
+    return False
+
+
+class Asset:
+    """
+    一份静态内容及其预先压缩的版本
+
+    Args:
+        data: 原始内容（bytes）
+        content_type: Content-Type
+        compress: 是否生成压缩版本
+    """
+
+    __slots__ = ('content_type', 'digest', 'etag', 'variants', 'etags')
+
+    def __init__(self, data, content_type, compress=True):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.etag = f'"{self.digest[:16]}"'
+        # {编码: (内容, ETag)}，None 表示不压缩
+        self.variants = {None: (data, self.etag)}
+        if compress and len(data) >= COMPRESS_MIN_SIZE:
+            # mtime 固定为 0，同样的内容压缩结果也相同
+            self._add_variant('gzip', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add_variant('br', brotli.compress(data, quality=11))
+        self.etags = frozenset(etag for _, etag in self.variants.values())
+
+    def _add_variant(self, encoding, compressed):
+        if len(compressed) < len(self.variants[None][0]):
+            self.variants[encoding] = (compressed, f'"{self.digest[:16]}-{encoding}"')
+
+    def select(self, accept_encoding):
+        """按 Accept-Encoding 选择返回的版本，优先 br，其次 gzip"""
+        if len(self.variants) > 1:
+            accepted = parse_accept_encoding(accept_encoding)
+            for encoding in ('br', 'gzip'):
+                if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                    return encoding
+        return None
+
+    def respond(self, request_headers, cache_control):
+        """
+        构建响应
+
+        Args:
+            request_headers: 请求头（支持 get 的映射）
+            cache_control: Cache-Control 响应头
+
+        Returns:
+            tuple: (内容, 状态码, 响应头)，可以直接作为 Flask 视图的返回值
+        """
+        headers = {'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        encoding = self.select(request_headers.get('Accept-Encoding'))
+        body, etag = self.variants[encoding]
+        headers['ETag'] = etag
+        if etag_matches(request_headers.get('If-None-Match'), self.etags):
+            return b'', 304, headers
+        headers['Content-Type'] = self.content_type
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return body, 200, headers
+
+
+def guess_content_type(name):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type == 'application/javascript':
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def fingerprinted_name(name, digest):
+    """js/chat.js -> js/chat.<指纹>.js"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{digest[:FINGERPRINT_LENGTH]}{ext}'
+
+
+class StaticAssets:
+    """
+    带指纹和预压缩的静态资源表
+
+    Args:
+        root: 静态文件目录
+        url_prefix: 静态资源的 URL 前缀
+        auto_reload: 文件变化时是否重新扫描（调试模式使用）
+    """
+
+    def __init__(self, root, url_prefix='/static', auto_reload=False):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.auto_reload = auto_reload
+        # {相对路径: Asset}
+        self._assets = {}
+        # {带指纹的相对路径: 相对路径}
+        self._fingerprinted = {}
+        self._urls = {}
+        self._signature = None
+        self.load()
+
+    def _scan(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files.append((name, path, os.stat(path).st_mtime_ns))
+        return files
+
+    def load(self):
+        """扫描静态目录，计算指纹并预先压缩"""
+        files = self._scan() if os.path.isdir(self.root) else []
+        assets, fingerprinted, urls = {}, {}, {}
+        for name, path, _ in files:
+            with open(path, 'rb') as f:
+                data = f.read()
+            content_type = guess_content_type(name)
+            asset = Asset(data, content_type, compress=content_type.startswith(COMPRESSIBLE_TYPES))
+            assets[name] = asset
+            versioned = fingerprinted_name(name, asset.digest)
+            fingerprinted[versioned] = name
+            urls[name] = f'{self.url_prefix}/{versioned}'
+        self._assets, self._fingerprinted, self._urls = assets, fingerprinted, urls
+        self._signature = tuple(files)
+        logger.info("已加载静态资源 %d 个%s", len(assets), '' if brotli else '（未安装 brotli，只提供 gzip）')
+
+    def _check_reload(self):
+        if self.auto_reload and tuple(self._scan()) != self._signature:
+            self.load()
+
+    def exists(self, name):
+        self._check_reload()
+        return name in self._assets
+
+    def url(self, name):
+        """
+        静态资源带指纹的 URL
+
+        Args:
+            name: 相对静态目录的路径，如 'js/chat.js'
+
+        Returns:
+            str: URL，文件不存在时返回不带指纹的地址
+        """
+        self._check_reload()
+        return self._urls.get(name) or f'{self.url_prefix}/{name}'
+
+    def serve(self, path, request_headers):
+        """
+        处理 /static/<path> 请求
+
+        带指纹的地址长期缓存；不带指纹的地址每次使用前都需要用 ETag 重新验证。
+
+        Returns:
+            tuple | None: (内容, 状态码, 响应头)，文件不存在时返回 None
+        """
+        self._check_reload()
+        name = self._fingerprinted.get(path)
+        if name is not None:
+            return self._assets[name].respond(request_headers, CACHE_IMMUTABLE)
+        asset = self._assets.get(path)
+        if asset is not None:
+            return asset.respond(request_headers, CACHE_REVALIDATE)
+        return None
+
+
+class PageCache:
+    """
+    渲染结果缓存
+
+    页面内容只取决于少数参数（如序列化方式），按参数缓存渲染后的内容和压缩版本，
+    请求时不再经过模板渲染。页面本身不带指纹，浏览器每次用 ETag 重新验证。
+
+    Args:
+        enabled: 是否启用缓存，关闭时每次重新渲染（调试模式修改模板后立即生效）
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # {缓存键: Asset}
+        self._pages = {}
+
+    def serve(self, key, render, request_headers, content_type='text/html; charset=utf-8'):
+        """
+        Args:
+            key: 缓存键，需要包含所有影响页面内容的参数
+            render: 无参函数，返回渲染后的页面（str）
+            request_headers: 请求头
+
+        Returns:
+            tuple: (内容, 状态码, 响应头)
+        """
+        page = self._pages.get(key) if self.enabled else None
+        if page is None:
+            page = Asset(render().encode('utf-8'), content_type)
+            if self.enabled:
+                self._pages[key] = page
+        return page.respond(request_headers, CACHE_REVALIDATE)
+
+    def clear(self):
+        self._pages.clear()
+
+
+def fetch_vendor(root):
+    """下载 socket.io 客户端到 <root>/vendor/，文件头写入版本、许可证和下载地址"""
+    from urllib.request import urlopen
+
+    vendor_dir = os.path.join(root, 'vendor')
+    os.makedirs(vendor_dir, exist_ok=True)
+    for filename, url in VENDOR_FILES.items():
+        # 非 2xx 响应由 urlopen 抛出 HTTPError
+        with urlopen(url, timeout=30) as response:
+            content = response.read()
+        data = VENDOR_HEADER.format(url=url).encode('utf-8') + content
+        path = os.path.join(vendor_dir, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        print(f"{url} -> {path} ({len(data)} 字节, sha256 {hashlib.sha256(data).hexdigest()})")
+
+
+if __name__ == '__main__':
+    static_root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    if '--fetch-vendor' in sys.argv[1:]:
+        fetch_vendor(static_root)
+    else:
+        assets = StaticAssets(static_root)
+        for asset_name in sorted(assets._assets):
+            asset = assets._assets[asset_name]
+            sizes = ', '.join(f'{encoding or "identity"} {len(body)}' for encoding, (body, _) in asset.variants.items())
+            print(f'{assets.url(asset_name)}: {sizes}')
@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+
+logger = logging.getLogger('chat.transport')
+
+
+class Transport:
+    """
+    Socket.IO 传输层的占位对象
+
+    聊天核心（chat_core）和各个服务只通过这里发送事件、进出房间和启动后台任务，
+    不直接依赖 eventlet 或 asyncio。服务在导入时就要拿到发送对象，而具体实现要等
+    入口（app.py 或 asgi_app.py）创建好服务器后才能确定，因此先构造占位对象，
+    由入口调用 bind 绑定实现，之后的属性访问全部转给实现。
+
+    实现需要提供：
+        emit(event, data, to=None): 发送事件，可以在任意线程中调用
+        enter_room(sid, room) / leave_room(sid, room): 进出房间
+        disconnect(sid): 安排断开连接，不等待完成
+        room_size(room): 本进程中房间的连接数
+        start_background_task(target, *args, **kwargs): 启动后台任务，返回带 join() 的对象
+        sleep(seconds): 在后台任务中等待
+        call_soon(func, *args): 在处理事件的线程中执行 func，用于从后台线程回到核心
+    """
+
+    def __init__(self):
+        self._impl = None
+
+    def bind(self, impl):
+        self._impl = impl
+
+    @property
+    def bound(self):
+        return self._impl is not None
+
+    def __getattr__(self, name):
+        impl = self.__dict__.get('_impl')
+        if impl is None:
+            raise RuntimeError('传输层尚未绑定，请通过 app.py 或 asgi_app.py 启动')
+        return getattr(impl, name)
+
+
+class SocketIOTransport:
+    """
+    Flask-SocketIO（eventlet）的传输层
+
+    事件处理和后台任务都运行在同一个系统线程的绿色线程中，发送直接调用 SocketIO。
+
+    Args:
+        socketio: Flask-SocketIO 的 SocketIO 实例
+    """
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.start_background_task = socketio.start_background_task
+        self.sleep = socketio.sleep
+
+    def emit(self, event, data, to=None):
+        self.socketio.emit(event, data, to=to)
+
+    def enter_room(self, sid, room):
+        self.socketio.server.enter_room(sid, room, namespace='/')
+
+    def leave_room(self, sid, room):
+        self.socketio.server.leave_room(sid, room, namespace='/')
+
+    def disconnect(self, sid):
+        # 在后台任务中断开，不在当前事件处理中切换出去
+        self.socketio.start_background_task(self.socketio.server.disconnect, sid)
+
+    def room_size(self, room):
+        return len(self.socketio.server.manager.rooms.get('/', {}).get(room, ()))
+
+    def call_soon(self, func, *args):
+        func(*args)
+
+
+class AsyncServerTransport:
+    """
+    python-socketio AsyncServer（asyncio）的传输层
+
+    事件处理函数是同步的，直接在事件循环中执行；AsyncServer 的发送是协程，
+    这里把发送、进出房间和断开按调用顺序放入一个队列，由事件循环中的单个任务
+    依次执行，保证同一连接收到的事件顺序与调用顺序一致（与 eventlet 下相同）。
+    后台线程中的调用通过 call_soon_threadsafe 放入同一个队列。
+
+    后台任务（防抖发送、保留会话超时、服务器探测等）运行在守护线程中，
+    sleep 直接阻塞该线程，不影响事件循环；各服务的共享状态都已加锁。
+
+    Args:
+        sio: socketio.AsyncServer 实例
+    """
+
+    def __init__(self, sio):
+        self.sio = sio
+        self.sleep = time.sleep
+        self._loop = None
+        self._loop_thread = None
+        self._queue = None
+        self._pump_task = None
+
+    def start(self):
+        """在事件循环中调用，启动发送任务"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue = asyncio.Queue()
+        self._pump_task = self._loop.create_task(self._pump())
+
+    async def stop(self):
+        """发送完队列中剩余的事件后停止"""
+        if self._pump_task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._pump_task
+        self._pump_task = None
+
+    def _submit(self, func, *args, **kwargs):
+        item = (func, args, kwargs)
+        if threading.get_ident() == self._loop_thread:
+            self._queue.put_nowait(item)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        else:
+            raise RuntimeError('事件循环尚未启动')
+
+    async def _pump(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("发送事件失败: %s", getattr(func, '__name__', func))
+
+    def pending(self):
+        """队列中尚未执行的发送数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def emit(self, event, data, to=None):
+        self._submit(self.sio.emit, event, data, to=to)
+
+    def enter_room(self, sid, room):
+        # 房间成员变化也排队，之前排队的房间广播不会发给刚加入的连接
+        self._submit(self.sio.enter_room, sid, room)
+
+    def leave_room(self, sid, room):
+        self._submit(self.sio.leave_room, sid, room)
+
+    def disconnect(self, sid):
+        self._submit(self.sio.disconnect, sid)
+
+    def room_size(self, room):
+        return len(self.sio.manager.rooms.get('/', {}).get(room, ()))
+
+    def start_background_task(self, target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    def call_soon(self, func, *args):
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
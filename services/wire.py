@@ -0,0 +1,170 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+from socketio import packet
+
+try:
+    # python-socketio 5.9 起同步管理器为 socketio.Manager，包顶层不再导出 BaseManager
+    from socketio import Manager as SocketIOManager
+except ImportError:
+    from socketio import BaseManager as SocketIOManager
+
+logger = logging.getLogger('chat.wire')
+
+# 客户端可协商的消息格式
+WIRE_JSON = 'json'
+WIRE_COMPACT = 'compact'
+WIRE_FORMATS = (WIRE_JSON, WIRE_COMPACT)
+
+# 紧凑格式中的消息类型
+KIND_CHAT = 0
+KIND_SYSTEM = 1
+KIND_COMMAND = 2
+KIND_MOVIE = 3
+KIND_CHUANNONG = 4
+
+
+def now_ms():
+    """当前时间的毫秒时间戳，紧凑格式只发送它，由客户端本地格式化"""
+    return int(time.time() * 1000)
+
+
+def format_timestamp(ts):
+    """把毫秒时间戳格式化为完整格式使用的 'HH:MM:SS'"""
+    return datetime.fromtimestamp(ts / 1000).strftime('%H:%M:%S')
+
+
+def wire_room(room, wire):
+    """
+    房间内某种消息格式的客户端所在的子房间
+
+    房间消息按格式分别发送到子房间，其他事件仍发送到房间本身。
+    子房间名称包含不可打印字符，不会与用户创建的房间重名。
+    """
+    return f'{room}\x00{wire}'
+
+
+def split_wire_room(target):
+    """
+    拆分子房间名称
+
+    Returns:
+        tuple: (房间, 消息格式)，不是子房间时消息格式为 None
+    """
+    room, separator, wire = target.partition('\x00')
+    return (room, wire) if separator else (target, None)
+
+
+def compact_message(data):
+    """
+    把完整格式的房间消息转换为紧凑格式
+
+    完整格式: {'id', 'ts', 'timestamp', 'nickname', 'message', 'is_command', 'command_type', ...}
+    紧凑格式: [id, ts, nickname, message, kind, 附加字段...]
+        电影消息附加 movie_url, movie_meta；川小农消息附加 user_question, reply
+
+    Returns:
+        list: 紧凑格式的消息
+    """
+    command_type = data.get('command_type')
+    if command_type == 'movie':
+        return [data.get('id'), data['ts'], data['nickname'], data['message'], KIND_MOVIE,
+                data['movie_url'], data.get('movie_meta')]
+    if command_type == 'chuannong':
+        return [data.get('id'), data['ts'], data['nickname'], data['message'], KIND_CHUANNONG,
+                data.get('user_question', ''), data['reply']]
+    if data.get('is_system'):
+        kind = KIND_SYSTEM
+    elif data.get('is_command'):
+        kind = KIND_COMMAND
+    else:
+        kind = KIND_CHAT
+    return [data.get('id'), data['ts'], data['nickname'], data['message'], kind]
+
+
+class UnicodeJSON:
+    """
+    Socket.IO 数据包使用的 JSON 模块
+
+    标准库默认把中文转义为 \\uXXXX（6 字节），这里直接输出 UTF-8（3 字节）。
+    """
+
+    @staticmethod
+    def dumps(*args, **kwargs):
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(*args, **kwargs)
+
+    loads = staticmethod(json.loads)
+
+
+def resolve_serializer(name):
+    """
+    检查 Socket.IO 序列化方式是否可用
+
+    msgpack 需要安装 msgpack 包，且对所有客户端生效，客户端需要使用
+    socket.io-msgpack-parser；不可用时回退到默认的 JSON。
+    """
+    if name in (None, '', 'default', 'json'):
+        return 'default'
+    if name == 'msgpack':
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            logger.warning("未安装 msgpack，Socket.IO 序列化回退为 JSON")
+            return 'default'
+        return 'msgpack'
+    raise ValueError(f'未知的序列化方式: {name}')
+
+
+class EncodeOnceManager(SocketIOManager):
+    """
+    广播时只编码一次的客户端管理器
+
+    python-socketio 向房间广播时为每个接收者重新构建并编码一次数据包，
+    房间越大序列化开销越高。没有确认回调的广播内容对所有接收者相同，
+    这里先编码一次，再把同一份编码结果发给每个接收者。
+    设置了 outbound（services.outbox.OutboundQueues）时经由按客户端的有界队列发送。
+    """
+
+    outbound = None
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if callback is not None:
+            # 需要确认回调时每个接收者的数据包编号不同，只能逐个编码
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs)
+        if namespace not in self.rooms:
+            return
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        pkt = None
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            if pkt is None:
+                pkt = self._encoded_packet(event, data, namespace)
+            if self.outbound is None:
+                self.server._send_packet(eio_sid, pkt)
+            else:
+                self.outbound.send(eio_sid, pkt, event, data, room)
+
+    def disconnect(self, sid, namespace, **kwargs):
+        if self.outbound is not None:
+            eio_sid = self.eio_sid_from_sid(sid, namespace)
+            if eio_sid is not None:
+                self.outbound.forget(eio_sid)
+        return super().disconnect(sid, namespace, **kwargs)
+
+    def _encoded_packet(self, event, data, namespace):
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+        encoded = pkt.encode()
+        pkt.encode = lambda: encoded
+        return pkt
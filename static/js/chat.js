@@ -0,0 +1,1130 @@
+// 获取URL参数
+function getUrlParams() {
+    const params = {};
+    const queryString = window.location.search.substring(1);
+    const pairs = queryString.split('&');
+    for (const pair of pairs) {
+        const [key, value] = pair.split('=');
+        params[decodeURIComponent(key)] = decodeURIComponent(value || '');
+    }
+    return params;
+}
+
+const params = getUrlParams();
+const nickname = params.nickname || '匿名用户';
+// 当前所在房间，未指定时由服务器分配默认房间
+let currentRoom = params.room || '';
+const server = params.server || window.location.origin;
+
+// WebSocket连接 - 使用5004端口
+const socket = io('http://localhost:5004', {
+    query: { nickname: nickname },
+    transports: ['websocket']
+});
+
+// 会话恢复令牌，断线重连（包括刷新页面）时凭它接管原会话，按昵称保存在 sessionStorage
+const resumeKey = `resume_token:${nickname}`;
+let resumeToken = sessionStorage.getItem(resumeKey);
+// 服务器启动标识，本页面是否已经加入过房间
+let bootId = null;
+let hasJoined = false;
+
+// DOM元素
+const messagesContainer = document.getElementById('messages');
+const messageInput = document.getElementById('messageInput');
+const sendBtn = document.getElementById('sendBtn');
+const logoutBtn = document.getElementById('logoutBtn');
+const emojiBtn = document.getElementById('emojiBtn');
+const emojiPanel = document.getElementById('emojiPanel');
+const onlineCount = document.getElementById('onlineCount');
+const usersList = document.getElementById('usersList');
+const loadHistoryBtn = document.getElementById('loadHistoryBtn');
+const commandSuggest = document.getElementById('commandSuggest');
+const roomName = document.getElementById('roomName');
+const roomsList = document.getElementById('roomsList');
+const roomInput = document.getElementById('roomInput');
+const switchRoomBtn = document.getElementById('switchRoomBtn');
+
+// 常用emoji表情
+const emojis = [
+    '😊', '😂', '😍', '🤔', '😎', '😢', '😡', '👍',
+    '👎', '❤️', '🎉', '🎂', '🔥', '💯', '🙏', '👏',
+    '🎉', '🎁', '🎈', '🎯', '🎵', '🎸', '🎤', '🎧',
+    '😀', '😃', '😄', '😁', '😆', '😅', '🤣', '😂'
+];
+
+// 初始化emoji面板
+function initEmojiPanel() {
+    emojis.forEach(emoji => {
+        const emojiItem = document.createElement('div');
+        emojiItem.className = 'emoji-item';
+        emojiItem.textContent = emoji;
+        emojiItem.addEventListener('click', () => {
+            messageInput.value += emoji;
+            messageInput.focus();
+            checkSendButton();
+        });
+        emojiPanel.appendChild(emojiItem);
+    });
+}
+
+// 检查发送按钮状态
+function checkSendButton() {
+    sendBtn.disabled = messageInput.value.trim() === '';
+}
+
+// 自动调整输入框高度
+function adjustTextareaHeight() {
+    messageInput.style.height = 'auto';
+    messageInput.style.height = Math.min(messageInput.scrollHeight, 100) + 'px';
+}
+
+// 添加消息到聊天区域
+    // 消息内容、昵称和链接都来自用户输入，并会随历史回放发给之后加入的每个人，插入页面前一律转义
+    function addMessage(data, isSelf = false, beforeNode = null) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message';
+
+        if (data.is_system) {
+            messageDiv.className = 'message message-system';
+            messageDiv.innerHTML = `<div class="message-content">${escapeHtml(data.message)}</div>`;
+        } else if (data.is_command) {
+            messageDiv.className = 'message message-command';
+
+            if (data.command_type === 'movie' && data.movie_url) {
+                // 电影命令显示
+                messageDiv.innerHTML = `
+                    <div class="message-header">${escapeHtml(data.nickname)}</div>
+                    <div class="message-content">
+                        <div class="command-label">电影分享:</div>
+                        <div class="movie-container">
+                            <div class="movie-url">${escapeHtml(data.movie_url)}</div>
+                            ${formatMovieMeta(data.movie_meta)}
+                            <div class="movie-player-placeholder">
+                                <button class="play-btn" data-movie-url="${escapeHtml(data.movie_url)}">点击播放</button>
+                            </div>
+                        </div>
+                    </div>
+                    <div class="message-time">${escapeHtml(data.timestamp || '')}</div>
+                `;
+            } else if (data.command_type === 'chuannong' && data.reply) {
+                // 川小农命令显示
+                messageDiv.innerHTML = `
+                    <div class="message-header">${escapeHtml(data.nickname)}</div>
+                    <div class="message-content">
+                        <div class="command-label">AI对话:</div>
+                        <div class="ai-question">问: ${escapeHtml(data.user_question || '')}</div>
+                        <div class="ai-reply">
+                            <strong>川小农:</strong> ${escapeHtml(data.reply)}
+                        </div>
+                    </div>
+                    <div class="message-time">${escapeHtml(data.timestamp || '')}</div>
+                `;
+            } else if (data.command_type === 'search') {
+                // 搜索结果，只有搜索者能看到
+                messageDiv.innerHTML = `
+                    <div class="message-content">
+                        <div class="command-label">${escapeHtml(data.message)}</div>
+                        ${formatSearchResults(data)}
+                    </div>
+                `;
+            } else {
+                // 通用命令显示
+                messageDiv.innerHTML = `<div class="message-content">${escapeHtml(data.message)}</div>`;
+            }
+        } else {
+            messageDiv.className = `message ${isSelf ? 'message-self' : 'message-other'}`;
+
+            if (!isSelf) {
+                messageDiv.innerHTML = `
+                    <div class="message-header">${escapeHtml(data.nickname)}</div>
+                    <div class="message-content">${formatMessage(data.message)}</div>
+                    <div class="message-time">${escapeHtml(data.timestamp || '')}</div>
+                `;
+            } else {
+                messageDiv.innerHTML = `
+                    <div class="message-content">${formatMessage(data.message)}</div>
+                    <div class="message-time">${escapeHtml(data.timestamp || '')}</div>
+                `;
+            }
+        }
+
+        if (beforeNode) {
+            // 插入更早的历史消息时保持当前阅读位置
+            const previousHeight = messagesContainer.scrollHeight;
+            messagesContainer.insertBefore(messageDiv, beforeNode);
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+        } else {
+            messagesContainer.appendChild(messageDiv);
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+        return messageDiv;
+    }
+
+    // 播放电影函数
+    function playMovie(movieUrl) {
+        // 创建播放模态框
+        const modal = document.createElement('div');
+        modal.style.cssText = `
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0, 0, 0, 0.9);
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            z-index: 1000;
+            padding: 20px;
+            box-sizing: border-box;
+        `;
+
+        const player = document.createElement('div');
+        player.style.cssText = `
+            background: black;
+            border-radius: 8px;
+            overflow: hidden;
+            max-width: 95%;
+            max-height: 95%;
+            position: relative;
+            width: 100%;
+            aspect-ratio: 16/9;
+        `;
+
+        const closeBtn = document.createElement('button');
+        closeBtn.textContent = '关闭';
+        closeBtn.style.cssText = `
+            position: absolute;
+            top: 10px;
+            right: 10px;
+            background: rgba(0, 0, 0, 0.7);
+            color: white;
+            border: none;
+            padding: 10px 20px;
+            border-radius: 4px;
+            cursor: pointer;
+            font-size: 16px;
+            z-index: 10;
+            transition: background 0.3s;
+        `;
+
+        closeBtn.onmouseenter = () => {
+            closeBtn.style.background = 'rgba(255, 0, 0, 0.8)';
+        };
+
+        closeBtn.onmouseleave = () => {
+            closeBtn.style.background = 'rgba(0, 0, 0, 0.7)';
+        };
+
+        closeBtn.onclick = () => {
+            document.body.removeChild(modal);
+        };
+
+        // 判断是否为腾讯视频
+        if (movieUrl.includes('v.qq.com')) {
+            // 对于腾讯视频，使用iframe嵌入
+            const iframe = document.createElement('iframe');
+
+            // 提取腾讯视频ID
+            let videoId = '';
+            // 从URL中提取视频ID (通常是最后一个斜杠后的部分，去掉.html)
+            const idMatch = movieUrl.match(/\/([^/]+)\.html/);
+            if (idMatch && idMatch[1]) {
+                videoId = idMatch[1];
+            }
+
+            // 构建腾讯视频嵌入链接 (使用官方播放器)
+            let embedUrl = '';
+            if (videoId) {
+                embedUrl = `https://v.qq.com/iframe/player.html?vid=${videoId}&tiny=0&auto=0`;
+            } else {
+                // 如果无法提取ID，尝试使用原始URL构建嵌入链接
+                embedUrl = `https://v.qq.com/iframe/player.html?url=${encodeURIComponent(movieUrl)}&tiny=0&auto=0`;
+            }
+
+            iframe.src = embedUrl;
+            iframe.allowFullscreen = true;
+            iframe.sandbox = 'allow-same-origin allow-scripts allow-popups allow-forms allow-pointer-lock';
+            iframe.allow = 'accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture';
+            iframe.style.cssText = `
+                width: 100%;
+                height: 100%;
+                border: none;
+                display: block;
+            `;
+            iframe.setAttribute('scrolling', 'no');
+            iframe.setAttribute('frameborder', '0');
+
+            player.appendChild(iframe);
+        }
+        // 判断是否为B站视频
+        else if (movieUrl.includes('bilibili.com')) {
+            // 对于B站视频，使用B站官方嵌入API
+            const iframe = document.createElement('iframe');
+
+            // 尝试从URL中提取BV号或EP号
+            let videoId = '';
+            let isBangumi = false;
+
+            // 处理不同格式的B站链接
+            if (movieUrl.includes('bilibili.com/video/')) {
+                // 普通视频链接
+                const bvMatch = movieUrl.match(/BV[0-9A-Za-z]+/);
+                if (bvMatch) {
+                    videoId = bvMatch[0];
+                }
+            } else if (movieUrl.includes('bilibili.com/bangumi/play/')) {
+                // 番剧链接
+                const epMatch = movieUrl.match(/ep\d+/);
+                if (epMatch) {
+                    videoId = epMatch[0];
+                    isBangumi = true;
+                }
+            }
+
+            // 构建B站官方嵌入链接
+            let embedUrl = '';
+            if (videoId) {
+                if (isBangumi) {
+                    embedUrl = `https://player.bilibili.com/player.html?aid=&cid=&page=1&as_wide=1&high_quality=1&danmaku=0&${videoId}`;
+                } else {
+                    embedUrl = `https://player.bilibili.com/player.html?bvid=${videoId}&page=1&as_wide=1&high_quality=1&danmaku=0`;
+                }
+            } else {
+                // 如果无法提取ID，则使用原始URL但改为官方播放器
+                embedUrl = `https://player.bilibili.com/player.html?as_wide=1&high_quality=1&danmaku=0&url=${encodeURIComponent(movieUrl)}`;
+            }
+
+            iframe.src = embedUrl;
+            iframe.allowFullscreen = true;
+            iframe.sandbox = 'allow-same-origin allow-scripts allow-popups allow-forms allow-pointer-lock';
+            iframe.allow = 'accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture';
+            iframe.style.cssText = `
+                width: 100%;
+                height: 100%;
+                border: none;
+                display: block;
+            `;
+            iframe.setAttribute('scrolling', 'no');
+            iframe.setAttribute('frameborder', '0');
+
+            player.appendChild(iframe);
+        } else {
+            // 对于其他视频，使用video标签
+            const video = document.createElement('video');
+            video.src = movieUrl;
+            video.controls = true;
+            video.crossOrigin = 'anonymous';
+            video.style.cssText = `
+                width: 100%;
+                height: 100%;
+                object-fit: contain;
+            `;
+
+            closeBtn.onclick = () => {
+                video.pause();
+                document.body.removeChild(modal);
+            };
+
+            player.appendChild(video);
+
+            // 自动开始播放（如果浏览器允许）
+            video.play().catch(error => {
+                console.log('无法自动播放视频:', error);
+            });
+        }
+
+        player.appendChild(closeBtn);
+        modal.appendChild(player);
+        document.body.appendChild(modal);
+    }
+
+    // 退出聊天室函数
+    function logout() {
+        window.isUserInitiatedLogout = true;
+        sessionStorage.removeItem(resumeKey);
+        // 服务器确认退出后再断开连接，否则断开可能先于 logout 处理，会话会被保留等待重连
+        if (socket) {
+            socket.emit('logout', () => socket.disconnect());
+        }
+        // 重定向到登录页面
+        setTimeout(function() {
+            window.location.href = '/';
+        }, 500);
+    }
+
+// 显示服务器探测到的影片信息
+function formatMovieMeta(meta) {
+    if (!meta || meta.reachable === null || meta.reachable === undefined) {
+        return '';
+    }
+    // 元数据来自第三方服务器的响应头，插入页面前一律转义
+    if (!meta.reachable) {
+        return `<div class="movie-meta unreachable">⚠ 链接无法访问${meta.status ? ` (${escapeHtml(meta.status)})` : ''}</div>`;
+    }
+    const parts = [];
+    if (meta.content_type) {
+        parts.push(escapeHtml(meta.content_type));
+    }
+    if (meta.size) {
+        parts.push(formatSize(Number(meta.size)));
+    }
+    return parts.length ? `<div class="movie-meta">${parts.join(' · ')}</div>` : '';
+}
+
+function formatSize(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let size = bytes;
+    let unit = 0;
+    while (size >= 1024 && unit < units.length - 1) {
+        size /= 1024;
+        unit++;
+    }
+    return `${size.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+}
+
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+}
+
+// 搜索结果列表，有更多结果时显示下一页按钮
+function formatSearchResults(data) {
+    const items = (data.results || []).map(item => `
+        <div class="search-result">
+            <span class="search-result-meta">${escapeHtml(item.nickname)} · ${formatTime(item.ts)}</span>
+            <div class="search-result-text">${escapeHtml(item.text)}</div>
+        </div>
+    `).join('');
+    const more = data.has_more
+        ? `<button class="search-more" data-command="@搜索 ${escapeHtml(data.query)} #${data.page + 1}">下一页</button>`
+        : (data.truncated ? '<div class="search-result-meta">更早的消息未全部检索，请尝试更具体的关键词</div>' : '');
+    return items + more;
+}
+
+// 格式化消息（支持@高亮），先转义再加高亮标记
+function formatMessage(message) {
+    // 高亮@命令
+    return escapeHtml(message).replace(/(@\S+)/g, '<strong>$1</strong>');
+}
+
+// 添加用户到用户列表
+function addUserToSidebar(username) {
+    const userItem = document.createElement('div');
+    userItem.className = 'user-item';
+    userItem.id = `user-${username}`;
+    userItem.innerHTML = `
+        <div class="user-avatar">${escapeHtml(username.charAt(0).toUpperCase())}</div>
+        <div class="user-name">${escapeHtml(username)}</div>
+    `;
+    usersList.appendChild(userItem);
+}
+
+// 从用户列表移除用户
+function removeUserFromSidebar(username) {
+    const userItem = document.getElementById(`user-${username}`);
+    if (userItem) {
+        userItem.remove();
+    }
+}
+
+// 初始化事件监听
+function initEventListeners() {
+    // 加载更早的历史消息
+    loadHistoryBtn.addEventListener('click', () => {
+        if (oldestMessageId !== null) {
+            socket.emit('history_before', { cursor: oldestMessageId });
+        }
+    });
+
+    // 进入或新建房间
+    switchRoomBtn.addEventListener('click', () => switchRoom(roomInput.value.trim()));
+    roomInput.addEventListener('keydown', (e) => {
+        if (e.key === 'Enter') {
+            switchRoom(roomInput.value.trim());
+        }
+    });
+    roomsList.addEventListener('click', (e) => {
+        const item = e.target.closest('.room-item');
+        if (item) {
+            switchRoom(item.dataset.room);
+        }
+    });
+
+    // 为播放按钮添加事件委托
+    messagesContainer.addEventListener('click', (e) => {
+        const playBtn = e.target.closest('.play-btn');
+        if (playBtn) {
+            const movieUrl = playBtn.getAttribute('data-movie-url');
+            if (movieUrl) {
+                playMovie(movieUrl);
+            }
+        }
+        // 补齐跳过的消息
+        const gapBtn = e.target.closest('.gap-load');
+        if (gapBtn) {
+            socket.emit('history_before', {
+                cursor: Number(gapBtn.getAttribute('data-cursor')),
+                limit: Number(gapBtn.getAttribute('data-limit'))
+            });
+            gapBtn.disabled = true;
+        }
+        // 搜索结果翻页
+        const moreBtn = e.target.closest('.search-more');
+        if (moreBtn) {
+            socket.emit('send_message', { message: moreBtn.getAttribute('data-command') });
+            moreBtn.remove();
+        }
+    });
+    // 输入框事件
+    messageInput.addEventListener('input', () => {
+        checkSendButton();
+        adjustTextareaHeight();
+        scheduleSuggest();
+    });
+
+    // 发送按钮点击事件
+    sendBtn.addEventListener('click', sendMessage);
+
+    // 回车键发送消息
+    messageInput.addEventListener('keydown', (e) => {
+        if (handleSuggestKey(e)) {
+            return;
+        }
+        if (e.key === 'Enter' && !e.shiftKey) {
+            e.preventDefault();
+            sendMessage();
+        }
+    });
+
+    // 退出按钮点击事件
+    logoutBtn.addEventListener('click', () => {
+        if (confirm('确定要退出聊天室吗？')) {
+            window.isUserInitiatedLogout = true;
+            sessionStorage.removeItem(resumeKey);
+            socket.emit('logout', () => {
+                socket.disconnect();
+                window.location.href = '/';
+            });
+            // 服务器没有响应时也返回登录页
+            setTimeout(() => {
+                window.location.href = '/';
+            }, 1000);
+        }
+    });
+
+    // emoji按钮点击事件
+    emojiBtn.addEventListener('click', () => {
+        emojiPanel.classList.toggle('show');
+    });
+
+    // 点击外部关闭emoji面板
+    document.addEventListener('click', (e) => {
+        if (!emojiBtn.contains(e.target) && !emojiPanel.contains(e.target)) {
+            emojiPanel.classList.remove('show');
+        }
+        if (!commandSuggest.contains(e.target) && e.target !== messageInput) {
+            hideSuggest();
+        }
+    });
+}
+
+// 发送消息
+function sendMessage() {
+    const message = messageInput.value.trim();
+    if (!message) return;
+
+    socket.emit('send_message', {
+        nickname: nickname,
+        message: message
+    });
+
+    // 清空输入框
+    messageInput.value = '';
+    sendBtn.disabled = true;
+    messageInput.style.height = 'auto';
+    hideSuggest();
+}
+
+// 命令自动补全：输入以 @ 开头且还未输入参数时，停顿片刻后向服务器查询
+const SUGGEST_DELAY = 120;
+let suggestTimer = null;
+let suggestItems = [];
+let suggestIndex = 0;
+
+function scheduleSuggest() {
+    clearTimeout(suggestTimer);
+    const text = messageInput.value;
+    if (!text.startsWith('@') || /\s/.test(text)) {
+        hideSuggest();
+        return;
+    }
+    suggestTimer = setTimeout(() => {
+        socket.emit('command_suggest', { prefix: text }, (reply) => {
+            // 忽略输入已变化后才返回的旧结果
+            if (reply && reply.prefix === messageInput.value) {
+                showSuggest(reply.suggestions);
+            }
+        });
+    }, SUGGEST_DELAY);
+}
+
+function showSuggest(suggestions) {
+    suggestItems = suggestions;
+    suggestIndex = 0;
+    commandSuggest.innerHTML = '';
+    if (suggestions.length === 0) {
+        hideSuggest();
+        return;
+    }
+    suggestions.forEach((item, index) => {
+        const node = document.createElement('div');
+        node.className = 'suggest-item' + (index === 0 ? ' active' : '');
+        if (item.alias) {
+            node.textContent = `${item.alias} → ${item.command}`;
+        } else {
+            node.textContent = item.aliases && item.aliases.length
+                ? `${item.command}（${item.aliases.join('、')}）`
+                : item.command;
+        }
+        if (item.description) {
+            const description = document.createElement('small');
+            description.textContent = item.description;
+            node.appendChild(description);
+        }
+        node.addEventListener('click', () => applySuggest(index));
+        commandSuggest.appendChild(node);
+    });
+    commandSuggest.classList.add('show');
+}
+
+function hideSuggest() {
+    clearTimeout(suggestTimer);
+    suggestItems = [];
+    commandSuggest.classList.remove('show');
+}
+
+function applySuggest(index) {
+    const item = suggestItems[index];
+    if (!item) return;
+    messageInput.value = item.command + ' ';
+    hideSuggest();
+    checkSendButton();
+    messageInput.focus();
+}
+
+// 补全列表显示时，上下键选择，Tab 或回车补全，Esc 关闭
+function handleSuggestKey(e) {
+    if (suggestItems.length === 0) {
+        return false;
+    }
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        const step = e.key === 'ArrowDown' ? 1 : suggestItems.length - 1;
+        suggestIndex = (suggestIndex + step) % suggestItems.length;
+        commandSuggest.querySelectorAll('.suggest-item').forEach((node, index) => {
+            node.classList.toggle('active', index === suggestIndex);
+        });
+    } else if (e.key === 'Tab' || e.key === 'Enter') {
+        applySuggest(suggestIndex);
+    } else if (e.key === 'Escape') {
+        hideSuggest();
+    } else {
+        return false;
+    }
+    e.preventDefault();
+    return true;
+}
+
+// 切换房间，服务器确认后通过 room_joined 返回新房间的状态
+function switchRoom(room) {
+    if (room && room !== currentRoom) {
+        socket.emit('switch_room', { room: room });
+    }
+}
+
+// 刷新房间列表
+function refreshRooms() {
+    socket.emit('list_rooms', (reply) => {
+        if (!reply) return;
+        roomsList.innerHTML = '';
+        reply.rooms.forEach(item => {
+            const node = document.createElement('div');
+            node.className = 'room-item' + (item.room === currentRoom ? ' active' : '');
+            node.dataset.room = item.room;
+            const name = document.createElement('span');
+            name.textContent = item.room;
+            const count = document.createElement('span');
+            count.textContent = item.online_count;
+            node.appendChild(name);
+            node.appendChild(count);
+            roomsList.appendChild(node);
+        });
+    });
+}
+
+// 进入房间：清空上一个房间的消息和名单，显示新房间的快照和最近消息
+function enterRoom(data) {
+    currentRoom = data.room;
+    roomName.textContent = data.room;
+    roomInput.value = '';
+    const url = new URL(window.location.href);
+    url.searchParams.set('room', data.room);
+    window.history.replaceState(null, '', url);
+
+    messagesContainer.querySelectorAll('.message').forEach(node => node.remove());
+    seenMessageIds.clear();
+    droppedGaps.clear();
+    oldestMessageId = null;
+    oldestMessageNode = null;
+    applyPresenceSnapshot({
+        room: data.room,
+        users: data.users,
+        version: data.presence_version,
+        online_count: data.online_count
+    });
+    // 回放进入前的最近消息
+    showHistory(data.history || [], false);
+    loadHistoryBtn.classList.toggle('show', oldestMessageId !== null && oldestMessageId > 1);
+    refreshRooms();
+}
+
+// 在线名单及其版本号
+let presenceVersion = 0;
+const onlineUsers = new Set();
+
+// 用完整快照替换在线名单
+function applyPresenceSnapshot(data) {
+    if (data.room !== currentRoom) {
+        return;
+    }
+    presenceVersion = data.version;
+    onlineUsers.clear();
+    usersList.innerHTML = '';
+    (data.users || []).forEach(username => {
+        onlineUsers.add(username);
+        addUserToSidebar(username);
+    });
+    onlineCount.textContent = data.online_count;
+}
+
+// 应用一次在线名单增量，人数较多时只显示汇总提示
+function applyPresenceDelta(data) {
+    presenceVersion = data.version;
+    const added = data.added.filter(username => !onlineUsers.has(username));
+    const removed = data.removed.filter(username => onlineUsers.has(username));
+    added.forEach(username => {
+        onlineUsers.add(username);
+        addUserToSidebar(username);
+    });
+    removed.forEach(username => {
+        onlineUsers.delete(username);
+        removeUserFromSidebar(username);
+    });
+    onlineCount.textContent = data.online_count;
+
+    announcePresence(added.filter(username => username !== nickname), '加入了聊天室！');
+    announcePresence(removed, '离开了聊天室！');
+}
+
+function announcePresence(usernames, action) {
+    if (usernames.length === 0) {
+        return;
+    }
+    const message = usernames.length <= 5
+        ? `${usernames.join('、')} ${action}`
+        : `${usernames.length} 位用户${action}`;
+    addMessage({ is_system: true, message: message });
+}
+
+// 已显示的消息编号，重连后回放的历史消息不重复显示
+const seenMessageIds = new Set();
+// 已显示的最早一条历史消息，用作向前翻页的游标和插入位置
+let oldestMessageId = null;
+let oldestMessageNode = null;
+
+// 显示历史消息，prepend 为 true 时按从新到旧的顺序插入到最早一条消息之前
+function showHistory(messages, hasMore, prepend = false) {
+    messages.forEach(data => {
+        if (data.id === undefined || seenMessageIds.has(data.id)) {
+            return;
+        }
+        seenMessageIds.add(data.id);
+        const node = addMessage(data, data.nickname === nickname, prepend ? oldestMessageNode : null);
+        if (oldestMessageId === null || data.id < oldestMessageId) {
+            oldestMessageId = data.id;
+            oldestMessageNode = node;
+        }
+    });
+    loadHistoryBtn.classList.toggle('show', hasMore);
+}
+
+// 接收过慢时跳过的消息的提示：{补齐请求的游标: 提示节点}
+const droppedGaps = new Map();
+
+// 执行中的异步命令占位提示：{request_id: 节点}
+const pendingCommands = new Map();
+
+// 紧凑格式的消息类型，与服务器 services/wire.py 一致
+const KIND_SYSTEM = 1;
+const KIND_COMMAND = 2;
+const KIND_MOVIE = 3;
+const KIND_CHUANNONG = 4;
+
+// 把毫秒时间戳格式化为 HH:MM:SS
+function formatTime(ts) {
+    const date = new Date(ts);
+    return [date.getHours(), date.getMinutes(), date.getSeconds()]
+        .map(n => String(n).padStart(2, '0')).join(':');
+}
+
+// 紧凑格式 [id, ts, nickname, message, kind, 附加字段...] 还原为完整格式，完整格式原样返回
+function decodeMessage(item) {
+    if (!Array.isArray(item)) {
+        return item;
+    }
+    const [id, ts, nickname, message, kind, extra1, extra2] = item;
+    const data = {
+        id: id === null ? undefined : id,
+        ts: ts,
+        timestamp: formatTime(ts),
+        nickname: nickname,
+        message: message,
+        is_system: kind === KIND_SYSTEM,
+        is_command: kind >= KIND_COMMAND
+    };
+    if (kind === KIND_MOVIE) {
+        data.command_type = 'movie';
+        data.movie_url = extra1;
+        data.movie_meta = extra2;
+    } else if (kind === KIND_CHUANNONG) {
+        data.command_type = 'chuannong';
+        data.user_question = extra1;
+        data.reply = extra2;
+    }
+    return data;
+}
+
+// 处理一条新消息
+function handleNewMessage(item) {
+    const data = decodeMessage(item);
+    if (data.id !== undefined) {
+        if (seenMessageIds.has(data.id)) {
+            return;
+        }
+        seenMessageIds.add(data.id);
+    }
+    const isSelf = data.nickname === nickname;
+    const node = addMessage(data, isSelf);
+    if (data.id !== undefined && oldestMessageId === null) {
+        oldestMessageId = data.id;
+        oldestMessageNode = node;
+    }
+
+    // 更新在线人数
+    if (data.online_count !== undefined) {
+        document.getElementById('onlineCount').textContent = data.online_count;
+    }
+}
+
+// 加入请求：带上恢复令牌；本页面已加入过房间时再带上重连前的状态，服务器只补发错过的消息
+function buildJoinRequest() {
+    const request = { nickname: nickname, room: currentRoom, wire: 'compact' };
+    if (resumeToken) {
+        request.resume_token = resumeToken;
+    }
+    if (hasJoined) {
+        let lastId = 0;
+        seenMessageIds.forEach(id => {
+            if (id > lastId) {
+                lastId = id;
+            }
+        });
+        request.last_id = lastId;
+        request.presence_version = presenceVersion;
+        request.boot_id = bootId;
+    }
+    return request;
+}
+
+// 重连后补齐错过的消息，在线名单有变化时服务器会附带完整名单
+function applyResume(data) {
+    data.missed.forEach(handleNewMessage);
+    if (data.users) {
+        applyPresenceSnapshot({
+            room: data.room,
+            users: data.users,
+            version: data.presence_version,
+            online_count: data.online_count
+        });
+    } else {
+        onlineCount.textContent = data.online_count;
+    }
+    addMessage({
+        is_system: true,
+        message: data.missed.length ? `已重新连接，补齐了 ${data.missed.length} 条消息` : '已重新连接'
+    });
+}
+
+// WebSocket事件监听
+function initSocketListeners() {
+    // 连接成功
+    socket.on('connect', () => {
+        console.log('WebSocket连接成功');
+        // 发送加入房间请求，断线重连时带上恢复令牌
+        socket.emit('join', buildJoinRequest());
+    });
+
+    // 连接断开
+    socket.on('disconnect', () => {
+        console.log('WebSocket连接断开');
+        // 只有在不是主动退出的情况下才显示提示
+        if (!window.isUserInitiatedLogout) {
+            addMessage({
+                is_system: true,
+                message: '连接已断开，正在重新连接...'
+            });
+        }
+    });
+
+    // 加入房间成功
+    socket.on('join_success', (data) => {
+        if (data.resume_token) {
+            resumeToken = data.resume_token;
+            sessionStorage.setItem(resumeKey, resumeToken);
+        }
+        bootId = data.boot_id;
+        const rejoined = hasJoined;
+        hasJoined = true;
+        if (data.missed) {
+            applyResume(data);
+            return;
+        }
+        enterRoom(data);
+        if (rejoined) {
+            addMessage({ is_system: true, message: '已重新连接' });
+            return;
+        }
+        addMessage({
+            is_system: true,
+            message: `欢迎 ${data.nickname} 加入聊天室 ${data.room}！`
+        });
+    });
+
+    // 切换房间成功
+    socket.on('room_joined', (data) => {
+        enterRoom(data);
+        addMessage({ is_system: true, message: `已进入房间 ${data.room}` });
+    });
+
+    // 向前翻页得到的历史消息
+    socket.on('history_page', (data) => {
+        const gapNode = droppedGaps.get(data.cursor);
+        if (gapNode) {
+            // 补齐接收过慢时跳过的消息：按时间顺序插入到提示之后
+            droppedGaps.delete(data.cursor);
+            const anchor = gapNode.nextSibling;
+            data.messages.forEach(item => {
+                if (item.id === undefined || seenMessageIds.has(item.id)) {
+                    return;
+                }
+                seenMessageIds.add(item.id);
+                addMessage(item, item.nickname === nickname, anchor);
+            });
+            // 一页没有补齐时，提示留在已补齐的消息之前，继续向前补齐
+            const button = gapNode.querySelector('.gap-load');
+            const firstId = Number(button.getAttribute('data-first'));
+            const cursor = data.messages.length ? data.messages[0].id : firstId;
+            if (data.has_more && cursor > firstId) {
+                button.setAttribute('data-cursor', cursor);
+                button.setAttribute('data-limit', cursor - firstId);
+                button.disabled = false;
+                droppedGaps.set(cursor, gapNode);
+            } else {
+                gapNode.remove();
+            }
+            return;
+        }
+        // 从新到旧逐条插入到最早一条消息之前
+        showHistory(data.messages.slice().reverse(), data.has_more, true);
+    });
+
+    // 网络较慢时服务器跳过了部分消息，显示提示，点击后按编号补齐
+    socket.on('messages_dropped', (data) => {
+        if (data.room !== currentRoom) {
+            return;
+        }
+        const cursor = data.last_id + 1;
+        const gapNode = addMessage({ is_system: true, message: `网络较慢，跳过了 ${data.count} 条消息 ` });
+        // 消息内容按文本插入，加载按钮单独创建
+        const button = document.createElement('button');
+        button.className = 'gap-load';
+        button.textContent = '加载';
+        button.dataset.cursor = cursor;
+        button.dataset.first = data.first_id;
+        button.dataset.limit = cursor - data.first_id;
+        gapNode.querySelector('.message-content').appendChild(button);
+        droppedGaps.set(cursor, gapNode);
+    });
+
+    // 在线名单增量：版本连续时直接应用，出现缺口时请求完整快照
+    socket.on('presence_delta', (data) => {
+        // 切换房间前发出的上一个房间的增量直接忽略
+        if (data.room !== currentRoom || data.version <= presenceVersion) {
+            return;
+        }
+        if (data.base_version !== presenceVersion) {
+            socket.emit('presence_sync');
+            return;
+        }
+        applyPresenceDelta(data);
+    });
+
+    // 完整快照：重新同步的结果，或多进程部署时广播的名单变化；版本更旧的快照直接忽略
+    socket.on('presence_snapshot', (data) => {
+        if (data.room !== currentRoom || data.version < presenceVersion) {
+            return;
+        }
+        const before = new Set(onlineUsers);
+        applyPresenceSnapshot(data);
+        const users = new Set(data.users || []);
+        announcePresence([...users].filter(username => !before.has(username) && username !== nickname), '加入了聊天室！');
+        announcePresence([...before].filter(username => !users.has(username)), '离开了聊天室！');
+    });
+
+    // 收到新消息
+    socket.on('new_message', handleNewMessage);
+
+    // 收到合并发送的一批消息，按顺序逐条显示
+    socket.on('message_batch', (data) => {
+        data.messages.forEach(handleNewMessage);
+    });
+
+    // 异步命令已提交，显示占位提示
+    socket.on('command_pending', (data) => {
+        pendingCommands.set(data.request_id, addMessage({
+            is_system: true,
+            message: `⏳ 正在执行 ${data.command_name} ...`
+        }));
+    });
+
+    // 异步命令执行完成，移除占位提示；成功的结果已通过 new_message 广播
+    socket.on('command_result', (data) => {
+        const placeholder = pendingCommands.get(data.request_id);
+        if (placeholder) {
+            placeholder.remove();
+            pendingCommands.delete(data.request_id);
+        }
+        if (!data.success) {
+            addMessage({
+                is_system: true,
+                message: data.message
+            });
+        }
+    });
+
+    // 收到命令响应
+    socket.on('command_response', (data) => {
+        // 确保添加is_command标志，并保留所有可能的命令特定字段
+        const messageData = {
+            is_command: true,
+            message: data.message,
+            timestamp: new Date().toLocaleString() // 添加时间戳
+        };
+
+        // 保留命令类型特定字段
+        if (data.command_type) {
+            messageData.command_type = data.command_type;
+        }
+
+        // 保留电影相关字段
+        if (data.movie_url) {
+            messageData.movie_url = data.movie_url;
+        }
+
+        // 保留川小农相关字段
+        if (data.reply) {
+            messageData.reply = data.reply;
+        }
+
+        // 保留用户信息
+        if (data.nickname) {
+            messageData.nickname = data.nickname;
+        }
+
+        if (data.user_question) {
+            messageData.user_question = data.user_question;
+        }
+
+        // 保留搜索结果字段
+        if (data.command_type === 'search') {
+            Object.assign(messageData, {
+                query: data.query,
+                page: data.page,
+                has_more: data.has_more,
+                truncated: data.truncated,
+                results: data.results
+            });
+        }
+
+        addMessage(messageData);
+    });
+
+    // 错误消息
+    socket.on('error', (data) => {
+        addMessage({
+            is_system: true,
+            message: `错误: ${data.message}`
+        });
+        // 如果是昵称重复错误，返回登录页
+        if (data.message.includes('昵称已被使用')) {
+            setTimeout(() => {
+                window.location.href = '/';
+            }, 2000);
+        }
+    });
+}
+
+// 处理命令
+function handleCommand(data) {
+    // 这里只做简单的响应，具体功能将在后续实现
+    setTimeout(() => {
+        let response = '';
+
+        if (data.command_type === 'movie') {
+            response = `🎬 电影命令已触发，URL: ${data.command_data}（功能开发中）`;
+        } else if (data.command_type === 'ai_chat') {
+            response = `🤖 与川小农的对话功能开发中...`;
+        }
+
+        if (response) {
+            socket.emit('command_response', {
+                message: response
+            });
+        }
+    }, 1000);
+}
+
+// 初始化应用
+function init() {
+    initEmojiPanel();
+    initEventListeners();
+    initSocketListeners();
+    adjustTextareaHeight();
+    // 定期刷新房间列表中的在线人数
+    setInterval(() => {
+        if (socket.connected && currentRoom) {
+            refreshRooms();
+        }
+    }, 15000);
+
+    // 欢迎消息
+    addMessage({
+        is_system: true,
+        message: `您好 ${nickname}，请遵守聊天室规则，文明发言！`
+    });
+}
+
+// 页面加载完成后初始化
+document.addEventListener('DOMContentLoaded', init);
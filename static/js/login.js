@@ -0,0 +1,71 @@
+// 服务器选项的显示文字：附带服务器端探测的健康状态和延迟
+function serverLabel(server) {
+    if (server.healthy === true && server.latency_ms !== null) {
+        return `${server.name}（${Math.round(server.latency_ms)} ms）`;
+    }
+    if (server.healthy === false) {
+        return `${server.name}（不可用）`;
+    }
+    return server.name;
+}
+
+// 加载配置文件中的服务器列表，列表已按健康状态和延迟排序，默认选中最快的可用服务器
+let userPickedServer = false;
+document.getElementById('server').addEventListener('change', () => { userPickedServer = true; });
+
+function loadServers(retry) {
+    fetch('/config')
+        .then(response => response.json())
+        .then(data => {
+            const serverSelect = document.getElementById('server');
+            const selected = serverSelect.value;
+            serverSelect.innerHTML = '';
+            data.servers.forEach(server => {
+                const option = document.createElement('option');
+                option.value = server.url;
+                option.textContent = serverLabel(server);
+                serverSelect.appendChild(option);
+            });
+            if (userPickedServer && Array.from(serverSelect.options).some(option => option.value === selected)) {
+                serverSelect.value = selected;
+            }
+            // 服务器刚启动时还没有探测结果，稍后再取一次
+            if (retry && data.servers.every(server => server.healthy === null)) {
+                setTimeout(() => loadServers(false), 2000);
+            }
+        })
+        .catch(error => {
+            console.error('加载服务器配置失败:', error);
+            const serverSelect = document.getElementById('server');
+            if (serverSelect.options.length) {
+                return;
+            }
+            const defaultOption = document.createElement('option');
+            defaultOption.value = 'http://localhost:5000';
+            defaultOption.textContent = '默认服务器';
+            serverSelect.appendChild(defaultOption);
+        });
+}
+
+loadServers(true);
+
+// 登录表单提交
+document.getElementById('loginForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+    const nickname = document.getElementById('nickname').value.trim();
+    const server = document.getElementById('server').value;
+
+    if (!nickname) {
+        document.getElementById('error').textContent = '请输入昵称';
+        return;
+    }
+
+    // 检查昵称长度
+    if (nickname.length > 20) {
+        document.getElementById('error').textContent = '昵称不能超过20个字符';
+        return;
+    }
+
+    // 跳转到聊天页面
+    window.location.href = `/chat?nickname=${encodeURIComponent(nickname)}&server=${encodeURIComponent(server)}`;
+});
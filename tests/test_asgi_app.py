@@ -0,0 +1,106 @@
+"""
+asyncio 入口：经由 AsyncServerTransport 收发聊天事件，页面请求经由 WSGIBridge 交给 Flask
+
+服务以子进程运行 asgi_app.serve（不经过 __main__，不改写 config.json）。
+"""
+import os
+import queue
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import quote
+
+import pytest
+
+socketio = pytest.importorskip('socketio')
+pytest.importorskip('uvicorn')
+# 长轮询传输的客户端依赖 requests
+pytest.importorskip('requests')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_CODE = "import asgi_app; asgi_app.serve(host='127.0.0.1', port=%d, log_level='warning')"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def server():
+    port = free_port()
+    env = dict(os.environ, CHAT_PORT=str(port), CHAT_BANNED_WORDS='', CHAT_PROBE_INTERVAL='0',
+               CHAT_LOG_LEVEL='WARNING')
+    env.pop('CHAT_MESSAGE_LOG', None)
+    process = subprocess.Popen([sys.executable, '-c', SERVER_CODE % port], cwd=ROOT, env=env)
+    deadline = time.monotonic() + 20
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'服务启动失败，退出码 {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('服务启动超时')
+                time.sleep(0.1)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.kill()
+        process.wait()
+
+
+def connect(url, *events):
+    client = socketio.Client(reconnection=False)
+    received = queue.Queue()
+    for event in events:
+        client.on(event, lambda data, event=event: received.put((event, data)))
+    # uvicorn 未安装 websocket 支持时也能运行，使用长轮询
+    client.connect(url, transports=['polling'], wait_timeout=10)
+    return client, received
+
+
+def wait_for(received, *events, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        event, data = received.get(timeout=max(deadline - time.monotonic(), 0.01))
+        if event in events:
+            return event, data
+
+
+def test_join_and_message_round_trip(server):
+    events = ('join_success', 'error', 'new_message', 'message_batch')
+    alice, alice_events = connect(server, *events)
+    bob, bob_events = connect(server, *events)
+    try:
+        alice.emit('join', {'nickname': 'alice'})
+        assert wait_for(alice_events, 'join_success', 'error')[0] == 'join_success'
+        bob.emit('join', {'nickname': 'bob'})
+        event, joined = wait_for(bob_events, 'join_success', 'error')
+        assert event == 'join_success' and sorted(joined['users']) == ['alice', 'bob']
+
+        alice.emit('send_message', {'message': '你好'})
+        for received in (alice_events, bob_events):
+            event, data = wait_for(received, 'new_message', 'message_batch')
+            message = data['messages'][0] if event == 'message_batch' else data
+            assert message['nickname'] == 'alice' and message['message'] == '你好'
+    finally:
+        alice.disconnect()
+        bob.disconnect()
+
+
+def test_http_routes_served_through_wsgi_bridge(server):
+    with urllib.request.urlopen(f"{server}/chat?nickname={quote('小明')}", timeout=10) as response:
+        assert response.status == 200
+        assert response.headers['Content-Type'].startswith('text/html')
+        page = response.read().decode('utf-8')
+    assert 'socket.io' in page
+
+    # 请求头原样转给 Flask：没有昵称时重定向到首页
+    request = urllib.request.Request(f'{server}/chat', headers={'Accept-Encoding': 'identity'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        assert response.url == f'{server}/'
@@ -0,0 +1,94 @@
+"""房间消息合并广播：窗口内的消息合并为一批，按发送顺序送达"""
+import threading
+import time
+
+from services.broadcast import BroadcastCoalescer
+
+
+class ManualTransport:
+    """记录发送的事件；定时发送任务先记下，由测试决定何时运行"""
+
+    def __init__(self):
+        self.emitted = []
+        self.tasks = []
+        self.slept = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def run_tasks(self):
+        tasks, self.tasks = self.tasks, []
+        for target, args in tasks:
+            target(*args)
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+
+
+class ThreadTransport(ManualTransport):
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    sleep = staticmethod(time.sleep)
+
+
+def test_zero_window_sends_each_message():
+    transport = ManualTransport()
+    coalescer = BroadcastCoalescer(transport, window=0)
+    coalescer.emit('lobby', {'id': 1})
+    coalescer.emit('lobby', {'id': 2})
+    assert transport.emitted == [('new_message', {'id': 1}, 'lobby'), ('new_message', {'id': 2}, 'lobby')]
+    assert transport.tasks == []
+
+
+def test_messages_in_window_sent_as_one_batch_per_room():
+    transport = ManualTransport()
+    coalescer = BroadcastCoalescer(transport, window=0.02)
+    for message_id in range(1, 4):
+        coalescer.emit('lobby', {'id': message_id})
+    coalescer.emit('other', {'id': 9})
+    # 每个房间每个窗口只启动一个定时发送任务
+    assert len(transport.tasks) == 2
+    assert transport.emitted == []
+
+    transport.run_tasks()
+    assert transport.slept == [0.02, 0.02]
+    assert transport.emitted == [
+        ('message_batch', {'messages': [{'id': 1}, {'id': 2}, {'id': 3}]}, 'lobby'),
+        ('message_batch', {'messages': [{'id': 9}]}, 'other'),
+    ]
+
+
+def test_full_batch_flushes_immediately_in_order():
+    transport = ManualTransport()
+    coalescer = BroadcastCoalescer(transport, window=0.02, max_batch=2)
+    for message_id in range(1, 6):
+        coalescer.emit('lobby', {'id': message_id})
+    assert [data for _, data, _ in transport.emitted] == [
+        {'messages': [{'id': 1}, {'id': 2}]},
+        {'messages': [{'id': 3}, {'id': 4}]},
+    ]
+    coalescer.flush()
+    assert transport.emitted[-1] == ('message_batch', {'messages': [{'id': 5}]}, 'lobby')
+    # 缓存已清空，定时任务到期时不再发送
+    transport.run_tasks()
+    assert len(transport.emitted) == 3
+
+
+def test_batch_sent_after_window_elapses():
+    transport = ThreadTransport()
+    coalescer = BroadcastCoalescer(transport, window=0.05)
+    start = time.monotonic()
+    coalescer.emit('lobby', {'id': 1})
+    coalescer.emit('lobby', {'id': 2})
+    deadline = start + 2
+    while not transport.emitted and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.monotonic() - start
+    assert transport.emitted == [('message_batch', {'messages': [{'id': 1}, {'id': 2}]}, 'lobby')]
+    assert 0.05 <= elapsed < 1.0
@@ -0,0 +1,103 @@
+"""KnowledgeMatcher 与逐条 re.search 的结果一致性，以及按归一化问题缓存的回答"""
+import re
+
+import pytest
+
+from commands import chuannong
+from commands.chuannong import ChuannongCommandHandler, KnowledgeMatcher, _required_literal
+
+QUESTIONS = [
+    '你好', '你好呀川小农', 'HELLO 你好', '你是谁', '你能干什么', '你会干什么呢', '你有什么功能',
+    '四川农业大学在哪里', '川农在哪', '请问川农的雅安校区在哪', '雅安校区的具体位置', '成都校区位置',
+    '都江堰校区的位置是哪里', '谢谢', '谢谢你，再见', '再见', '今天天气怎么样', '', '好好', '好好好学习',
+]
+
+# 量词、分组、字符集、转义和大小写等容易误取锚点的规则
+TRICKY_RULES = {
+    r'.*好{2,3}.*': '量词',
+    r'.*a{,2}b.*': '省略下限的量词',
+    r'x{}y': '花括号字面量',
+    r'(课程|课表)\d+号': '分组',
+    r'.*[校园]{2}网.*': '字符集',
+    r'.*\d{3}教室.*': '转义',
+    r'.*Wifi.*': '大小写',
+    r'.*图书馆?开门.*': '可选字符',
+    r'.*(?:食堂){1,2}几点.*': '带量词的分组',
+}
+
+TRICKY_QUESTIONS = [
+    '好好', '好好好', 'b', 'aab', 'x{}y', '课程12号', '课表3号在哪', '校园网怎么连', '园园网',
+    '301教室', 'WIFI 密码', 'wifi', '图书开门了吗', '图书馆开门', '食堂几点开', '食堂食堂几点',
+]
+
+
+def legacy_match(knowledge_base, question):
+    """原先的实现：遍历知识库逐条 re.search"""
+    for pattern, answer in knowledge_base.items():
+        if re.search(pattern, question, re.IGNORECASE):
+            return answer
+    return None
+
+
+@pytest.mark.parametrize('min_rules', [0, 10 ** 6])
+def test_shipped_rules_match_legacy(min_rules):
+    knowledge_base = ChuannongCommandHandler().knowledge_base
+    matcher = KnowledgeMatcher(knowledge_base, min_rules=min_rules)
+    for question in QUESTIONS:
+        assert matcher.match(question) == legacy_match(knowledge_base, question), question
+
+
+@pytest.mark.parametrize('min_rules', [0, 10 ** 6])
+def test_tricky_rules_match_legacy(min_rules):
+    knowledge_base = dict(TRICKY_RULES, **ChuannongCommandHandler().knowledge_base)
+    matcher = KnowledgeMatcher(knowledge_base, min_rules=min_rules)
+    for question in QUESTIONS + TRICKY_QUESTIONS:
+        assert matcher.match(question) == legacy_match(knowledge_base, question), question
+
+
+def test_quantifier_body_is_not_a_literal():
+    assert _required_literal(r'.*好{2,3}.*') == ''
+    assert _required_literal(r'课程{1}号码') == '号码'
+    assert _required_literal(r'(ab){0,2}xyz') == 'xyz'
+
+
+class RulesOnly(ChuannongCommandHandler):
+    """不加载 FAQ，只使用正则规则"""
+
+    faq_path = ''
+
+
+MIXED_QUESTIONS = ['HeLLo 你好', 'wIFi 密码', '  川农   在哪 ', '川农\t在哪', 'Wifi', '校园网\n怎么连']
+
+
+def test_mixed_case_and_whitespace_match_legacy():
+    handler = RulesOnly()
+    handler.knowledge_base = dict(TRICKY_RULES, **handler.knowledge_base)
+    handler._compile_knowledge_base()
+    for question in MIXED_QUESTIONS:
+        expected = legacy_match(handler.knowledge_base, question) or chuannong.DEFAULT_REPLY
+        assert handler._match_answer(question) == expected, question
+    # 写法不同的同一个问题共用一个缓存项，先查哪种写法结果都一样
+    assert handler._match_answer('川农 在哪') == handler._match_answer('  川农   在哪 ')
+    assert handler._match_answer('WIFI 密码') == handler._match_answer('wifi 密码') == '大小写'
+
+
+def test_rules_see_original_question():
+    handler = RulesOnly()
+    handler.knowledge_base = {r'川农  校徽': '两个空格', **handler.knowledge_base}
+    handler._compile_knowledge_base()
+    # 归一化只用于缓存键，规则匹配的是原始问题
+    assert handler._match_answer('川农  校徽') == '两个空格'
+
+
+def test_answer_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(chuannong, 'ANSWER_CACHE_SIZE', 3)
+    handler = RulesOnly()
+    lookups = []
+    lookup = handler._lookup_answer
+    handler._lookup_answer = lambda question: lookups.append(question) or lookup(question)
+    for question in ('你好', '你是谁', '谢谢', '你好', '再见', '你是谁'):
+        handler._match_answer(question)
+    # 你好 最近用过，加入 再见 时淘汰的是 你是谁
+    assert lookups == ['你好', '你是谁', '谢谢', '再见', '你是谁']
+    assert list(handler._answer_cache) == ['你好', '再见', '你是谁']
@@ -0,0 +1,155 @@
+"""异步命令执行器（系统线程版本）：并发限制、超时和经由 call_soon 送达结果"""
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from commands.base import CommandHandler
+from services.command_executor import ThreadCommandExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BlockingHandler(CommandHandler):
+    """执行时等待测试放行，返回收到的参数"""
+
+    is_async = True
+    timeout = 2.0
+
+    def __init__(self, timeout=None, max_concurrency=None):
+        super().__init__()
+        self.release = threading.Event()
+        if timeout is not None:
+            self.timeout = timeout
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+    def get_command_name(self):
+        return '@等待'
+
+    def execute(self, data):
+        self.release.wait(5)
+        return {'message': data['args'], 'success': True}
+
+
+class DirectManager:
+    def execute_command(self, handler, data):
+        return handler.execute(data)
+
+
+class LoopQueue:
+    """代替事件循环：call_soon 放入队列，由测试线程取出执行"""
+
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def call_soon(self, func, *args):
+        self.calls.put((func, args, threading.current_thread()))
+
+    def run_next(self, timeout=2.0):
+        func, args, thread = self.calls.get(timeout=timeout)
+        func(*args)
+        return thread
+
+
+@pytest.fixture
+def loop():
+    return LoopQueue()
+
+
+def build(loop, **kwargs):
+    return ThreadCommandExecutor(DirectManager(), call_soon=loop.call_soon, **kwargs)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert predicate()
+
+
+def test_result_delivered_through_call_soon(loop):
+    executor = build(loop)
+    handler = BlockingHandler()
+    done = []
+    request_id, error = executor.submit(handler, {'args': '你好'}, 'alice', lambda *args: done.append(args))
+    assert error is None and request_id == 1
+
+    handler.release.set()
+    # 结果先交给 call_soon，在测试线程中执行回调
+    worker_thread = loop.run_next()
+    assert worker_thread is not threading.current_thread()
+    assert done == [(1, {'message': '你好', 'success': True})]
+    wait_until(lambda: executor.stats()['running'] == 0)
+    executor.shutdown()
+
+
+def test_per_user_and_per_command_limits(loop):
+    executor = build(loop, pool_size=3, max_per_user=1)
+    handler = BlockingHandler(max_concurrency=2)
+    on_done = lambda *args: None
+
+    assert executor.submit(handler, {'args': '1'}, 'alice', on_done)[1] is None
+    assert executor.submit(handler, {'args': '2'}, 'alice', on_done) == (None, '你的命令还在执行中，请稍后再试')
+    assert executor.submit(handler, {'args': '3'}, 'bob', on_done)[1] is None
+    assert executor.submit(handler, {'args': '4'}, 'carol', on_done) == (None, '@等待 使用人数过多，请稍后再试')
+    assert executor.stats()['by_command'] == {'@等待': 2}
+
+    other = BlockingHandler()
+    assert executor.submit(other, {'args': '5'}, 'carol', on_done)[1] is None
+    assert executor.submit(other, {'args': '6'}, 'dave', on_done) == (None, '服务器繁忙，请稍后再试')
+
+    handler.release.set()
+    other.release.set()
+    for _ in range(3):
+        loop.run_next()
+    wait_until(lambda: executor.stats()['running'] == 0)
+    # 额度释放后同一用户可以再次提交
+    assert executor.submit(handler, {'args': '7'}, 'alice', on_done)[1] is None
+    loop.run_next()
+    executor.shutdown()
+
+
+def test_timeout_delivers_notice_and_discards_late_result(loop):
+    executor = build(loop, max_per_user=1)
+    handler = BlockingHandler(timeout=0.05)
+    done = []
+    request_id, _ = executor.submit(handler, {'args': '慢'}, 'alice', lambda *args: done.append(args))
+
+    loop.run_next()
+    assert done == [(request_id, {'message': '命令执行超时，请稍后再试', 'success': False, 'command_name': '@等待'})]
+    # 线程无法中断，命令实际结束前仍占用该用户的额度
+    assert executor.submit(handler, {'args': '再来'}, 'alice', lambda *args: None)[0] is None
+
+    handler.release.set()
+    wait_until(lambda: executor.stats()['running'] == 0)
+    assert executor.stats()['by_command'] == {}
+    # 超时后返回的结果被丢弃
+    time.sleep(0.05)
+    assert loop.calls.empty()
+    assert len(done) == 1
+    executor.shutdown()
+
+
+def test_finished_command_cancels_timer(loop):
+    executor = build(loop)
+    handler = BlockingHandler(timeout=0.1)
+    handler.release.set()
+    done = []
+    executor.submit(handler, {'args': '快'}, 'alice', lambda *args: done.append(args))
+    loop.run_next()
+    time.sleep(0.2)
+    assert loop.calls.empty()
+    assert done == [(1, {'message': '快', 'success': True})]
+    executor.shutdown()
+
+
+def test_thread_executor_does_not_need_eventlet():
+    code = ("import sys; sys.modules['eventlet'] = None; "
+            "from services.command_executor import ThreadCommandExecutor; import services.metrics")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
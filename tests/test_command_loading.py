@@ -0,0 +1,98 @@
+"""命令模块按需导入：启动时只建立索引，第一次使用时导入，文件修改后重新加载"""
+import os
+import sys
+
+import pytest
+
+from commands.command_manager import CommandManager
+
+MODULE = '''
+from commands.base import CommandHandler
+
+with open({log!r}, 'a', encoding='utf-8') as log:
+    log.write('imported\\n')
+
+
+class EchoCommandHandler(CommandHandler):
+    aliases = ('@echo',)
+    description = '原样返回：@回声 <内容>'
+
+    def get_command_name(self):
+        return '@回声'
+
+    def execute(self, data):
+        return self.format_response({prefix!r} + data['args'])
+'''
+
+
+@pytest.fixture
+def commands_dir(tmp_path):
+    directory = tmp_path / 'commands'
+    directory.mkdir()
+    yield directory
+    sys.modules.pop('lazy_echo', None)
+    sys.modules.pop('lazy_other', None)
+
+
+def write_module(directory, name, prefix, log):
+    path = directory / f'{name}.py'
+    existed = path.exists()
+    path.write_text(MODULE.format(log=str(log), prefix=prefix), encoding='utf-8')
+    if existed:
+        # 保证修改时间变化，不依赖文件系统的时间精度
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def imports(log):
+    return log.read_text(encoding='utf-8').count('imported') if log.exists() else 0
+
+
+def test_module_imported_on_first_use(commands_dir, tmp_path):
+    log = tmp_path / 'imports.log'
+    write_module(commands_dir, 'lazy_echo', '回声: ', log)
+    manager = CommandManager(str(commands_dir), reload_interval=None)
+
+    # 只解析了语法树：命令、别名和说明已可用于补全，模块尚未导入
+    assert manager.get_available_commands() == ['@回声']
+    assert manager.suggest('@ec')[0]['command'] == '@回声'
+    assert imports(log) == 0 and 'lazy_echo' not in sys.modules
+
+    result = manager.process_command('@echo 你好', {'nickname': 'alice'})
+    assert result['message'] == '回声: 你好'
+    assert imports(log) == 1
+    manager.process_command('@回声 再来', {'nickname': 'alice'})
+    assert imports(log) == 1
+
+
+def test_changed_module_reloaded_on_next_use(commands_dir, tmp_path):
+    log = tmp_path / 'imports.log'
+    write_module(commands_dir, 'lazy_echo', '旧: ', log)
+    manager = CommandManager(str(commands_dir), reload_interval=None)
+    assert manager.process_command('@回声 x', {})['message'] == '旧: x'
+
+    write_module(commands_dir, 'lazy_echo', '新: ', log)
+    # 未到检查时间或关闭热加载时继续使用已加载的处理器
+    assert manager.process_command('@回声 x', {})['message'] == '旧: x'
+    assert manager.check_reload(force=True)
+    assert imports(log) == 1
+    assert manager.process_command('@回声 x', {})['message'] == '新: x'
+    assert imports(log) == 2
+    # 文件未变化时不再重新加载
+    assert not manager.check_reload(force=True)
+
+
+def test_added_and_deleted_modules(commands_dir, tmp_path):
+    log = tmp_path / 'imports.log'
+    manager = CommandManager(str(commands_dir), reload_interval=0)
+    assert manager.get_handler('@回声') is None
+
+    path = write_module(commands_dir, 'lazy_other', '加: ', log)
+    # reload_interval 为 0 时每次使用都检查文件变化
+    assert manager.process_command('@回声 x', {})['message'] == '加: x'
+
+    os.remove(path)
+    result = manager.process_command('@回声 x', {})
+    assert result['success'] is False and result['message'].startswith('未知命令')
+    assert manager.suggest('@') == []
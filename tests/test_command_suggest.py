@@ -0,0 +1,28 @@
+"""命令补全：每个命令只出现一次，别名合并到同一条"""
+from commands.command_manager import CommandManager
+from utils.prefix_trie import PrefixTrie
+
+
+def test_each_command_suggested_once():
+    manager = CommandManager()
+    suggestions = manager.suggest('@')
+    names = [item['command'] for item in suggestions]
+    assert sorted(names) == sorted(manager.get_available_commands())
+    assert all(item['alias'] is None for item in suggestions)
+    assert {'@ai'} <= {alias for item in suggestions for alias in item['aliases']}
+
+
+def test_alias_match_reported():
+    manager = CommandManager()
+    assert manager.suggest('@MOV') == [{
+        'command': '@电影', 'alias': '@movie', 'aliases': ['@movie'], 'description': manager.suggest('@电')[0]['description']
+    }]
+
+
+def test_trie_dedupes_values_before_limit():
+    trie = PrefixTrie(max_results=2)
+    for key, value in [('@a', 'A'), ('@aa', 'A'), ('@aaa', 'A'), ('@ab', 'B')]:
+        trie.insert(key, value)
+    trie.build()
+    assert trie.complete('@') == ('A', 'B')
+    assert trie.complete('@aa') == ('A',)
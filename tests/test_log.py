@@ -0,0 +1,93 @@
+"""日志队列：后台线程写出、队列满时丢弃计数、按事件采样和停止时写完剩余日志"""
+import logging
+import threading
+
+from services.log import BackgroundWriter, EventSampler, QueueLogHandler, parse_sample_rates
+
+
+class RecordingStream:
+    """记录写出的行、写出所在的线程和刷新次数"""
+
+    def __init__(self):
+        self.lines = []
+        self.threads = set()
+        self.flushes = 0
+
+    def write(self, text):
+        self.lines.extend(text.splitlines())
+        self.threads.add(threading.get_ident())
+
+    def flush(self):
+        self.flushes += 1
+
+
+def make_record(message, level=logging.INFO, **fields):
+    record = logging.LogRecord('chat.test', level, __file__, 1, message, None, None)
+    record.__dict__.update(fields)
+    return record
+
+
+def test_records_written_by_background_thread_with_fields():
+    stream = RecordingStream()
+    writer = BackgroundWriter(stream)
+    logger = logging.getLogger('chat.test.writer')
+    logger.addHandler(QueueLogHandler(writer))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        users = ['alice']
+        logger.info('在线: %s', users, extra={'event': 'join', 'sid': 'abc'})
+        # 消息参数在调用方展开，之后修改参数不影响写出的内容
+        users.append('bob')
+        try:
+            raise ValueError('坏了')
+        except ValueError:
+            logger.exception('处理失败')
+        writer.start()
+        writer.stop()
+    finally:
+        logger.handlers.clear()
+
+    assert stream.lines[0].endswith("INFO chat.test.writer 在线: ['alice'] event=join sid=abc")
+    assert stream.lines[1].endswith('ERROR chat.test.writer 处理失败')
+    assert stream.lines[-1] == 'ValueError: 坏了'
+    # 写出在后台线程中进行
+    assert len(stream.threads) == 1 and threading.get_ident() not in stream.threads
+
+
+def test_full_queue_drops_and_counts():
+    stream = RecordingStream()
+    writer = BackgroundWriter(stream, maxsize=2)
+    for number in range(5):
+        writer.put(make_record(f'第 {number} 条'))
+    # 调用方不阻塞，超出容量的记录直接丢弃
+    assert writer.dropped == 3
+    writer.start()
+    writer.stop()
+    assert [line.split(' ', 4)[-1] for line in stream.lines] == ['第 0 条', '第 1 条']
+
+
+def test_sampler_keeps_one_in_n():
+    sampler = EventSampler(parse_sample_rates('send_message=0.1, join=1, typing=0'))
+    kept = [sampler.filter(make_record('消息', event='send_message')) for _ in range(100)]
+    assert sum(kept) == 10 and kept[0] and kept[10]
+    assert all(sampler.filter(make_record('加入', event='join')) for _ in range(5))
+    assert not any(sampler.filter(make_record('输入中', event='typing')) for _ in range(5))
+    # 警告及以上级别和其他事件不采样
+    assert sampler.filter(make_record('出错', logging.WARNING, event='typing'))
+    assert all(sampler.filter(make_record('其他', event='other')) for _ in range(5))
+    assert sampler.filter(make_record('没有事件'))
+
+
+def test_stop_flushes_pending_records():
+    stream = RecordingStream()
+    writer = BackgroundWriter(stream)
+    for number in range(100):
+        writer.put(make_record(f'第 {number} 条'))
+    writer.start()
+    writer.stop()
+    assert len(stream.lines) == 100 and stream.lines[-1].endswith('第 99 条')
+    assert stream.flushes >= 1
+    # 停止后可以再次停止，不再写出
+    writer.stop()
+    assert len(stream.lines) == 100
@@ -0,0 +1,99 @@
+"""MessageHistory 的编号分配、翻页和补齐"""
+from services.history import MessageHistory, SQLiteMessageIds
+
+
+def message(text, message_id=None):
+    data = {'nickname': 'a', 'message': text}
+    if message_id is not None:
+        data['id'] = message_id
+    return data
+
+
+def texts(messages):
+    return [item['message'] for item in messages]
+
+
+def test_local_ids_and_paging():
+    history = MessageHistory(max_messages=3)
+    for index in range(5):
+        assert history.append('r', message(str(index))) == index + 1
+    assert texts(history.latest('r', 10)) == ['2', '3', '4']
+    page = history.before('r', 5, 1)
+    assert texts(page['messages']) == ['3'] and page['has_more']
+    assert history.after('r', 3, 10) == {'messages': history.before('r', None, 2)['messages'], 'complete': True}
+    # 编号 2 已被淘汰
+    assert history.after('r', 1, 10)['complete'] is False
+    assert history.after('r', 5, 10) == {'messages': [], 'complete': True}
+    assert history.after('other', 0, 10) == {'messages': [], 'complete': True}
+
+
+def test_shared_ids_are_unique_across_workers(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first = MessageHistory(message_ids=SQLiteMessageIds(path))
+    second = MessageHistory(message_ids=SQLiteMessageIds(path))
+    ids = [first.append('r', message('a')), second.append('r', message('b')), first.append('r', message('c'))]
+    assert ids == [1, 2, 3]
+
+    # first 没有记录 second 的消息，不能声称补齐
+    assert first.after('r', 0, 10)['complete'] is False
+    assert texts(first.before('r', None, 10)['messages']) == ['a', 'c']
+
+    # 记录其他进程的消息后按编号插入，重复记录忽略
+    assert first.record('r', message('b', 2))
+    assert not first.record('r', message('b', 2))
+    assert first.after('r', 0, 10) == {'messages': first.latest('r', 10), 'complete': True}
+    assert texts(first.latest('r', 10)) == ['a', 'b', 'c']
+    assert texts(first.before('r', 3, 1)['messages']) == ['b']
+
+
+def test_restore_advances_shared_counter(tmp_path):
+    ids = SQLiteMessageIds(str(tmp_path / 'state.db'))
+    history = MessageHistory(message_ids=ids)
+    # 消息日志中多个进程写入的顺序不一定按编号
+    history.restore('r', [message('b', 7), message('a', 4), message('c', 9)])
+    assert texts(history.latest('r', 10)) == ['a', 'b', 'c']
+    assert history.append('r', message('d')) == 10
+
+
+def test_room_buffers_are_bounded():
+    history = MessageHistory(max_rooms=3)
+    for index in range(10):
+        history.append(f'room{index}', message(str(index)))
+    assert sorted(history.stats()) == ['room7', 'room8', 'room9']
+    # 写入会把房间标记为最近使用
+    history.append('room7', message('again'))
+    history.append('room10', message('new'))
+    assert sorted(history.stats()) == ['room10', 'room7', 'room9']
+
+
+def test_ids_do_not_go_back_after_room_dropped():
+    history = MessageHistory(max_rooms=1)
+    for _ in range(5):
+        history.append('a', message('x'))
+    history.append('b', message('y'))
+    # a 被丢弃后重新创建，编号从已丢弃房间的最大编号之后继续
+    assert history.append('a', message('z')) == 7
+    # 丢弃前客户端看到的最后一条是 5，无法确认之后没有缺失，由调用方发送完整状态
+    assert history.after('a', 5, 10)['complete'] is False
+    assert history.after('a', 6, 10) == {'messages': [message('z', 7)], 'complete': True}
+
+
+def test_expired_room_is_dropped():
+    history = MessageHistory(max_age=60)
+    history.append('r', {'ts': 0, 'message': 'old'})
+    assert history.latest('r', 10) == []
+    assert history.stats() == {}
+
+
+def test_eviction_keeps_lookup_consistent():
+    history = MessageHistory(max_messages=100)
+    for index in range(1000):
+        history.append('r', message(str(index)))
+    # 头部淘汰的条目定期压缩
+    assert len(history._rooms['r'].ids) < 200
+    assert texts(history.latest('r', 3)) == ['997', '998', '999']
+    page = history.before('r', 905, 3)
+    assert texts(page['messages']) == ['901', '902', '903'] and page['has_more']
+    page = history.before('r', 903, 10)
+    assert texts(page['messages']) == ['900', '901'] and not page['has_more']
+    assert texts(history.after('r', 997, 10)['messages']) == ['997', '998', '999']
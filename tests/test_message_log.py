@@ -0,0 +1,84 @@
+"""消息日志按条数和时长保留，以及导入 chat_core 时不打开日志、不启动写入线程"""
+import os
+import subprocess
+import sys
+import time
+
+from services.history import MessageHistory
+from services.message_log import MessageLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import chat_core
+print(chat_core.message_log is not None, len(chat_core.history.latest('chat_room', 10)),
+      getattr(chat_core.message_log, '_thread', None) is not None)
+"""
+
+
+def fill(log, room, count, ts):
+    for index in range(count):
+        log.append(room, {'id': index + 1, 'ts': ts + index, 'message': str(index)})
+    log.start()
+    log.stop()
+
+
+def count_rows(log):
+    return log._conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+def test_prune_keeps_latest_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr('services.message_log.PRUNE_CHUNK', 7)
+    log = MessageLog(str(tmp_path / 'log.db'), max_messages=10, prune_interval=3600)
+    fill(log, 'r', 50, int(time.time() * 1000))
+    # 写入线程写完第一批后立即清理
+    assert count_rows(log) == 10 and log.pruned == 40
+    assert log.prune() == 0
+    assert [message['id'] for _, message in log.tail(100)] == list(range(41, 51))
+
+
+def test_prune_by_age_and_recover_within_window(tmp_path):
+    path = str(tmp_path / 'log.db')
+    now = int(time.time() * 1000)
+    log = MessageLog(path)
+    fill(log, 'r', 5, now - 3600 * 1000)
+    log.append('r', {'id': 6, 'ts': now, 'message': 'new'})
+    log.start()
+    log.stop()
+
+    log = MessageLog(path, max_age=60)
+    history = MessageHistory(max_age=60)
+    assert log.recover(history, 100) == 1
+    assert log.pruned == 5
+    assert [message['id'] for message in history.latest('r', 10)] == [6]
+    # 客户端最后看到的消息之后有消息已超出保留窗口，不能只补齐
+    assert history.after('r', 3, 10)['complete'] is False
+    assert history.after('r', 5, 10)['messages'][0]['message'] == 'new'
+
+
+def test_history_expires_old_messages():
+    history = MessageHistory(max_age=60)
+    now = int(time.time() * 1000)
+    history.append('r', {'ts': now - 120 * 1000, 'message': 'old'})
+    history.append('r', {'ts': now, 'message': 'new'})
+    assert [message['message'] for message in history.latest('r', 10)] == ['new']
+    assert history.after('r', 0, 10)['complete'] is False
+    assert history.after('r', 1, 10)['complete'] is True
+
+
+def import_chat_core(**env):
+    env = dict(os.environ, CHAT_PROBE_INTERVAL='0', CHAT_SEARCH_MAX_DOCS='0', **env)
+    if not env.get('CHAT_MESSAGE_LOG'):
+        env.pop('CHAT_MESSAGE_LOG', None)
+    result = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split()
+
+
+def test_message_log_is_opt_in(tmp_path):
+    assert import_chat_core(CHAT_MESSAGE_LOG='') == ['False', '0', 'False']
+
+    path = str(tmp_path / 'log.db')
+    fill(MessageLog(path), 'chat_room', 3, int(time.time() * 1000))
+    # 恢复历史和启动写入线程留给 start_services，导入时只打开文件
+    assert import_chat_core(CHAT_MESSAGE_LOG=path) == ['True', '0', 'False']
@@ -0,0 +1,45 @@
+"""指标在多个系统线程中同时记录和渲染"""
+import threading
+
+from services.metrics import MetricsRegistry
+
+
+def test_render_snapshot_survives_new_labels():
+    # 渲染遍历到一半时其他线程新增了标签
+    registry = MetricsRegistry()
+    counter = registry.counter('events_total', '事件数', ('event',))
+    histogram = registry.histogram('latency_seconds', '耗时', ('event',))
+    for name in ('a', 'b'):
+        counter.inc(name)
+        histogram.observe(0.001, name)
+    for metric in (counter, histogram):
+        samples = metric.samples()
+        next(samples)
+        counter.inc('c')
+        histogram.observe(0.001, 'c')
+        assert len(list(samples)) >= 1
+
+
+def test_concurrent_updates_are_not_lost():
+    registry = MetricsRegistry()
+    counter = registry.counter('events_total', '事件数', ('event',))
+    histogram = registry.histogram('latency_seconds', '耗时', ('event',))
+    rounds, workers = 5000, 4
+
+    def record(index):
+        for i in range(rounds):
+            counter.inc(str(i % 50))
+            histogram.observe(0.001, f'{index}-{i % 200}')
+
+    threads = [threading.Thread(target=record, args=(index,)) for index in range(workers)]
+    threads.append(threading.Thread(target=lambda: [registry.render() for _ in range(10)]))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(counter._totals().values()) == rounds * workers
+    assert sum(sum(child.counts) for child in histogram._totals().values()) == rounds * workers
+    # 已结束线程的分片并入汇总，分片列表不随线程增长
+    assert counter._shards == [] and histogram._shards == []
+    assert 'chat_latency_seconds_count{event="0-0"} 25' in registry.render()
@@ -0,0 +1,94 @@
+"""敏感词过滤：归一化后的打码位置、重叠命中的处理方式和词表热加载"""
+import os
+import time
+
+from services.moderation import ALLOW, FLAG, MASK, REJECT, Moderator, WordFilter, fold
+from utils.aho_corasick import AhoCorasick
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = AhoCorasick()
+    for word in ('he', 'she', 'his', 'hers'):
+        automaton.add(word)
+    assert sorted(automaton.iter_matches('ushers')) == [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+
+
+def test_fold_keeps_length():
+    text = 'ＢａＤ　Ｗｏｒｄ！你好ABC'
+    assert fold(text) == 'bad word!你好abc'
+    assert len(fold(text)) == len(text)
+
+
+def test_mask_offsets_after_full_width_and_case_folding():
+    word_filter = WordFilter({'bad': MASK, '违禁': MASK})
+    result, text, terms = word_filter.check('你好ＢａＤ吗，Bad 和 违禁词')
+    assert result == MASK
+    # 打码位置对应原文，原文中其余的全角字符保持不变
+    assert text == '你好***吗，*** 和 **词'
+    assert terms == ['bad', '违禁']
+
+
+def test_reject_wins_over_overlapping_mask_and_flag():
+    word_filter = WordFilter({'abc': MASK, 'bcd': REJECT, 'cd': FLAG})
+    assert word_filter.check('xABCDx') == (REJECT, 'xABCDx', ['bcd'])
+    # 较长的 reject 词在 mask 词之后才结束，仍然拒绝
+    word_filter = WordFilter({'ab': MASK, 'abcdef': REJECT})
+    assert word_filter.check('xabcdefx')[0] == REJECT
+
+
+def test_mask_wins_over_flag_and_overlapping_masks_merge():
+    word_filter = WordFilter({'abc': FLAG, 'bc': MASK})
+    assert word_filter.check('abc') == (MASK, 'a**', ['abc', 'bc'])
+    assert WordFilter({'abc': FLAG}).check('ABC') == (FLAG, 'ABC', ['abc'])
+    assert WordFilter({'abc': MASK, 'bcd': MASK}).check('abcde')[1] == '****e'
+    assert WordFilter({}).check('abc') == (ALLOW, 'abc', [])
+
+
+def wait_for_reload(moderator, reloads):
+    deadline = time.monotonic() + 5
+    while moderator.reloads < reloads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert moderator.reloads == reloads
+
+
+def write_terms(path, text):
+    path.write_text(text, encoding='utf-8')
+    # 保证修改时间变化，不依赖文件系统的时间精度
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_terms_file_hot_reload(tmp_path):
+    path = tmp_path / 'banned_words.txt'
+    moderator = Moderator(str(path), default_action=MASK, reload_interval=0)
+    # 文件不存在时不过滤
+    assert moderator.check('坏词') == (ALLOW, '坏词', [])
+    assert not moderator.check_reload()
+
+    write_terms(path, '# 注释\n\n坏词\n拒绝词\treject\n无效词\tunknown\n')
+    assert moderator.check_reload()
+    wait_for_reload(moderator, 1)
+    assert len(moderator) == 3
+    assert moderator.check('一个坏词')[1] == '一个**'
+    assert moderator.check('拒绝词')[0] == REJECT
+    # 无效的处理方式使用默认值
+    assert moderator.check('无效词')[0] == MASK
+
+    write_terms(path, '坏词\tflag\n')
+    moderator.check('触发检查')
+    wait_for_reload(moderator, 2)
+    assert moderator.check('一个坏词') == (FLAG, '一个坏词', ['坏词'])
+    assert moderator.check('拒绝词')[0] == ALLOW
+    # 文件未变化时不再重新加载
+    assert not moderator.check_reload()
+
+
+def test_reload_interval_limits_stat_calls(tmp_path):
+    path = tmp_path / 'banned_words.txt'
+    write_terms(path, '坏词\n')
+    moderator = Moderator(str(path), reload_interval=3600)
+    write_terms(path, '坏词\n别的词\n')
+    assert not moderator.check_reload()
+    assert moderator.check_reload(force=True)
+    wait_for_reload(moderator, 1)
+    assert len(moderator) == 2
@@ -0,0 +1,122 @@
+"""@电影 链接探测：用本地 HTTP 服务代替影片服务器，检查地址限制和元数据"""
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from commands.movie import MovieCommandHandler
+
+
+class StandIn:
+    """本地 HTTP 服务，按路径返回预设的响应，并记录收到的请求"""
+
+    def __init__(self, host='127.0.0.1'):
+        self.requests = []
+        self.routes = {}
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                stand_in.requests.append((self.command, self.path, self.headers.get('Host')))
+                status, headers = stand_in.routes.get(self.path, (404, {}))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', headers.get('Content-Length', '0'))
+                self.end_headers()
+
+            do_GET = do_HEAD
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def url(self, path, host='127.0.0.1'):
+        return f'http://{host}:{self.port}{path}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LoopbackOnly(MovieCommandHandler):
+    """测试用：把 127.0.0.1 当作公网地址，其他非公网地址仍然拒绝"""
+
+    def _is_allowed_address(self, ip):
+        return str(ip) == '127.0.0.1' or super()._is_allowed_address(ip)
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.close()
+
+
+def test_metadata_from_stand_in(stand_in):
+    stand_in.routes['/movie.mp4'] = (200, {'Content-Type': 'video/mp4', 'Content-Length': '1048576'})
+    meta = LoopbackOnly().probe(stand_in.url('/movie.mp4'))
+    assert meta['reachable'] is True
+    assert meta['content_type'] == 'video/mp4'
+    assert meta['size'] == 1048576
+
+
+def test_invalid_content_type_dropped(stand_in):
+    stand_in.routes['/x.mp4'] = (200, {'Content-Type': 'text/html"><img src=x onerror=alert(1)>'})
+    meta = LoopbackOnly().probe(stand_in.url('/x.mp4'))
+    assert meta['reachable'] is True
+    assert meta['content_type'] is None
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', 'localhost', '[::ffff:127.0.0.1]'])
+def test_loopback_not_probed(stand_in, host):
+    meta = MovieCommandHandler().probe(stand_in.url('/movie.mp4', host))
+    assert meta['reachable'] is None
+    assert stand_in.requests == []
+
+
+@pytest.mark.parametrize('address', ['10.0.0.1', '172.16.5.4', '192.168.1.1', '169.254.169.254', '100.64.0.1',
+                                     '240.0.0.1', '224.0.0.1', '::1', 'fd00::1', '::ffff:10.0.0.1', '0.0.0.0'])
+def test_non_global_addresses_rejected(address):
+    assert MovieCommandHandler()._resolve_allowed(address) is None
+
+
+def test_unresolvable_host_fails_closed(monkeypatch):
+    def fail(*args, **kwargs):
+        raise socket.gaierror('no such host')
+    monkeypatch.setattr(socket, 'getaddrinfo', fail)
+    assert MovieCommandHandler()._resolve_allowed('movies.example') is None
+
+
+def test_redirect_to_private_address_not_followed(stand_in):
+    # 第二个服务在另一个回环地址上，代表内网服务
+    internal = StandIn('127.0.0.2')
+    try:
+        stand_in.routes['/go'] = (302, {'Location': internal.url('/admin', '127.0.0.2')})
+        meta = LoopbackOnly().probe(stand_in.url('/go'))
+        assert meta['reachable'] is None
+        assert [path for _, path, _ in stand_in.requests] == ['/go']
+        assert internal.requests == []
+    finally:
+        internal.close()
+
+
+def test_connects_to_checked_address(stand_in, monkeypatch):
+    # 检查时解析到 127.0.0.1，之后的解析（如 DNS 重绑定）指向别处也不会被使用
+    answers = iter([[(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 0))]])
+    real_getaddrinfo = socket.getaddrinfo
+
+    def rebinding(host, *args, **kwargs):
+        if host == 'movies.example':
+            return next(answers, [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 0))])
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', rebinding)
+    stand_in.routes['/movie.mp4'] = (200, {'Content-Type': 'video/mp4'})
+    meta = LoopbackOnly().probe(f'http://movies.example:{stand_in.port}/movie.mp4')
+    assert meta['reachable'] is True
+    assert stand_in.requests == [('HEAD', '/movie.mp4', f'movies.example:{stand_in.port}')]
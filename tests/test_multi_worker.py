@@ -0,0 +1,212 @@
+"""
+多进程部署：两个工作进程共用一个 SQLite 状态库和消息队列时的跨进程投递
+
+每个工作进程与 benchmarks/load_test.py 一样以子进程启动 app.py（不经过 __main__，不改写 config.json）。
+"""
+import os
+import queue
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+socketio = pytest.importorskip('socketio')
+pytest.importorskip('websocket')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_CODE = "import app; app.socketio.run(app.app, host='127.0.0.1', port=%d, use_reloader=False, log_output=False)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_worker(port, tmp_path, **extra_env):
+    env = dict(
+        os.environ,
+        CHAT_PORT=str(port),
+        CHAT_WORKER_ID=f'w{port}',
+        CHAT_STATE_BACKEND='sqlite',
+        CHAT_STATE_DB=str(tmp_path / 'state.db'),
+        CHAT_BANNED_WORDS='',
+        CHAT_PROBE_INTERVAL='0',
+        CHAT_PRESENCE_DEBOUNCE_MS='20',
+        CHAT_LOG_LEVEL='WARNING',
+        **extra_env
+    )
+    process = subprocess.Popen([sys.executable, '-c', WORKER_CODE % port], cwd=ROOT, env=env)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'工作进程启动失败，退出码 {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('工作进程启动超时')
+
+
+class ChatClient:
+    """连接到指定工作进程的客户端，收到的事件按名称放入各自的队列"""
+
+    EVENTS = ('join_success', 'error', 'new_message', 'message_batch', 'presence_delta', 'presence_snapshot')
+
+    def __init__(self, port):
+        self.sio = socketio.Client(reconnection=False)
+        self.events = {event: queue.Queue() for event in self.EVENTS}
+        for event in self.EVENTS:
+            self.sio.on(event, self.events[event].put)
+        self.sio.connect(f'http://127.0.0.1:{port}', transports=['websocket'], wait_timeout=10)
+
+    def join(self, nickname, **extra):
+        self.sio.emit('join', dict(extra, nickname=nickname))
+        return self.wait('join_success', 'error')
+
+    def send(self, message):
+        self.sio.emit('send_message', {'message': message})
+
+    def wait(self, *events, timeout=5):
+        """等待任一事件，返回 (事件名, 数据)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for event in events:
+                try:
+                    return event, self.events[event].get_nowait()
+                except queue.Empty:
+                    pass
+            time.sleep(0.01)
+        raise TimeoutError(f'等待 {events} 超时')
+
+    def messages(self, count, timeout=5):
+        """收到的前 count 条房间消息（合并发送的批次会展开）"""
+        received = []
+        deadline = time.monotonic() + timeout
+        while len(received) < count:
+            event, data = self.wait('new_message', 'message_batch', timeout=max(deadline - time.monotonic(), 0))
+            received.extend(data['messages'] if event == 'message_batch' else [data])
+        return received
+
+    def close(self):
+        self.sio.disconnect()
+
+
+@pytest.fixture
+def workers(tmp_path):
+    ports = [free_port(), free_port()]
+    processes = [start_worker(port, tmp_path) for port in ports]
+    yield ports
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+def test_cross_worker_delivery(workers):
+    port_a, port_b = workers
+    alice, bob = ChatClient(port_a), ChatClient(port_b)
+    try:
+        assert alice.join('alice')[0] == 'join_success'
+        assert bob.join('bob')[0] == 'join_success'
+
+        # 昵称唯一由共享状态库保证
+        carol = ChatClient(port_b)
+        assert carol.join('alice') == ('error', {'message': '昵称已被使用，请选择其他昵称'})
+        carol.close()
+
+        alice.send('from A')
+        bob.send('from B')
+        for client in (alice, bob):
+            received = client.messages(2)
+            assert sorted(message['message'] for message in received) == ['from A', 'from B']
+            # 编号由共享存储分配，客户端按编号去重时不会误丢另一个进程的消息
+            assert len({message['id'] for message in received}) == 2
+
+        # 两个进程都记录了整个房间的消息，后加入的用户在任一进程上都能看到
+        for port in workers:
+            late = ChatClient(port)
+            _, joined = late.join(f'late{port}')
+            assert sorted(message['message'] for message in joined['history']) == ['from A', 'from B']
+            late.close()
+    finally:
+        alice.close()
+        bob.close()
+
+
+def test_presence_across_workers(workers):
+    port_a, port_b = workers
+    alice, bob = ChatClient(port_a), ChatClient(port_b)
+    try:
+        _, joined = alice.join('alice')
+        version = joined['presence_version']
+        bob.join('bob')
+
+        # 两个进程的名单变化共用一个版本序列，alice 一定能得到包含 bob 的更新版本
+        deadline = time.monotonic() + 5
+        while True:
+            _, snapshot = alice.wait('presence_snapshot', timeout=max(deadline - time.monotonic(), 0))
+            assert snapshot['version'] > version
+            version = snapshot['version']
+            if 'bob' in snapshot['users']:
+                break
+        assert sorted(snapshot['users']) == ['alice', 'bob']
+        assert alice.events['presence_delta'].empty()
+    finally:
+        alice.close()
+        bob.close()
+
+
+def test_unowned_resume_token_gets_full_state(workers):
+    port_a, _ = workers
+    alice = ChatClient(port_a)
+    try:
+        assert alice.join('alice')[0] == 'join_success'
+        alice.send('hello')
+        alice.messages(1)
+
+        # 令牌不是本进程签发的（如服务器重启前的令牌），按新加入处理，返回完整的房间状态
+        dave = ChatClient(port_a)
+        event, state = dave.join('dave', resume_token='nonce.signature', room='chat_room', last_id=0)
+        assert event == 'join_success' and state['resumed'] is False
+        assert 'missed' not in state
+        assert [message['message'] for message in state['history']] == ['hello']
+        assert sorted(state['users']) == ['alice', 'dave']
+        dave.close()
+    finally:
+        alice.close()
+
+
+def test_resume_on_another_worker(tmp_path):
+    ports = [free_port(), free_port()]
+    processes = [start_worker(port, tmp_path, CHAT_RESUME_GRACE='1') for port in ports]
+    try:
+        alice = ChatClient(ports[0])
+        _, state = alice.join('alice')
+        alice.close()
+
+        # 断线后重连落到另一个工作进程，令牌随机串在共享存储中，可以直接接管
+        alice = ChatClient(ports[1])
+        event, resumed = alice.join('alice', resume_token=state['resume_token'], room=state['room'],
+                                    boot_id=state['boot_id'], last_id=0)
+        assert event == 'join_success' and resumed['resumed'] is True
+
+        # 原进程的保留超时后不会移除已被接管的会话，也不会删除新令牌
+        time.sleep(1.5)
+        observer = ChatClient(ports[0])
+        assert observer.join('observer')[1]['users'] == ['alice', 'observer']
+        observer.close()
+        alice.close()
+
+        alice = ChatClient(ports[0])
+        event, again = alice.join('alice', resume_token=resumed['resume_token'], room=state['room'],
+                                  boot_id=resumed['boot_id'], last_id=0)
+        assert event == 'join_success' and again['resumed'] is True
+        alice.close()
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
@@ -0,0 +1,208 @@
+"""按客户端的有界发送队列：积压阈值、在线名单事件合并、溢出处理，以及指标和明细接口"""
+import json
+import os
+import subprocess
+import sys
+
+from services.outbox import OutboundQueues, POLICY_DISCONNECT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSocket:
+    def __init__(self):
+        self.closed = False
+        self.depth = 0
+
+    @property
+    def queue(self):
+        return self
+
+    def qsize(self):
+        return self.depth
+
+
+class FakeServer:
+    """记录发送的数据包；后台任务先记下，由测试决定何时运行"""
+
+    def __init__(self):
+        self.sockets = {}
+        self.sent = []
+        self.tasks = []
+        self.disconnected = []
+        self.eio = self
+        self.manager = self
+
+    def connect(self, eio_sid):
+        self.sockets[eio_sid] = FakeSocket()
+        return self.sockets[eio_sid]
+
+    def _send_packet(self, eio_sid, pkt):
+        self.sent.append((eio_sid, pkt))
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def run_tasks(self):
+        tasks, self.tasks = self.tasks, []
+        for target, args in tasks:
+            target(*args)
+
+    def sleep(self, seconds):
+        # 等待期间客户端收完了 Engine.IO 队列
+        for socket in self.sockets.values():
+            socket.depth = 0
+
+    def disconnect(self, eio_sid):
+        self.disconnected.append(eio_sid)
+
+    def sid_from_eio_sid(self, eio_sid, namespace):
+        return 'sid-' + eio_sid
+
+
+def build(**kwargs):
+    recovered = []
+    server = FakeServer()
+    outbound = OutboundQueues(on_recovered=lambda *args: recovered.append(args), **kwargs)
+    outbound.attach(server)
+    return outbound, server, recovered
+
+
+def chat(outbound, eio_sid, message_id, room='lobby'):
+    outbound.send(eio_sid, f'msg{message_id}', 'new_message', {'id': message_id}, f'{room}\x00json')
+
+
+def snapshot(outbound, eio_sid, version, room='lobby', target=None):
+    outbound.send(eio_sid, f'snapshot-{room}-{version}', 'presence_snapshot',
+                  {'room': room, 'version': version, 'users': []}, target or room)
+
+
+def queued(outbound, eio_sid):
+    return [item[1] for item in outbound._boxes[eio_sid].items]
+
+
+def test_below_high_water_mark_sends_directly():
+    outbound, server, _ = build(engineio_limit=4)
+    server.connect('e1').depth = 3
+    chat(outbound, 'e1', 1)
+    assert server.sent == [('e1', 'msg1')]
+    assert outbound.stats()['backlogged_clients'] == 0
+
+
+def test_backlog_is_pumped_in_order_once_engineio_drains():
+    outbound, server, recovered = build(engineio_limit=4)
+    socket = server.connect('e1')
+    socket.depth = 4
+    for message_id in range(1, 4):
+        chat(outbound, 'e1', message_id)
+    assert server.sent == []
+    assert outbound.stats()['queued'] == 3
+    # 只启动一个后台任务
+    assert len(server.tasks) == 1
+
+    server.run_tasks()
+    assert [pkt for _, pkt in server.sent] == ['msg1', 'msg2', 'msg3']
+    assert outbound.stats()['queued'] == 0
+    assert recovered == []
+
+
+def test_newest_presence_snapshot_per_room_is_kept():
+    outbound, server, _ = build(engineio_limit=1)
+    server.connect('e1').depth = 1
+    snapshot(outbound, 'e1', 1)
+    outbound.send('e1', 'delta', 'presence_delta', {'room': 'lobby', 'version': 2}, 'lobby')
+    chat(outbound, 'e1', 1)
+    snapshot(outbound, 'e1', 1, room='other')
+    snapshot(outbound, 'e1', 3)
+    # 发给单个连接的快照按数据中的房间合并
+    snapshot(outbound, 'e1', 4, target='sid-e1')
+
+    assert queued(outbound, 'e1') == ['msg1', 'snapshot-other-1', 'snapshot-lobby-4']
+    assert outbound.coalesced == 3
+    assert outbound.stats()['dropped_presence'] == 0
+
+
+def test_presence_snapshot_storm_does_not_disconnect():
+    outbound, server, recovered = build(max_queue=5, engineio_limit=1, disconnect_after=10)
+    server.connect('e1').depth = 1
+    for version in range(1000):
+        snapshot(outbound, 'e1', version)
+    assert queued(outbound, 'e1') == ['snapshot-lobby-999']
+    assert server.disconnected == [] and outbound.disconnects == 0
+
+    server.run_tasks()
+    assert server.sent == [('e1', 'snapshot-lobby-999')]
+    assert recovered == []
+
+
+def test_overflow_drops_presence_then_oldest_chat_and_reports_gaps():
+    outbound, server, recovered = build(max_queue=3, engineio_limit=1)
+    server.connect('e1').depth = 1
+    outbound.send('e1', 'delta', 'presence_delta', {'room': 'lobby', 'version': 2}, 'lobby')
+    for message_id in range(1, 6):
+        chat(outbound, 'e1', message_id)
+
+    assert queued(outbound, 'e1') == ['msg3', 'msg4', 'msg5']
+    stats = outbound.stats()
+    assert stats['dropped_presence'] == 1 and stats['dropped_chat'] == 2
+
+    server.run_tasks()
+    assert recovered == [('sid-e1', {'lobby': (2, 1, 2)}, {'lobby'})]
+
+
+def test_undroppable_backlog_disconnects():
+    outbound, server, _ = build(max_queue=2, engineio_limit=1)
+    server.connect('e1').depth = 1
+    for index in range(3):
+        outbound.send('e1', f'pkt{index}', 'history_page', {}, 'sid-e1')
+    assert outbound.disconnects == 1
+    server.run_tasks()
+    assert server.disconnected == ['e1']
+    # 关闭中的客户端不再积压
+    outbound.send('e1', 'late', 'history_page', {}, 'sid-e1')
+    assert queued(outbound, 'e1') == []
+
+
+def test_disconnect_policy_and_drop_limit():
+    outbound, server, _ = build(max_queue=1, engineio_limit=1, policy=POLICY_DISCONNECT)
+    server.connect('e1').depth = 1
+    chat(outbound, 'e1', 1)
+    chat(outbound, 'e1', 2)
+    assert outbound.disconnects == 1
+
+    outbound, server, _ = build(max_queue=1, engineio_limit=1, disconnect_after=2)
+    server.connect('e2').depth = 1
+    for message_id in range(1, 5):
+        chat(outbound, 'e2', message_id)
+    assert outbound.stats()['dropped_chat'] == 3
+    assert outbound.disconnects == 1
+
+
+APP_SCRIPT = """
+import json
+import app
+
+client = app.app.test_client()
+metrics = client.get('/metrics').get_data(as_text=True)
+local = client.get('/debug/outbound')
+remote = client.get('/debug/outbound', environ_base={'REMOTE_ADDR': '10.0.0.8'})
+print(json.dumps({'metrics': metrics, 'local': [local.status_code, local.get_json()], 'remote': remote.status_code}))
+"""
+
+
+def test_metrics_have_no_client_labels_and_detail_is_local_only():
+    env = dict(os.environ, CHAT_BANNED_WORDS='', CHAT_PROBE_INTERVAL='0', CHAT_LOG_LEVEL='WARNING')
+    env.pop('CHAT_MESSAGE_LOG', None)
+    env.pop('CHAT_MESSAGE_QUEUE', None)
+    result = subprocess.run([sys.executable, '-c', APP_SCRIPT], cwd=ROOT, env=env, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout.splitlines()[-1])
+
+    lines = [line for line in output['metrics'].splitlines() if line.startswith('chat_outbound_queue')]
+    assert 'chat_outbound_queue_clients{stat="max_queued"} 0' in lines
+    assert 'chat_outbound_queue_clients{stat="clients_with_drops"} 0' in lines
+    # 指标的标签数量固定，不带会话ID和昵称
+    assert not any('sid=' in line or 'nickname=' in line for line in lines)
+    assert output['local'] == [200, {'enabled': True, 'clients': []}]
+    assert output['remote'] == 403
@@ -0,0 +1,100 @@
+"""令牌桶限流和刷屏处罚：LRU 淘汰、补充额度、违规逐级处罚和禁言到期"""
+from services.rate_limit import TokenBucketLimiter, FloodControl, ALLOW, DROP, WARN, MUTE, MUTED
+
+
+class Clock:
+    """由测试推进的时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_lru_evicts_least_recently_used_key():
+    limiter = TokenBucketLimiter(rate=1.0, burst=2, max_keys=3)
+    for key in ('a', 'b', 'c'):
+        limiter.consume(key, 0.0)
+    # 使用 a 后 b 成为最久未使用的键
+    limiter.consume('a', 0.0)
+    limiter.consume('d', 0.0)
+    assert len(limiter) == 3
+    assert list(limiter._buckets) == ['c', 'a', 'd']
+
+
+def test_lru_stays_bounded_when_no_bucket_is_full():
+    limiter = TokenBucketLimiter(rate=0.0, burst=1, max_keys=100)
+    for i in range(1000):
+        limiter.consume('nick%d' % i, 0.0)
+    assert len(limiter) == 100
+
+
+def test_rejected_nickname_does_not_spend_session_tokens():
+    flood = FloodControl(message_rate=0.0, message_burst=2)
+    assert flood.check('s1', 'alice')[0] == ALLOW
+    assert flood.check('s1', 'alice')[0] == ALLOW
+    # 同一昵称换会话后被昵称桶拒绝，新会话的额度不应被扣除
+    assert flood.check('s2', 'alice')[0] != ALLOW
+    assert flood.check('s2', 'alice')[0] != ALLOW
+    assert flood.check('s2', 'bob')[0] == ALLOW
+    assert flood.check('s2', 'bob')[0] == ALLOW
+
+
+
+def test_bucket_refills_over_time_up_to_burst():
+    limiter = TokenBucketLimiter(rate=2.0, burst=4)
+    assert all(limiter.consume('a', 0.0) for _ in range(4))
+    assert not limiter.consume('a', 0.0)
+    # 每秒补充 2 个，0.5 秒后只够一条
+    assert limiter.consume('a', 0.5)
+    assert not limiter.consume('a', 0.5)
+    assert limiter.available('a', 0.75) == 0.5
+    # 长时间空闲后最多补满到突发上限
+    assert limiter.available('a', 100.0) == 4
+
+
+def test_escalates_from_drop_to_warn_to_mute():
+    clock = Clock()
+    flood = FloodControl(message_rate=0.0, message_burst=1, warn_after=3, mute_after=5, mute_seconds=30,
+                         clock=clock)
+    assert flood.check('s1', 'alice') == (ALLOW, 0)
+    verdicts = [flood.check('s1', 'alice')[0] for _ in range(5)]
+    assert verdicts == [DROP, DROP, WARN, DROP, MUTE]
+    clock.advance(10)
+    assert flood.check('s1', 'alice') == (MUTED, 20)
+    # 禁言针对昵称，换会话也一样
+    assert flood.check('s2', 'alice')[0] == MUTED
+    assert flood.check('s3', 'bob') == (ALLOW, 0)
+    assert flood.stats()['muted'] == 1
+
+
+def test_mute_expires_and_strikes_start_over():
+    clock = Clock()
+    flood = FloodControl(message_rate=0.1, message_burst=1, warn_after=2, mute_after=3, mute_seconds=30,
+                         strike_decay=0, clock=clock)
+    flood.check('s1', 'alice')
+    assert [flood.check('s1', 'alice')[0] for _ in range(3)] == [DROP, WARN, MUTE]
+    clock.advance(29.9)
+    assert flood.check('s1', 'alice')[0] == MUTED
+    clock.advance(0.1)
+    # 禁言结束时额度已经补充，违规次数从头计算
+    assert flood.stats()['muted'] == 0
+    assert flood.check('s1', 'alice') == (ALLOW, 0)
+    assert flood.check('s1', 'alice') == (DROP, 0)
+
+
+def test_strikes_decay_over_time():
+    clock = Clock()
+    flood = FloodControl(message_rate=0.0, message_burst=1, warn_after=2, mute_after=3, strike_decay=10.0,
+                         clock=clock)
+    flood.check('s1', 'alice')
+    assert flood.check('s1', 'alice')[0] == DROP
+    # 每隔 strike_decay 秒抵消一次违规，偶尔超限不会升级处罚
+    for _ in range(5):
+        clock.advance(10)
+        assert flood.check('s1', 'alice')[0] == DROP
+    assert flood.check('s1', 'alice')[0] == WARN
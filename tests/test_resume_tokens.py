@@ -0,0 +1,64 @@
+"""断线重连令牌：只有最近签发的令牌能接管昵称"""
+import time
+
+from services.resume import ResumeTokens, SQLiteResumeNonces
+
+
+class ThreadTransport:
+    def start_background_task(self, target, *args):
+        import threading
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    sleep = staticmethod(time.sleep)
+
+
+def test_only_latest_token_owns_nickname():
+    tokens = ResumeTokens(ThreadTransport(), 'secret')
+    first = tokens.issue('alice')
+    second = tokens.issue('alice')
+    assert tokens.verify(first, 'alice') and not tokens.owns(first, 'alice')
+    assert tokens.owns(second, 'alice')
+    assert not tokens.owns(second, 'bob')
+
+
+def test_token_not_owned_after_restart():
+    token = ResumeTokens(ThreadTransport(), 'secret').issue('alice')
+    restarted = ResumeTokens(ThreadTransport(), 'secret')
+    # 签名仍然有效，但重启后不再能接管
+    assert restarted.verify(token, 'alice')
+    assert not restarted.owns(token, 'alice')
+
+
+def test_detached_session_expires():
+    expired = []
+    tokens = ResumeTokens(ThreadTransport(), 'secret', grace=0.05,
+                          on_expired=lambda sid, nickname: expired.append((sid, nickname)))
+    token = tokens.issue('alice')
+    tokens.detach('alice', 's1')
+    assert tokens.is_detached('alice')
+    deadline = time.monotonic() + 2
+    while not expired and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert expired == [('s1', 'alice')]
+    assert not tokens.owns(token, 'alice')
+
+
+def test_shared_nonces_let_another_worker_resume(tmp_path):
+    expired = []
+    path = str(tmp_path / 'state.db')
+    worker_a = ResumeTokens(ThreadTransport(), 'secret', grace=0.05, nonces=SQLiteResumeNonces(path),
+                            on_expired=lambda sid, nickname: expired.append((sid, nickname)))
+    worker_b = ResumeTokens(ThreadTransport(), 'secret', nonces=SQLiteResumeNonces(path))
+    token = worker_a.issue('alice')
+    worker_a.detach('alice', 's1')
+    # 另一个工作进程验证并接管，签发新令牌
+    assert worker_b.owns(token, 'alice')
+    renewed = worker_b.issue('alice')
+    deadline = time.monotonic() + 2
+    while not expired and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 原进程的保留超时只删除断开时的随机串，新令牌仍然有效
+    assert expired == [('s1', 'alice')]
+    assert worker_a.owns(renewed, 'alice') and not worker_a.owns(token, 'alice')
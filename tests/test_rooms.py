@@ -0,0 +1,126 @@
+"""
+多房间：房间名称校验、房间数上限、切换房间时两个房间的在线名单增量、房间列表和历史消息范围
+
+每个场景在子进程中导入 app，用 Flask-SocketIO 的测试客户端收发事件，结果以 JSON 输出。
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRELUDE = """
+import json
+import app
+
+def join(nickname, room=None):
+    client = app.socketio.test_client(app.app)
+    client.emit('join', {'nickname': nickname, 'room': room} if room else {'nickname': nickname})
+    client.get_received()
+    return client
+
+def events(client, name):
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+result = {}
+"""
+
+
+def run(scenario, **env):
+    env = dict(os.environ, CHAT_BANNED_WORDS='', CHAT_PROBE_INTERVAL='0', CHAT_LOG_LEVEL='WARNING',
+               CHAT_PRESENCE_DEBOUNCE_MS='0', **env)
+    env.pop('CHAT_MESSAGE_LOG', None)
+    code = PRELUDE + scenario + "\nprint(json.dumps(result, ensure_ascii=False))\n"
+    completed = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True,
+                               text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def test_invalid_room_names_rejected():
+    result = run("""
+alice = join('alice')
+for room in ('a b', 'x' * 33, 'tab\\there', 'bell\\x07', 123):
+    alice.emit('switch_room', {'room': room})
+result['errors'] = [data['message'] for data in events(alice, 'error')]
+bob = app.socketio.test_client(app.app)
+bob.emit('join', {'nickname': 'bob', 'room': 'a b'})
+result['join'] = [event['name'] for event in bob.get_received()]
+result['rooms'] = alice.emit('list_rooms', callback=True)
+""")
+    assert result['errors'] == ['房间名称须为1到32个字符，且不能包含空白'] * 5
+    assert result['join'] == ['error']
+    # 被拒绝的切换不改变所在房间
+    assert result['rooms'] == {'current': 'chat_room', 'rooms': [{'room': 'chat_room', 'online_count': 1}]}
+
+
+def test_room_cap_allows_existing_and_default_rooms():
+    result = run("""
+alice = join('alice')
+bob = join('bob', 'r1')
+carol = join('carol', 'r1')
+carol.emit('switch_room', {'room': 'r2'})
+result['new_room'] = events(carol, 'error')
+carol.emit('switch_room', {'room': 'r1'})
+result['existing_room'] = [data['room'] for data in events(carol, 'room_joined')]
+# 默认房间没人时也不受上限限制
+alice.emit('switch_room', {'room': 'r1'})
+events(alice, 'room_joined')
+bob.emit('switch_room', {'room': 'chat_room'})
+result['default_room'] = [data['room'] for data in events(bob, 'room_joined')]
+""", CHAT_MAX_ROOMS='2')
+    assert result['new_room'] == [{'message': '房间数量已达上限，请进入已有的房间'}]
+    assert result['existing_room'] == ['r1']
+    assert result['default_room'] == ['chat_room']
+
+
+def test_switch_sends_presence_deltas_to_both_rooms():
+    result = run("""
+alice = join('alice')
+bob = join('bob')
+carol = join('carol', 'games')
+events(alice, 'presence_delta')
+alice.emit('switch_room', {'room': 'games'})
+result['joined'] = events(alice, 'room_joined')
+result['old_room'] = events(bob, 'presence_delta')
+result['new_room'] = events(carol, 'presence_delta')
+""")
+    joined, = result['joined']
+    assert joined['room'] == 'games' and sorted(joined['users']) == ['alice', 'carol']
+    old_delta, = result['old_room']
+    assert old_delta['room'] == 'chat_room'
+    assert (old_delta['added'], old_delta['removed'], old_delta['online_count']) == ([], ['alice'], 1)
+    new_delta, = result['new_room']
+    assert new_delta['room'] == 'games'
+    assert (new_delta['added'], new_delta['removed'], new_delta['online_count']) == (['alice'], [], 2)
+
+
+def test_list_rooms_counts_per_room():
+    result = run("""
+clients = [join('a'), join('b'), join('c', 'games'), join('d', 'games'), join('e', 'games'), join('f', 'quiet')]
+result['rooms'] = clients[2].emit('list_rooms', callback=True)
+""")
+    assert result['rooms'] == {'current': 'games', 'rooms': [
+        {'room': 'games', 'online_count': 3},
+        {'room': 'chat_room', 'online_count': 2},
+        {'room': 'quiet', 'online_count': 1},
+    ]}
+
+
+def test_history_scoped_to_room_after_switch():
+    result = run("""
+alice = join('alice')
+bob = join('bob', 'games')
+alice.emit('send_message', {'message': '大厅消息'})
+bob.emit('send_message', {'message': '游戏房消息'})
+app.socketio.sleep(0.1)
+alice.get_received()
+alice.emit('switch_room', {'room': 'games'})
+result['history'] = [message['message'] for message in events(alice, 'room_joined')[0]['history']]
+bob.emit('send_message', {'message': '切换之后'})
+app.socketio.sleep(0.1)
+result['received'] = [data['message'] for data in events(alice, 'new_message')]
+""")
+    assert result['history'] == ['游戏房消息']
+    assert result['received'] == ['切换之后']
@@ -0,0 +1,44 @@
+"""本进程维护的在线名单版本号"""
+from services.roster import PresenceTracker
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+
+def make_tracker():
+    members = {}
+    transport = RecordingTransport()
+    tracker = PresenceTracker(transport, lambda room: sorted(members.get(room, ())),
+                              lambda room: len(members.get(room, ())), debounce=0)
+    return tracker, members, transport
+
+
+def test_delta_versions_are_consecutive():
+    tracker, members, transport = make_tracker()
+    members['a'] = {'alice'}
+    tracker.joined('a', 'alice')
+    members['a'].add('bob')
+    tracker.joined('a', 'bob')
+    deltas = [data for event, data, _ in transport.emitted if event == 'presence_delta']
+    assert [(data['base_version'], data['version']) for data in deltas] == [(0, 1), (1, 2)]
+    assert deltas[1]['added'] == ['bob'] and deltas[1]['online_count'] == 2
+
+
+def test_empty_room_versions_are_dropped_without_reuse():
+    tracker, members, transport = make_tracker()
+    for index in range(100):
+        room = f'room{index}'
+        members[room] = {'alice'}
+        tracker.joined(room, 'alice')
+        members[room] = set()
+        tracker.left(room, 'alice')
+    assert tracker._versions == {}
+    # 重新创建的房间版本号从已丢弃的最大版本号继续，客户端缓存的旧版本号不会被误认为最新
+    members['room0'] = {'bob'}
+    tracker.joined('room0', 'bob')
+    assert tracker.version('room0') == 201
@@ -0,0 +1,122 @@
+"""聊天记录倒排索引：二元组切分、多关键词查询、分页、扫描上限、房间范围和搜索结果只发给搜索者"""
+import json
+import os
+import subprocess
+import sys
+
+from services.search_index import SearchIndex, tokenize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build(*texts, room='lobby', **kwargs):
+    index = SearchIndex(**kwargs)
+    for number, text in enumerate(texts, 1):
+        index.add(room, {'id': number, 'ts': number, 'nickname': 'alice', 'message': text})
+    return index
+
+
+def texts(found):
+    return [item['text'] for item in found['results']]
+
+
+def test_cjk_bigrams_and_words():
+    assert tokenize('分享了一部电影 demo.mp4') == ['分享', '享了', '了一', '一部', '部电', '电影', 'demo', 'mp4']
+    # 全角字母和大小写归一化，单个汉字不产生词项
+    assert tokenize('ＤＥＭＯ 影') == ['demo']
+    assert tokenize('影') == [] and tokenize('  ') == []
+
+
+def test_single_character_query_finds_nothing():
+    index = build('看电影')
+    assert index.search('影') == {'results': [], 'has_more': False, 'truncated': False}
+    assert texts(index.search('电影')) == ['看电影']
+
+
+def test_all_terms_required_and_verified_against_text():
+    index = build('电影和影院', '今晚去电影院', '电影 demo', 'demo 视频')
+    # 两个二元组都出现但不相邻，校验原文后排除
+    assert texts(index.search('电影院')) == ['今晚去电影院']
+    # 多个关键词须同时出现，结果按时间倒序
+    assert texts(index.search('电影 DEMO')) == ['电影 demo']
+    assert texts(index.search('电影')) == ['电影 demo', '今晚去电影院', '电影和影院']
+    assert texts(index.search('电影 不存在')) == []
+
+
+def test_pagination_and_has_more():
+    index = build(*[f'消息 {number}' for number in range(1, 13)])
+    first = index.search('消息', limit=5)
+    assert texts(first) == [f'消息 {number}' for number in range(12, 7, -1)]
+    assert first['has_more'] is True
+    assert texts(index.search('消息', offset=5, limit=5)) == [f'消息 {number}' for number in range(7, 2, -1)]
+    last = index.search('消息', offset=10, limit=5)
+    assert texts(last) == ['消息 2', '消息 1'] and last['has_more'] is False
+    # 恰好取完时没有下一页
+    assert index.search('消息', offset=7, limit=5)['has_more'] is False
+
+
+def test_max_scan_truncates_search():
+    # 较新的 30 条都含有两个二元组但不含 “电影院”，候选多而命中少
+    messages = ['老电影院', *['电影 影院'] * 30]
+    found = build(*messages, max_scan=10).search('电影院')
+    assert found['results'] == [] and found['truncated'] is True
+    found = build(*messages, max_scan=100).search('电影院')
+    assert texts(found) == ['老电影院'] and found['truncated'] is False
+
+
+def test_search_scoped_to_room():
+    index = SearchIndex()
+    index.add('lobby', {'id': 1, 'ts': 1, 'nickname': 'alice', 'message': '大厅的电影'})
+    index.add('games', {'id': 1, 'ts': 2, 'nickname': 'bob', 'message': '游戏房的电影'})
+    assert texts(index.search('电影', room='lobby')) == ['大厅的电影']
+    assert [(item['room'], item['nickname']) for item in index.search('电影', room='games')['results']] == [('games', 'bob')]
+    assert texts(index.search('电影')) == ['游戏房的电影', '大厅的电影']
+    assert index.search('电影', room='unknown')['results'] == []
+
+
+def test_evicted_rooms_are_released():
+    index = SearchIndex(max_docs=1000)
+    for number in range(5000):
+        index.add(f'room{number}', {'id': 1, 'ts': number, 'nickname': 'a', 'message': f'消息内容 {number}'})
+    # 只保留仍有文档的房间
+    assert len(index._room_names) <= 2000
+    assert index.search('消息', room='room0')['results'] == []
+    latest = index.search('消息', room='room4999')['results']
+    assert [item['text'] for item in latest] == ['消息内容 4999']
+
+
+SEARCH_SCRIPT = """
+import json
+import app
+
+alice = app.socketio.test_client(app.app)
+bob = app.socketio.test_client(app.app)
+alice.emit('join', {'nickname': 'alice'})
+bob.emit('join', {'nickname': 'bob'})
+alice.emit('send_message', {'message': '今晚一起看电影'})
+app.socketio.sleep(0.3)
+alice.get_received()
+bob.get_received()
+alice.emit('send_message', {'message': '@搜索 电影'})
+alice.emit('send_message', {'message': '@搜索 影'})
+app.socketio.sleep(0.3)
+print(json.dumps({'alice': alice.get_received(), 'bob': bob.get_received()}, ensure_ascii=False))
+"""
+
+
+def test_search_reply_sent_only_to_searcher():
+    env = dict(os.environ, CHAT_BANNED_WORDS='', CHAT_PROBE_INTERVAL='0', CHAT_LOG_LEVEL='WARNING')
+    env.pop('CHAT_MESSAGE_LOG', None)
+    result = subprocess.run([sys.executable, '-c', SEARCH_SCRIPT], cwd=ROOT, env=env, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    received = json.loads(result.stdout.splitlines()[-1])
+
+    response, error = received['alice']
+    assert response['name'] == 'command_response'
+    assert [item['text'] for item in response['args'][0]['results']] == ['今晚一起看电影']
+    # 关键词太短时只提示搜索者
+    assert error['name'] == 'new_message' and error['args'][0]['is_system']
+    assert '至少输入两个字' in error['args'][0]['message']
+    # 搜索结果和错误都不广播到房间
+    assert received['bob'] == []
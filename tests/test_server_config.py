@@ -0,0 +1,156 @@
+"""/config 缓存和原子写入，以及用本地 HTTP 服务代替各服务器的延迟探测排序"""
+import json
+import os
+import socket
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.server_config import ConfigStore, ServerProber, write_json_atomic
+
+
+class ThreadTransport:
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    sleep = staticmethod(time.sleep)
+
+
+class StandIn:
+    """本地 HTTP 服务，健康检查按预设的延迟返回预设的状态码"""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(stand_in.delay)
+                self.send_response(stand_in.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def refused_url():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{s.getsockname()[1]}'
+
+
+@pytest.fixture
+def stand_ins():
+    servers = {'fast': StandIn(), 'slow': StandIn(delay=0.15), 'broken': StandIn(status=500)}
+    yield servers
+    for server in servers.values():
+        server.close()
+
+
+def write_config(path, config):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+
+def test_config_cached_until_file_changes(tmp_path):
+    path = tmp_path / 'config.json'
+    write_config(path, {'servers': [{'name': 'a', 'url': 'http://a'}]})
+    store = ConfigStore(str(path), {'servers': []})
+
+    config, version = store.get()
+    assert config['servers'][0]['name'] == 'a'
+    # 文件未变化时返回同一个已解析的对象
+    assert store.get() == (config, version)
+    assert store.get()[0] is config
+
+    write_config(path, {'servers': [{'name': 'b', 'url': 'http://b'}]})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    changed, new_version = store.get()
+    assert changed['servers'][0]['name'] == 'b'
+    assert new_version != version
+
+
+def test_missing_or_invalid_config_falls_back_to_default(tmp_path):
+    path = tmp_path / 'config.json'
+    default = {'servers': []}
+    store = ConfigStore(str(path), default)
+    assert store.get()[0] is default
+    path.write_text('{not json', encoding='utf-8')
+    assert store.get()[0] is default
+
+
+def test_update_writes_atomically_and_keeps_mode(tmp_path):
+    path = tmp_path / 'config.json'
+    write_config(path, {'servers': []})
+    os.chmod(path, 0o640)
+    store = ConfigStore(str(path), {'servers': []})
+
+    assert store.update(lambda config: config['servers'].append({'name': 'a', 'url': 'http://a'}))
+    assert json.loads(path.read_text(encoding='utf-8'))['servers'] == [{'name': 'a', 'url': 'http://a'}]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    # 没有残留的临时文件，缓存也已更新
+    assert os.listdir(tmp_path) == ['config.json']
+    assert store.get()[0]['servers'][0]['name'] == 'a'
+    assert store.update(lambda config: False) is False
+
+
+def test_new_file_mode_follows_umask(tmp_path):
+    path = tmp_path / 'config.json'
+    umask = os.umask(0o022)
+    try:
+        write_json_atomic(str(path), {'servers': []})
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+
+def test_ranking_by_probed_latency(stand_ins):
+    refused = refused_url()
+    servers = [
+        {'name': '拒绝连接', 'url': refused},
+        {'name': '慢', 'url': stand_ins['slow'].url},
+        {'name': '出错', 'url': stand_ins['broken'].url},
+        {'name': '快', 'url': stand_ins['fast'].url},
+        {'name': '未探测', 'url': 'http://127.0.0.1:1'},
+    ]
+    prober = ServerProber(ThreadTransport(), lambda: servers[:4], interval=0, timeout=2.0)
+    prober.probe_all()
+    assert prober.version == 1
+
+    ranked = prober.ranked(servers)
+    # 健康的按延迟排在前面，其余保持配置中的顺序
+    assert [entry['name'] for entry in ranked] == ['快', '慢', '拒绝连接', '出错', '未探测']
+    fast, slow, refused_entry, broken, unprobed = ranked
+    assert fast['healthy'] and slow['healthy']
+    assert fast['latency_ms'] < slow['latency_ms']
+    assert slow['latency_ms'] >= 150
+    assert broken['healthy'] is False and broken['error'] == 'HTTP 500'
+    assert refused_entry['healthy'] is False and refused_entry['latency_ms'] is None
+    assert unprobed['healthy'] is None
+
+
+def test_removed_servers_are_forgotten(stand_ins):
+    servers = [{'name': '快', 'url': stand_ins['fast'].url}, {'name': '慢', 'url': stand_ins['slow'].url}]
+    prober = ServerProber(ThreadTransport(), lambda: servers, interval=0)
+    prober.probe_all()
+    del servers[1]
+    prober.probe_all()
+    assert prober.ranked([{'name': '慢', 'url': stand_ins['slow'].url}])[0]['healthy'] is None
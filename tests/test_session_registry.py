@@ -0,0 +1,111 @@
+"""会话注册表两种后端的行为一致性"""
+import threading
+import time
+
+import pytest
+
+from services.presence import SessionRegistry, SQLiteSessionRegistry
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def registry(request, tmp_path):
+    if request.param == 'memory':
+        return SessionRegistry()
+    return SQLiteSessionRegistry(str(tmp_path / 'state.db'), 'w1')
+
+
+def test_duplicate_nickname_rejected(registry):
+    assert registry.add('s1', 'alice', 'room') is not None
+    assert registry.add('s2', 'alice', 'room') is None
+    assert registry.nicknames() == ['alice']
+
+
+def test_duplicate_session_id_rejected(registry):
+    assert registry.add('s1', 'alice', 'room') is not None
+    assert registry.add('s1', 'bob', 'room') is None
+    assert registry.remove('s1').nickname == 'alice'
+    # 移除后昵称和房间计数都不留残余
+    assert registry.nicknames() == []
+    assert registry.rooms() == {}
+    assert registry.add('s2', 'alice', 'room') is not None
+
+
+def test_move_and_rebind(registry):
+    registry.add('s1', 'alice', 'a')
+    registry.add('s2', 'bob', 'a')
+    assert registry.move('s1', 'b') == 'a'
+    assert registry.rooms() == {'a': 1, 'b': 1}
+    assert registry.rebind('s1', 's3').room == 'b'
+    assert registry.get('s1') is None
+    assert registry.get_by_nickname('alice').session_id == 's3'
+
+
+def test_sqlite_room_versions_are_shared(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SQLiteSessionRegistry(path, 'w1'), SQLiteSessionRegistry(path, 'w2')
+    first.add('s1', 'alice', 'a')
+    second.add('s2', 'bob', 'a')
+    assert first.room_snapshot('a') == second.room_snapshot('a') == (2, ['alice', 'bob'])
+    second.move('s2', 'b')
+    first.remove('s1')
+    assert second.room_version('a') == 4
+    assert first.room_snapshot('b') == (1, ['bob'])
+    # 工作进程重启时清理遗留会话，版本号同样递增
+    SQLiteSessionRegistry(path, 'w2')
+    assert first.room_snapshot('b') == (2, [])
+
+
+def test_sqlite_rebind_and_remove_across_workers(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SQLiteSessionRegistry(path, 'w1'), SQLiteSessionRegistry(path, 'w2')
+    first.add('s1', 'alice', 'a')
+    assert second.rebind('s1', 's2').nickname == 'alice'
+    # 原进程的超时清理拿不到已被接管的会话，也不改变名单版本
+    assert first.remove('s1') is None
+    assert first.room_snapshot('a') == (1, ['alice'])
+
+    # 接管和移除同时进行时只有一方拿到会话
+    for index in range(50):
+        old, new = f'old{index}', f'new{index}'
+        first.add(old, f'user{index}', 'b')
+        results = {}
+        threads = [threading.Thread(target=lambda: results.update(rebind=second.rebind(old, new))),
+                   threading.Thread(target=lambda: results.update(remove=first.remove(old)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert (results['rebind'] is None) != (results['remove'] is None)
+        assert (second.get(new) is not None) == (results['rebind'] is not None)
+        second.remove(new)
+    assert second.count() == 1
+
+
+def test_sqlite_move_reads_session_inside_transaction(tmp_path):
+    path = str(tmp_path / 'state.db')
+    other = SQLiteSessionRegistry(path, 'w2')
+    results = {}
+
+    class Racing(SQLiteSessionRegistry):
+        def get(self, session_id):
+            session = super().get(session_id)
+            if 'other' not in results:
+                # 读取会话之后另一个进程切换同一会话
+                results['other'] = None
+                thread = threading.Thread(target=lambda: results.update(other=other.move('s1', 'c')))
+                thread.start()
+                results['thread'] = thread
+                time.sleep(0.1)
+            return session
+
+    first = Racing(path, 'w1')
+    first.add('s1', 'alice', 'a')
+    results.clear()
+    assert first.move('s1', 'b') == 'a'
+    results['thread'].join()
+    # 另一个进程等到写事务结束后才读取，看到的原房间是 b 而不是过期的 a
+    assert results['other'] == 'b'
+    assert first.rooms() == {'c': 1}
+    assert first.room_version('a') == 2 and first.room_version('b') == 2 and first.room_version('c') == 1
+    first.remove('s1')
+    assert other.move('s1', 'd') is None
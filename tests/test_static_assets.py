@@ -0,0 +1,38 @@
+"""socket.io 客户端缺失时启动检查和页面引用的行为"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VENDOR = os.path.join(ROOT, 'static', 'vendor', 'socket.io.min.js')
+
+SCRIPT = """
+import chat_core
+chat_core.check_socketio_client()
+client = chat_core.app.test_client()
+print(client.get('/chat?nickname=alice').get_data(as_text=True))
+"""
+
+
+def run_app(**env):
+    env = dict(os.environ, CHAT_MESSAGE_LOG='', CHAT_PROBE_INTERVAL='0', CHAT_SEARCH_MAX_DOCS='0', **env)
+    if not env.get('CHAT_SOCKETIO_CDN'):
+        env.pop('CHAT_SOCKETIO_CDN', None)
+    return subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+
+
+@pytest.mark.skipif(os.path.exists(VENDOR), reason='已下载本地 socket.io 客户端')
+def test_missing_client_falls_back_to_cdn_by_default():
+    result = run_app(CHAT_SOCKETIO_CDN='')
+    assert result.returncode == 0, result.stderr
+    assert 'https://cdn.socket.io/4.5.4/socket.io.min.js' in result.stdout
+    assert '页面将从 CDN 加载' in result.stdout + result.stderr
+
+
+@pytest.mark.skipif(os.path.exists(VENDOR), reason='已下载本地 socket.io 客户端')
+def test_missing_client_fails_startup_when_cdn_disabled():
+    result = run_app(CHAT_SOCKETIO_CDN='0')
+    assert result.returncode != 0
+    assert 'static/vendor/socket.io.min.js' in result.stderr
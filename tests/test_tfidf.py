@@ -0,0 +1,112 @@
+"""@川小农 FAQ 的 TF-IDF 检索：索引文件读写、阈值回退和有无 NumPy 时结果一致"""
+import json
+import random
+from contextlib import contextmanager
+
+import pytest
+
+from commands.chuannong import ChuannongCommandHandler, FaqRetriever
+from utils import tfidf
+from utils.tfidf import TfidfIndex
+
+FAQ = [
+    {'questions': ['四川农业大学有几个校区', '川农的校区都在哪里'], 'answer': '三个校区'},
+    {'questions': ['雅安校区的地址', '雅安校区怎么走'], 'answer': '雅安校区地址'},
+    {'questions': ['图书馆几点开门', '图书馆开放时间'], 'answer': '图书馆早上八点开门'},
+    {'question': '食堂在哪里吃饭', 'answer': '食堂在二号楼'},
+]
+
+
+@contextmanager
+def pure_python(monkeypatch):
+    """在该上下文中构建和查询的索引走纯 Python 路径"""
+    with monkeypatch.context() as patch:
+        patch.setattr(tfidf, 'np', None)
+        yield
+
+
+@pytest.fixture
+def faq_path(tmp_path):
+    path = tmp_path / 'faq.json'
+    path.write_text(json.dumps(FAQ, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    documents = [question for entry in FAQ for question in entry.get('questions', [entry.get('question')])]
+    index = TfidfIndex.build(documents)
+    path = str(tmp_path / 'faq.tfidf')
+    index.save(path, 'digest-1')
+
+    loaded = TfidfIndex.load(path, 'digest-1')
+    assert loaded is not None and len(loaded) == len(documents)
+    assert loaded.vocabulary == index.vocabulary
+    for query in ('雅安校区在哪', '图书馆什么时候开门', '完全无关'):
+        assert loaded.best(query) == index.best(query)
+    # 来源数据变化、文件损坏或不存在时需要重新构建
+    assert TfidfIndex.load(path, 'digest-2') is None
+    with open(path, 'r+b') as f:
+        f.write(b'BROKEN')
+    assert TfidfIndex.load(path, 'digest-1') is None
+    assert TfidfIndex.load(str(tmp_path / 'missing.tfidf'), 'digest-1') is None
+
+
+def test_retriever_reuses_saved_index(faq_path, monkeypatch):
+    FaqRetriever(faq_path)
+    built = []
+    monkeypatch.setattr(TfidfIndex, 'build', classmethod(lambda cls, *args: built.append(args)))
+    retriever = FaqRetriever(faq_path)
+    assert built == []
+    assert retriever.match('雅安校区怎么去') == '雅安校区地址'
+
+
+def test_below_threshold_falls_back_to_rules(faq_path):
+    class Handler(ChuannongCommandHandler):
+        pass
+
+    Handler.faq_path = faq_path
+    handler = Handler()
+    assert handler._match_answer('图书馆几点开门呀') == '图书馆早上八点开门'
+    # FAQ 中没有足够相似的问法时使用正则规则
+    assert handler._match_answer('你是谁') == '我是川小农，你的智能聊天助手！'
+
+    Handler.faq_threshold = 1.01
+    strict = Handler()
+    assert strict._match_answer('图书馆几点开门') != '图书馆早上八点开门'
+    assert strict._match_answer('都江堰校区位置') == '都江堰校区位于四川省成都市都江堰市建设路288号。'
+
+
+def test_ties_go_to_lowest_document(monkeypatch):
+    queries = ('yx', 'xy')
+    with pure_python(monkeypatch):
+        # 两个词项的文档数相同，纯 Python 路径先累加查询中的第一个词项
+        index = TfidfIndex.build(['x', 'y'], ngram_range=(1, 1))
+        assert [index.best(query)[0] for query in queries] == [0, 0]
+        duplicates = TfidfIndex.build(['其他问题', '校区地址', '校区地址'])
+        assert duplicates.best('校区地址')[0] == 1
+
+    if tfidf.np is not None:
+        index = TfidfIndex.build(['x', 'y'], ngram_range=(1, 1))
+        assert [index.best(query)[0] for query in queries] == [0, 0]
+        assert TfidfIndex.build(['其他问题', '校区地址', '校区地址']).best('校区地址')[0] == 1
+
+
+def test_numpy_and_pure_python_agree(monkeypatch):
+    pytest.importorskip('numpy')
+    rng = random.Random(7)
+    alphabet = '川农校区雅安成都温江图书馆食堂宿舍几点开门在哪里怎么走地址时间'
+    documents = [''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))) for _ in range(300)]
+    # 重复的文档制造得分并列
+    documents += documents[:30]
+    queries = [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 8))) for _ in range(300)]
+    queries += documents[:30]
+
+    vectorized = TfidfIndex.build(documents)
+    expected = [vectorized.best(query) for query in queries]
+    with pure_python(monkeypatch):
+        pruned = TfidfIndex.build(documents)
+        actual = [pruned.best(query) for query in queries]
+
+    for (doc, score), (expected_doc, expected_score) in zip(actual, expected):
+        assert doc == expected_doc
+        assert score == pytest.approx(expected_score, abs=1e-5)
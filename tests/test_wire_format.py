@@ -0,0 +1,69 @@
+"""紧凑消息格式和只编码一次的广播"""
+import json
+
+import socketio
+from socketio import packet
+
+from services.wire import EncodeOnceManager, WIRE_COMPACT, WIRE_JSON, KIND_CHAT, compact_message, wire_room
+
+
+class CountingPacket(packet.Packet):
+    encodes = 0
+
+    def encode(self):
+        CountingPacket.encodes += 1
+        return super().encode()
+
+
+def build_server():
+    manager = EncodeOnceManager()
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    server.packet_class = CountingPacket
+    sent = []
+    server._send_packet = lambda eio_sid, pkt: sent.append((eio_sid, pkt.encode()))
+    return manager, sent
+
+
+def join(manager, eio_sid, wire):
+    sid = manager.connect(eio_sid, '/')
+    manager.enter_room(sid, '/', wire_room('lobby', wire))
+    return sid
+
+
+def decode(encoded):
+    # 事件数据包：类型 2 后接 JSON 数组 [事件, 数据]
+    assert encoded[0] == str(packet.EVENT)
+    return json.loads(encoded[1:])
+
+
+def test_broadcast_to_each_wire_sub_room_encodes_once():
+    manager, sent = build_server()
+    for eio_sid in ('j1', 'j2'):
+        join(manager, eio_sid, WIRE_JSON)
+    for eio_sid in ('c1', 'c2', 'c3'):
+        join(manager, eio_sid, WIRE_COMPACT)
+    message = {'id': 7, 'ts': 1700000000000, 'timestamp': '10:00:00', 'nickname': '小明',
+               'message': '你好', 'is_command': False}
+
+    CountingPacket.encodes = 0
+    manager.emit('new_message', message, '/', room=wire_room('lobby', WIRE_JSON))
+    manager.emit('new_message', compact_message(message), '/', room=wire_room('lobby', WIRE_COMPACT))
+
+    # 每个子房间只编码一次，同一份编码结果发给子房间内的所有接收者
+    assert CountingPacket.encodes == 2
+    received = {eio_sid: decode(encoded) for eio_sid, encoded in sent}
+    assert sorted(received) == ['c1', 'c2', 'c3', 'j1', 'j2']
+    assert received['j1'] == received['j2'] == ['new_message', message]
+    assert received['c1'] == ['new_message', [7, 1700000000000, '小明', '你好', KIND_CHAT]]
+    assert received['c1'] == received['c2'] == received['c3']
+
+
+def test_broadcast_skips_sender_and_empty_rooms():
+    manager, sent = build_server()
+    sender = join(manager, 'j1', WIRE_JSON)
+    join(manager, 'j2', WIRE_JSON)
+
+    manager.emit('new_message', {'id': 1}, '/', room=wire_room('lobby', WIRE_COMPACT))
+    assert sent == []
+    manager.emit('new_message', {'id': 1}, '/', room=wire_room('lobby', WIRE_JSON), skip_sid=sender)
+    assert [eio_sid for eio_sid, _ in sent] == ['j2']
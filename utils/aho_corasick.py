@@ -0,0 +1,97 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式字符串匹配自动机
+
+    先用 add() 加入所有模式串，再调用 build() 构建失败指针，之后即可用
+    iter_matches() 在线性时间内找出文本中出现的全部模式串，耗时与模式串数量无关。
+    """
+
+    def __init__(self):
+        # 每个节点的转移表：{字符: 子节点序号}
+        self._goto = [{}]
+        # 失败指针
+        self._fail = [0]
+        # 以该节点结尾的模式串：[(长度, 值)]
+        self._outputs = [[]]
+        # 输出链接：沿失败指针能到达的最近一个有输出的节点，-1 表示没有
+        self._output_link = [-1]
+        self._built = False
+        self.pattern_count = 0
+
+    def add(self, word, value=None):
+        """
+        加入一个模式串
+
+        Args:
+            word: 模式串，空串会被忽略
+            value: 命中时返回的值，默认为模式串本身
+        """
+        if not word:
+            return
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._output_link.append(-1)
+            node = next_node
+        self._outputs[node].append((len(word), word if value is None else value))
+        self.pattern_count += 1
+        self._built = False
+
+    def build(self):
+        """按广度优先顺序构建失败指针和输出链接"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail if fail != child else 0
+                self._output_link[child] = fail if self._outputs[fail] else self._output_link[fail]
+
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """
+        扫描文本，按结束位置顺序产出所有命中
+
+        Yields:
+            tuple: (起始位置, 结束位置, 值)，结束位置不包含在内
+        """
+        if not self._built:
+            self.build()
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        output_link = self._output_link
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            out = node if outputs[node] else output_link[node]
+            while out > 0:
+                for length, value in outputs[out]:
+                    yield index + 1 - length, index + 1, value
+                out = output_link[out]
+
+    def __len__(self):
+        return self.pattern_count
@@ -0,0 +1,112 @@
+import http.client
+import socket
+import threading
+from urllib.parse import urlsplit
+
+
+class HTTPConnectionPool:
+    """
+    按主机复用的 HTTP 长连接池
+
+    每个 (协议, 主机, 端口) 最多保留 max_per_host 个空闲连接，请求结束后把
+    连接放回池中，下次访问同一主机时省去 TCP/TLS 握手。只读取响应头或很小的
+    响应体，响应体过大时直接关闭连接，不会下载整部影片。
+
+    请求时可以指定 address，直接连接调用方已经检查过的 IP 地址，不再重新解析域名，
+    Host 请求头和 TLS 的 SNI、证书校验仍使用 URL 中的主机名。
+
+    Args:
+        max_per_host: 每个主机保留的空闲连接数
+        max_body: 允许读完并复用连接的最大响应体字节数
+    """
+
+    def __init__(self, max_per_host=4, max_body=64 * 1024):
+        self.max_per_host = max_per_host
+        self.max_body = max_body
+        # {(scheme, host, port): [空闲连接]}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, timeout=3.0, address=None):
+        """
+        发送请求并返回响应状态和响应头
+
+        Args:
+            address: 连接的 IP 地址，为 None 时按主机名解析
+
+        Returns:
+            tuple: (状态码, 响应头 {小写名称: 值})
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port, address)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            try:
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # 空闲连接可能已被服务器关闭，换新连接重试一次
+                conn.close()
+                conn = self._new_connection(key, timeout)
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+            response_headers = {name.lower(): value for name, value in response.getheaders()}
+            length = response_headers.get('content-length')
+            reusable = (not response.will_close and
+                        (method == 'HEAD' or (length is not None and length.isdigit() and int(length) <= self.max_body)))
+            if reusable:
+                response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if reusable:
+            self._release(key, conn)
+        else:
+            conn.close()
+        return response.status, response_headers
+
+    def _acquire(self, key, timeout):
+        """取出空闲连接或新建连接，返回 (连接, 是否复用)"""
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return self._new_connection(key, timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    @staticmethod
+    def _new_connection(key, timeout):
+        scheme, host, port, address = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = connection_class(host, port, timeout=timeout)
+        if address is not None:
+            # 只替换建立 TCP 连接的目标，主机名照常用于 Host 头和 TLS
+            conn._create_connection = lambda target, *args: socket.create_connection((address, target[1]), *args)
+        return conn
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
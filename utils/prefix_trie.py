@@ -0,0 +1,70 @@
+class _Node:
+    __slots__ = ('children', 'entries', 'results')
+
+    def __init__(self):
+        self.children = {}
+        # 恰好以该节点结尾的 (键, 值)
+        self.entries = []
+        # 预先计算好的补全结果
+        self.results = ()
+
+
+class PrefixTrie:
+    """
+    前缀树，用于命令自动补全
+
+    插入全部键后调用 build()，为每个节点预先计算最多 max_results 个补全结果
+    （按键长度和字典序排列），查询时只需沿前缀走到对应节点，耗时与键的数量无关。
+    键按 casefold() 后的形式比较。多个键对应同一个值时（如命令名称和它的别名），
+    该值只返回一次，位置取排在最前的键；值须可哈希。
+
+    Args:
+        max_results: 每个前缀返回的最多结果数
+    """
+
+    def __init__(self, max_results=10):
+        self.max_results = max_results
+        self._root = _Node()
+        self._size = 0
+
+    def insert(self, key, value):
+        node = self._root
+        for char in key.casefold():
+            node = node.children.setdefault(char, _Node())
+        node.entries.append((key, value))
+        self._size += 1
+
+    def build(self):
+        self._build(self._root)
+        return self
+
+    def _build(self, node):
+        candidates = list(node.entries)
+        for child in node.children.values():
+            candidates.extend(self._build(child))
+        candidates.sort(key=lambda item: (len(item[0]), item[0]))
+        seen = set()
+        unique = []
+        for key, value in candidates:
+            if value not in seen:
+                seen.add(value)
+                unique.append((key, value))
+                if len(unique) == self.max_results:
+                    break
+        node.results = tuple(value for _, value in unique)
+        return unique
+
+    def complete(self, prefix):
+        """
+        Returns:
+            tuple: 以 prefix 开头的键对应的值
+        """
+        node = self._root
+        for char in prefix.casefold():
+            node = node.children.get(char)
+            if node is None:
+                return ()
+        return node.results
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,290 @@
+import json
+import math
+import os
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+
+try:
+    # 有 NumPy 时用向量化累加打分，没有时退回纯 Python 的倒排表累加，结果相同
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# 索引文件格式版本，格式变化时旧文件自动作废
+FORMAT_VERSION = 1
+# 索引文件开头的标识
+_MAGIC = b'TFIDF'
+# 得分相差不超过该值的文档视为并列，取编号最小的一个；两种打分方式的浮点累加顺序不同，
+# 按容差判断并列才能保证有无 NumPy 时结果相同
+TIE_TOLERANCE = 1e-6
+
+
+def normalize(text):
+    """全角转半角、统一大小写，只保留字母数字（去掉空白和标点）"""
+    return ''.join(ch for ch in unicodedata.normalize('NFKC', text).casefold() if ch.isalnum())
+
+
+def char_ngrams(text, ngram_range=(2, 3)):
+    """
+    字符 n 元组，不需要分词词典
+
+    例如 ngram_range=(2, 3) 时 '川农在哪' -> 川农 农在 在哪 川农在 农在哪。
+    归一化后不足最短长度的文本整体作为一个词项。
+
+    Returns:
+        list: 词项列表（可能重复）
+    """
+    text = normalize(text)
+    low, high = ngram_range
+    if len(text) < low:
+        return [text] if text else []
+    grams = []
+    for n in range(low, high + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class TfidfIndex:
+    """
+    字符 n 元组 TF-IDF 检索索引
+
+    每篇文档的向量为 (1 + log tf) * idf 并做 L2 归一化，查询向量同样处理，
+    余弦相似度即两者的点积。矩阵按列（词项）压缩存储：indptr[t]:indptr[t + 1]
+    是包含词项 t 的文档编号和权重。查询只涉及其中出现的几十个词项，
+    对每个词项把整段权重一次累加到所有文档的得分数组上，得分最高者即为结果。
+    没有 NumPy 时按词项的文档数从少到多累加，剩余词项的得分上界已不足以
+    超过当前最高分时停止，只对候选文档二分查找补齐剩余词项的权重，结果不变。
+    得分并列（相差不超过 TIE_TOLERANCE）时两种方式都取编号最小的文档。
+
+    索引可以用 save 写入文件、load 读回，文件中记录了来源数据的摘要，
+    数据变化后 load 返回 None，由调用方重新构建。
+
+    Args:
+        vocabulary: 词项列表，下标即列号
+        idf: 各词项的逆文档频率
+        indptr, indices, data: 按列压缩的文档权重矩阵
+        doc_count: 文档数
+        ngram_range: n 元组的长度范围
+    """
+
+    def __init__(self, vocabulary, idf, indptr, indices, data, doc_count, ngram_range=(2, 3)):
+        self.vocabulary = {term: column for column, term in enumerate(vocabulary)}
+        self.ngram_range = tuple(ngram_range)
+        self.doc_count = doc_count
+        self._idf = idf
+        self._indptr = indptr
+        self._indices = indices
+        self._data = data
+        # 未收录的词项按只出现在一篇文档中计算 idf，查询中的生僻内容会拉低相似度
+        self._unseen_idf = math.log(1 + doc_count) + 1
+        if np is not None:
+            self._indptr = np.asarray(indptr, dtype=np.int64)
+            self._indices = np.asarray(indices, dtype=np.int32)
+            self._data = np.asarray(data, dtype=np.float32)
+        else:
+            # 各列的最大权重，用于估算剩余词项的得分上界
+            self._column_max = array('f', (max(data[indptr[column]:indptr[column + 1]], default=0.0)
+                                           for column in range(len(indptr) - 1)))
+
+    def __len__(self):
+        return self.doc_count
+
+    @classmethod
+    def build(cls, documents, ngram_range=(2, 3)):
+        """
+        从文档列表构建索引
+
+        Args:
+            documents: 文本列表，下标即文档编号
+            ngram_range: n 元组的长度范围
+        """
+        counts = [Counter(char_ngrams(text, ngram_range)) for text in documents]
+        document_frequency = Counter()
+        for count in counts:
+            document_frequency.update(count.keys())
+        vocabulary = sorted(document_frequency)
+        columns = {term: column for column, term in enumerate(vocabulary)}
+        doc_count = len(documents)
+        idf = array('f', (math.log((1 + doc_count) / (1 + document_frequency[term])) + 1 for term in vocabulary))
+
+        # 先按文档算出归一化的权重，再转置成按列存储
+        postings = [[] for _ in vocabulary]
+        for doc, count in enumerate(counts):
+            weights = [(columns[term], (1 + math.log(tf)) * idf[columns[term]]) for term, tf in count.items()]
+            norm = math.sqrt(sum(weight * weight for _, weight in weights)) or 1.0
+            for column, weight in weights:
+                postings[column].append((doc, weight / norm))
+
+        indptr = array('q', [0])
+        indices = array('i')
+        data = array('f')
+        for posting in postings:
+            for doc, weight in posting:
+                indices.append(doc)
+                data.append(weight)
+            indptr.append(len(indices))
+        return cls(vocabulary, idf, indptr, indices, data, doc_count, ngram_range)
+
+    def _query_vector(self, text):
+        """查询的 (列号, 权重) 列表，已做 L2 归一化；索引中没有的词项计入范数，但不参与打分"""
+        weights = []
+        squares = 0.0
+        for term, tf in Counter(char_ngrams(text, self.ngram_range)).items():
+            column = self.vocabulary.get(term)
+            weight = (1 + math.log(tf)) * (self._idf[column] if column is not None else self._unseen_idf)
+            squares += weight * weight
+            if column is not None:
+                weights.append((column, weight))
+        norm = math.sqrt(squares)
+        return [(column, weight / norm) for column, weight in weights] if norm else []
+
+    def scores(self, text):
+        """
+        查询与所有文档的余弦相似度
+
+        Returns:
+            有 NumPy 时为 float64 数组，否则为 {文档编号: 得分}（只含得分大于 0 的文档）
+        """
+        vector = self._query_vector(text)
+        indptr, indices, data = self._indptr, self._indices, self._data
+        if np is not None:
+            scores = np.zeros(self.doc_count, dtype=np.float64)
+            for column, weight in vector:
+                start, end = indptr[column], indptr[column + 1]
+                # 同一列中的文档编号互不相同，可以直接按下标累加
+                scores[indices[start:end]] += data[start:end] * weight
+            return scores
+        scores = {}
+        get = scores.get
+        for column, weight in vector:
+            start, end = indptr[column], indptr[column + 1]
+            for doc, value in zip(indices[start:end], data[start:end]):
+                scores[doc] = get(doc, 0.0) + value * weight
+        return scores
+
+    def best(self, text):
+        """
+        得分最高的文档，并列时取编号最小的一个
+
+        Returns:
+            tuple: (文档编号, 得分)，没有任何共同词项时为 (None, 0.0)
+        """
+        if np is None:
+            return self._best_pruned(self._query_vector(text))
+        scores = self.scores(text)
+        if not len(scores):
+            return None, 0.0
+        top = float(scores.max())
+        if top <= 0:
+            return None, 0.0
+        doc = int(np.flatnonzero(scores >= top - TIE_TOLERANCE)[0])
+        return doc, float(scores[doc])
+
+    def _best_pruned(self, vector):
+        """纯 Python 的最高分查找：先累加文档少的词项，再只为候选文档补齐其余词项"""
+        indptr, indices, data = self._indptr, self._indices, self._data
+        terms = sorted(vector, key=lambda item: indptr[item[0] + 1] - indptr[item[0]])
+        # bounds[i]: 第 i 个及之后的词项最多还能贡献的得分
+        bounds = [0.0] * (len(terms) + 1)
+        for position in range(len(terms) - 1, -1, -1):
+            column, weight = terms[position]
+            bounds[position] = bounds[position + 1] + weight * self._column_max[column]
+
+        scores = {}
+        get = scores.get
+        position = 0
+        while position < len(terms):
+            # 未出现过的文档得分不会超过剩余上界，当前最高分已经更高（且不会并列）时不必再整列累加
+            if scores and max(scores.values()) > bounds[position] + TIE_TOLERANCE:
+                break
+            column, weight = terms[position]
+            start, end = indptr[column], indptr[column + 1]
+            for doc, value in zip(indices[start:end], data[start:end]):
+                scores[doc] = get(doc, 0.0) + value * weight
+            position += 1
+
+        remaining = terms[position:]
+        bound = bounds[position]
+        top = 0.0
+        finished = []
+        for doc, score in sorted(scores.items(), key=itemgetter(1), reverse=True):
+            # 之后的文档补齐后也达不到与最高分并列
+            if score + bound < top - TIE_TOLERANCE:
+                break
+            for column, weight in remaining:
+                start, end = indptr[column], indptr[column + 1]
+                index = bisect_left(indices, doc, start, end)
+                if index < end and indices[index] == doc:
+                    score += data[index] * weight
+            finished.append((doc, score))
+            top = max(top, score)
+        if top <= 0:
+            return None, 0.0
+        return min((doc, score) for doc, score in finished if score >= top - TIE_TOLERANCE)
+
+    def save(self, path, digest):
+        """
+        写入索引文件（先写临时文件再替换，写到一半不会留下损坏的文件）
+
+        文件由一行 JSON 头部和紧随其后的定长二进制数组组成，读取时不需要逐项解析。
+
+        Args:
+            path: 索引文件路径
+            digest: 来源数据的摘要，load 时用于判断索引是否过期
+        """
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.__getitem__)
+        arrays = [
+            ('idf', array('f', self._idf)),
+            ('indptr', array('q', [int(value) for value in self._indptr])),
+            ('indices', array('i', [int(value) for value in self._indices])),
+            ('data', array('f', [float(value) for value in self._data])),
+        ]
+        header = {
+            'version': FORMAT_VERSION,
+            'digest': digest,
+            'byteorder': sys.byteorder,
+            'ngram_range': list(self.ngram_range),
+            'doc_count': self.doc_count,
+            'vocabulary': vocabulary,
+            'arrays': [[name, values.typecode, len(values)] for name, values in arrays],
+        }
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            f.write(b'\n')
+            for _, values in arrays:
+                values.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, digest):
+        """
+        读取索引文件
+
+        Returns:
+            TfidfIndex: 文件不存在、格式不符或来源数据已变化时返回 None
+        """
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(_MAGIC)) != _MAGIC:
+                    return None
+                header = json.loads(f.readline())
+                if (header.get('version') != FORMAT_VERSION or header.get('digest') != digest
+                        or header.get('byteorder') != sys.byteorder):
+                    return None
+                arrays = {}
+                for name, typecode, length in header['arrays']:
+                    values = array(typecode)
+                    values.fromfile(f, length)
+                    arrays[name] = values
+        except (OSError, EOFError, ValueError, KeyError):
+            return None
+        return cls(header['vocabulary'], arrays['idf'], arrays['indptr'], arrays['indices'], arrays['data'],
+                   header['doc_count'], header['ngram_range'])